@@ -0,0 +1,66 @@
+# Encode and decode time and size of every control frame tag, pickled and with the compact codec.
+# Run from the repository's root: python -m Benchmarks.Control_Codec [-n ITERATIONS] [--nodes N] [--flows N]
+import argparse
+import random
+import timeit
+
+from OverTheTop.Network.Control_Codec import COMPACT_CODEC, PICKLE_CODEC
+from OverTheTop.Network.Control_Management import COMPACT_LAYOUTS, Control_Frame, Tag, decode_control_frame, \
+    encode_control_frame
+from OverTheTop.Network.Node.Identifiers import new_node_id
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Control frame codec micro-benchmark")
+    parser.add_argument("-n", "--iterations", type=int, default=10000,
+                        help="Encodings and decodings timed per tag and codec (default=10000)")
+    parser.add_argument("--nodes", type=int, default=64,
+                        help="Destinations of the distance vector (default=64)")
+    parser.add_argument("--flows", type=int, default=16,
+                        help="Flows of the flow collection and report (default=16)")
+    return parser.parse_args()
+
+
+# A frame of every tag with a compact layout, sized as in an overlay of the given amount of nodes and flows
+def sample_frames(nodes, flows):
+    node_id = new_node_id()
+    flow_keys = [(random.getrandbits(32), new_node_id()) for _ in range(flows)]
+    figures = {'frames': 9000, 'recovered': 12, 'loss': 0.02, 'delay': 35.5, 'frame_rate': 29.8}
+    samples = {
+        Tag.AUTHENTICATION: (node_id, ('10.0.0.1', 5000), 'node', COMPACT_CODEC, False),
+        Tag.AUTHENTICATION_REQUIRED: None,
+        Tag.DISTANCE_VECTOR: {new_node_id(): random.randint(1, 16) for _ in range(nodes)},
+        Tag.DISTANCE_VECTOR_DELTA: (7, {new_node_id(): random.randint(1, 16) for _ in range(4)}, [new_node_id()]),
+        Tag.DISTANCE_VECTOR_RESYNC: None,
+        Tag.FLOW_COLLECTION: {flow_key: f"movie{index}.Mjpeg" for index, flow_key in enumerate(flow_keys)},
+        Tag.FLOW_ANNOUNCE: (flow_keys[0], "movie0.Mjpeg"),
+        Tag.FLOW_REQUEST: (flow_keys[0], node_id),
+        Tag.FLOW_CANCEL: (flow_keys[0], node_id),
+        Tag.FLOW_WITHDRAW: flow_keys[0],
+        Tag.FLOW_REPORT: {flow_key: dict(figures) for flow_key in flow_keys},
+        Tag.PING_REQUEST: "ping",
+        Tag.PING_RESPONSE: "pong",
+    }
+    return [Control_Frame(tag, samples[tag]) for tag in COMPACT_LAYOUTS]
+
+
+# Returns (size in bytes, µs per encoding, µs per decoding)
+def measure(frame, codec, iterations):
+    data = encode_control_frame(frame, codec)
+    view = memoryview(data)
+    encoding = timeit.timeit(lambda: encode_control_frame(frame, codec), number=iterations)
+    decoding = timeit.timeit(lambda: decode_control_frame(view), number=iterations)
+    return len(data), encoding / iterations * 1e6, decoding / iterations * 1e6
+
+
+def main():
+    args = parse_args()
+    print(f"{'tag':<24}{'codec':<9}{'bytes':>8}{'encode µs':>12}{'decode µs':>12}")
+    for frame in sample_frames(args.nodes, args.flows):
+        for name, codec in (('pickle', PICKLE_CODEC), ('compact', COMPACT_CODEC)):
+            size, encoding, decoding = measure(frame, codec, args.iterations)
+            print(f"{frame.tag().name:<24}{name:<9}{size:>8}{encoding:>12.2f}{decoding:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ import re
 import threading
 
 from OverTheTop import OTT, defaults
+from OverTheTop.Network.Flow_Engines import Flow_Engine
 from UI.UI import UI
 
 
@@ -37,6 +38,22 @@ def parse_args():
                              "with the service's UI")
     parser.add_argument("-nogui", "--nogui", action='store_true',
                         help="Disables UI. As a result flow players can no longer be called.")
+    parser.add_argument("-e", "--engine", type=str, default=None, choices=[e.value for e in Flow_Engine],
+                        help=f"The data plane engine used to relay flows (default={defaults.DEFAULT_FLOW_ENGINE})")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Relays flows with the given amount of data plane processes, sharded by flow "
+                             f"(default={defaults.DEFAULT_DATA_PLANE_WORKERS}, relay within the main process)")
+    parser.add_argument("-b", "--bundle", type=float, default=None, metavar="MS",
+                        help="Coalesces small flow datagrams bound to the same neighbour for up to the given amount "
+                             "of milliseconds (default: disabled)")
+    parser.add_argument("-rw", "--routing-window", type=float, default=None, metavar="MS",
+                        help="Coalesces routing changes for the given amount of milliseconds before sending them to "
+                             f"the neighbours (default={defaults.DEFAULT_ROUTING_UPDATE_WINDOW * 1000:g})")
+    parser.add_argument("-nk", "--nack", type=int, default=None, metavar="KB",
+                        help="Keeps the given amount of kilobytes of recently sent datagrams per neighbour, so lost "
+                             "datagrams are retransmitted when the downstream neighbour NACKs them (default: disabled)")
+    parser.add_argument("-pk", "--pickle", action='store_true',
+                        help="Sends control frames pickled instead of with the compact codec (for debugging)")
 
     return parser.parse_args()
 
@@ -53,7 +70,12 @@ if __name__ == '__main__':
     args = parse_args()
     setup_root_logger(args.debug)
 
-    ott = OTT(bind_address=args.address, bind_port=args.port, name=args.name)
+    ott = OTT(bind_address=args.address, bind_port=args.port, name=args.name, flow_engine=args.engine,
+              data_plane_workers=args.workers,
+              bundle_window=args.bundle / 1000 if args.bundle is not None else None,
+              control_codec=0 if args.pickle else None,
+              routing_window=args.routing_window / 1000 if args.routing_window is not None else None,
+              retransmission_budget=args.nack * 1024 if args.nack is not None else None)
 
     if args.client:
         for arg in args.neighbours:
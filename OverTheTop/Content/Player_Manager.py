@@ -13,6 +13,12 @@ class PlayerInterface:
     def insert_chunk(self, chunk):
         pass
 
+    # Recent frames of the flow (chunks, oldest first), handed over once the player joins the flow. Live chunks may
+    # have been inserted already, the recent frames go ahead of them
+    def preload(self, chunks):
+        for chunk in chunks:
+            self.insert_chunk(chunk)
+
 
 class Player_Handler:
     def __init__(self):
@@ -53,6 +59,15 @@ class Player_Handler:
         finally:
             self.lock.release_read()
 
+    def preload(self, flow_key, chunks):
+        self.lock.acquire_read()
+        try:
+            self.players[flow_key].preload(chunks)
+        except KeyError:
+            pass
+        finally:
+            self.lock.release_read()
+
     def get_flow_id(self, player_id):
         return player_id
 
@@ -1,3 +1,4 @@
+import mmap
 import time
 
 from OverTheTop import defaults
@@ -29,35 +30,41 @@ class Streamer:
     def __init__(self, filename, args=None):
         pass
 
+    # Returns the next chunk (frame_num, payload), the payload may be any bytes-like object but it must never be
+    # modified afterwards since it's sent (and cached) without being copied
     def next_chunk(self):
         pass
 
 
+# The source file is memory mapped, frames are memoryview slices of the mapping, therefore they reach the sockets
+# (scatter/gather sends) without ever being copied
 class MPEG_Streamer(Streamer):
+    LENGTH_SIZE = 5  # Every frame is preceded by its length, 5 ASCII digits
 
     def __init__(self, filename, framerate=None):
         super().__init__(filename)
         self.__framerate = framerate or defaults.DEFAULT_FRAME_RATE_SEC
         self.__filename = filename
         try:
-            self.__file = open(filename, 'rb')
-        except:
-            raise IOError
+            with open(filename, 'rb') as file:
+                self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:  # Empty files can't be mapped
+            raise IOError(f"Can't map {filename}") from e
+        self.__view = memoryview(self.__map)
+        self.__offset = 0
         self.__time_wait = 1.0 / self.__framerate
         self.frameNum = 0
 
     def next_chunk(self):
         """Get next frame."""
-        data = self.__file.read(5)  # Get the framelength from the first 5 bits
-        if data is None or data == b'':
-            self.__file.seek(0)
-            data = self.__file.read(5)
+        if self.__offset >= len(self.__map):
+            self.__offset = 0
             self.frameNum = 0
-            if data is None or data == b'':
-                raise IOError
-        frame_length = int(data)
-        # Read the current frame
-        data = self.__file.read(frame_length)
+        start = self.__offset + MPEG_Streamer.LENGTH_SIZE
+        frame_length = int(self.__map[self.__offset:start])
+        # The current frame, as a view of the mapping
+        data = self.__view[start:start + frame_length]
+        self.__offset = start + frame_length
         self.frameNum += 1
         time.sleep(self.__time_wait)
 
@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import queue
+import socket
+import threading as thr
+
+from OverTheTop import defaults as c
+from OverTheTop.Network.Bundling import Bundle, is_bundle, unbundle
+from OverTheTop.Network.Flow_Packet import FLAG_THINNED, Flow_Packet, InvalidPacket
+from OverTheTop.Network.Fragmentation import Fragmenter
+from OverTheTop.Network.Retransmission import Retransmission_Cache, nack_datagram
+from Utils import socket_extra
+
+
+# Counters of an output (next hop) of the asyncio engine
+class Output_Stats:
+    __slots__ = ('dropped', 'bundles', 'bundled')
+
+    def __init__(self):
+        self.dropped = 0
+        self.bundles = 0
+        self.bundled = 0
+
+
+class Flow_Protocol(asyncio.DatagramProtocol):
+
+    def __init__(self, handler):
+        self.__handler = handler
+
+    def datagram_received(self, data, addr):
+        self.__handler.dispatch(data)
+
+    def error_received(self, exc):
+        logging.debug(f"Flow socket error: {exc}")
+
+
+# Data plane engine built on a single asyncio event loop.
+# Datagrams are received, handed to the registered processor (route lookup + forwarding) and sent from the loop's
+# thread, without any cross-thread handoff. Sends issued from other threads (ex: streamers) are scheduled on the loop.
+# If no processor is registered, received packets are queued and can be fetched with receive(), like the threaded
+# engine.
+# If a bundle window is given, small unfragmented datagrams are coalesced per next hop into bundles (see Bundling),
+# flushed by the loop once they fill the MTU or once the window expires. Bundles only carry a single flow if the next
+# hop is sharded.
+class Async_Flow_Handler:
+    inline_processing = True
+
+    def __init__(self, address=None, port=c.DEFAULT_PORT, packet_size=c.DEFAULT_PACKET_SIZE,
+                 buffer_size=c.DEFAULT_FRAME_BUFFER_SIZE, reuse_port=False, mtu=c.DEFAULT_MTU,
+                 bundle_window=c.DEFAULT_BUNDLE_WINDOW, bundle_threshold=c.DEFAULT_BUNDLE_THRESHOLD,
+                 retransmission_budget=c.DEFAULT_RETRANSMISSION_BUDGET, **_):
+        if type(address) is tuple:
+            pass
+        elif address is None:
+            address = (socket.gethostbyname(socket.gethostname()), port)
+        else:
+            address = (address, port)
+
+        self.__packet_size = packet_size
+        self.__fragmenter = Fragmenter(mtu)
+        self.__sent = Retransmission_Cache(retransmission_budget)
+        self.__mtu = mtu
+        self.__bundle_window = bundle_window
+        self.__bundle_threshold = bundle_threshold if bundle_window is not None else -1
+        self.__bundles = {}  # address => Bundle, only touched by the loop's thread
+        self.__closed = set()  # Addresses whose output was closed (see close_output)
+        self.__sharded = set()  # Addresses of the sharded next hops, bundles bound to them carry a single flow
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            socket_extra.reuse_port(self.__sock)
+        self.__sock.bind(address)
+        self.__whatever = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__whatever.setblocking(False)
+        self.__loop = asyncio.new_event_loop()
+        self.__loop_thread = None
+        self.__transport = None
+        self.__processor = None
+        self.__in_buff = queue.Queue(buffer_size)  # (packet, size) pairs
+        self.__in_bytes = 0
+        self.__in_high_water = 0
+        self.__in_lock = thr.Lock()  # Serializes the input counters, updated by the loop and by receive()
+        self.__stop_event = thr.Event()
+        self.__dropped_in = 0
+        self.__outputs = {}  # address => Output_Stats, of the addresses datagrams were sent to
+
+    def __str__(self):
+        return str(self.__dict__)
+
+    # Private Methods
+
+    def __in_loop(self):
+        return thr.get_ident() == self.__loop_thread
+
+    def __output(self, address):
+        output = self.__outputs.get(address)
+        if output is None:
+            output = self.__outputs[address] = Output_Stats()
+        return output
+
+    def __sendmsg(self, parts, address):
+        try:
+            self.__whatever.sendmsg(parts, (), 0, address)
+        except BlockingIOError:
+            # The kernel buffer is full, a late frame is worthless therefore it's dropped instead of queued
+            self.__output(address).dropped += 1
+        except OSError:
+            if not self.__stop_event.is_set():
+                logging.debug(f"Unable to send flow packet to {address}", exc_info=True)
+
+    # datagrams: {address: [parts]}, the parts of each datagram are gathered by sendmsg
+    # Single (unfragmented) small datagrams are bundled, any other datagram flushes its address' bundle first so the
+    # datagrams of a flow are sent in order
+    def __send(self, datagrams, owner=None, single=False):
+        for address, packets in datagrams.items():
+            if address in self.__closed:
+                continue
+            if address not in self.__outputs:
+                self.__outputs[address] = Output_Stats()
+            bundle = self.__bundles.get(address)
+            for parts in packets:
+                size = sum(len(part) for part in parts) if single else None
+                if single and size <= self.__bundle_threshold:
+                    if bundle is None:
+                        bundle = self.__bundles[address] = Bundle(self.__mtu)
+                    elif bundle and not bundle.fits(parts, size, address in self.__sharded):
+                        self.__flush(address)
+                    if not bundle:
+                        self.__loop.call_later(self.__bundle_window, self.__expire, address)
+                    bundle.add(parts, size, self.__bundle_window, owner.retain() if owner else None)
+                    continue
+                if bundle:
+                    self.__flush(address)
+                self.__sendmsg(parts, address)
+
+    def __flush(self, address):
+        bundle = self.__bundles.get(address)
+        if bundle:
+            try:
+                self.__sendmsg(bundle.parts(), address)
+                if len(bundle) > 1:
+                    output = self.__output(address)
+                    output.bundles += 1
+                    output.bundled += len(bundle)
+            finally:
+                bundle.discard()
+
+    # Bundles are only touched by the loop's thread
+    def __discard(self, address):
+        bundle = self.__bundles.pop(address, None)
+        if bundle:
+            bundle.discard()
+
+    # Window timer of an address' bundle, the bundle may have been flushed (and refilled) in the meantime
+    def __expire(self, address):
+        bundle = self.__bundles.get(address)
+        if not bundle:
+            return
+        if bundle.expired(self.__loop.time()):
+            self.__flush(address)
+        else:
+            self.__loop.call_at(bundle.deadline, self.__expire, address)
+
+    # Public Methods
+
+    @property
+    def interface(self):
+        return self.__sock.getsockname()
+
+    def set_processor(self, processor):
+        self.__processor = processor
+
+    # Datagrams are sent as soon as they are processed, there's no output queue to schedule
+    def set_flow_weight(self, flow_key, weight):
+        pass
+
+    def set_flow_parity(self, flow_key, group):
+        self.__fragmenter.set_parity(flow_key, group)
+
+    def flow_parity(self, flow_key):
+        return self.__fragmenter.parity(flow_key)
+
+    def forget_flow(self, flow_key):
+        self.__fragmenter.forget(flow_key)
+
+    # sharded: the flow port of address is sharded among data plane workers (see Bundling)
+    def open_output(self, address, sharded=False):
+        self.__closed.discard(address)
+        if sharded:
+            self.__sharded.add(address)
+        else:
+            self.__sharded.discard(address)
+
+    # Datagrams sent to address later on (ex: by forwarding decisions made before) are discarded until its output is
+    # opened again
+    def close_output(self, address):
+        self.__closed.add(address)
+        self.__sharded.discard(address)
+        self.__outputs.pop(address, None)
+        self.__sent.forget(address)
+        if self.__in_loop():
+            self.__discard(address)
+            return
+        try:
+            self.__loop.call_soon_threadsafe(self.__discard, address)
+        except RuntimeError:  # Loop already closed
+            pass
+
+    # Same layout as the threaded engine's (see Flow_Handler.queue_stats), datagrams are sent as soon as they are
+    # processed therefore outputs never queue anything
+    def queue_stats(self):
+        return {'input': {'length': self.__in_buff.qsize(), 'capacity': self.__in_buff.maxsize,
+                          'bytes': self.__in_bytes, 'high_water': self.__in_high_water, 'dropped': self.__dropped_in},
+                'output': {address: {'length': 0, 'bytes': 0, 'high_water': 0, 'dropped': output.dropped, 'flows': {},
+                                     'bundles': output.bundles, 'bundled': output.bundled}
+                           for address, output in list(self.__outputs.items())}}
+
+    def send(self, flow_key, chunk, routes, owner=None):
+        datagrams = self.__fragmenter.datagrams(flow_key, chunk, routes)
+        for address, packets in datagrams.items():
+            for parts in packets:
+                self.__sent.add(flow_key, parts, (address,), owner is not None)
+        self.__dispatch_send(datagrams, owner, all(len(packets) == 1 for packets in datagrams.values()))
+        return datagrams
+
+    def relay(self, packet: Flow_Packet, hop_field, addresses, flagged=()):
+        datagrams = (packet.relay_parts(hop_field),)
+        self.__sent.add(packet.flow_key, datagrams[0], addresses)
+        routes = {address: datagrams for address in addresses}
+        for address in flagged:
+            routes[address] = (packet.relay_parts(hop_field, FLAG_THINNED),)
+        self.__dispatch_send(routes, packet.owner, not packet.fragmented)
+
+    def retransmit(self, flow_key, address, first, count):
+        return self.replay(flow_key, address, self.__sent.get(flow_key, address, first, count))
+
+    def replay(self, flow_key, address, datagrams):
+        if datagrams:
+            self.__dispatch_send({address: list(datagrams)}, None, False)
+        return len(datagrams)
+
+    def request_retransmission(self, flow_key, address, hop, first, count):
+        if self.__sent.enabled:
+            self.__dispatch_send({address: [(nack_datagram(flow_key, hop, first, count),)]}, None, True)
+
+    # Sends issued once the engine is terminated are discarded
+    def __dispatch_send(self, datagrams, owner, single):
+        if self.__in_loop():
+            self.__send(datagrams, owner, single)
+        elif not self.__stop_event.is_set():
+            # The payload must outlive the call, pooled payloads are pinned until the loop has sent them
+            if owner:
+                owner.retain()
+            try:
+                self.__loop.call_soon_threadsafe(self.__send_and_release, datagrams, owner, single)
+            except RuntimeError:  # Loop closed meanwhile
+                if owner:
+                    owner.release()
+
+    def __send_and_release(self, datagrams, owner, single):
+        try:
+            self.__send(datagrams, owner, single)
+        finally:
+            if owner:
+                owner.release()
+
+    def receive(self) -> Flow_Packet:
+        entry = None
+        if not self.__stop_event.is_set():
+            entry = self.__in_buff.get()
+        if entry is None:
+            raise ConnectionError
+        packet, size = entry
+        self.__in_lock.acquire()
+        try:
+            self.__in_bytes -= size
+        finally:
+            self.__in_lock.release()
+        return packet
+
+    @staticmethod
+    def release(packet: Flow_Packet):
+        if packet.owner:
+            packet.owner.release()
+
+    # Called by the protocol for every datagram, in the loop's thread, bundles are split in their datagrams
+    def dispatch(self, data):
+        if is_bundle(data):
+            try:
+                datagrams = unbundle(memoryview(data))
+            except InvalidPacket:
+                logging.debug("Discarded malformed flow bundle", exc_info=True)
+                return
+            for datagram in datagrams:
+                self.__dispatch(datagram)
+        else:
+            self.__dispatch(data)
+
+    def __dispatch(self, data):
+        try:
+            packet = Flow_Packet.unpack(data)
+        except InvalidPacket:
+            logging.debug("Discarded malformed flow packet", exc_info=True)
+            return
+        if self.__processor:
+            try:
+                self.__processor(packet)
+            except Exception:
+                logging.exception("Exception on flow processor")
+        else:
+            try:
+                self.__in_buff.put_nowait((packet, len(data)))
+            except queue.Full:
+                self.__dropped_in += 1
+                return
+            self.__in_lock.acquire()
+            try:
+                self.__in_bytes += len(data)
+                self.__in_high_water = max(self.__in_high_water, self.__in_buff.qsize())
+            finally:
+                self.__in_lock.release()
+
+    # Runnables and Worker Management
+
+    def terminate(self):
+        self.__stop_event.set()
+        try:
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+        except RuntimeError:  # Loop already closed
+            pass
+        try:
+            self.__in_buff.put_nowait(None)
+        except queue.Full:
+            pass
+        self.__sock.close()
+        self.__whatever.close()
+
+    def reset(self):
+        self.__stop_event.clear()
+
+    def run(self):
+        try:
+            logging.debug("Flow event loop Launched")
+            self.__loop_thread = thr.get_ident()
+            asyncio.set_event_loop(self.__loop)
+            self.__transport, _ = self.__loop.run_until_complete(
+                self.__loop.create_datagram_endpoint(lambda: Flow_Protocol(self), sock=self.__sock))
+            if not self.__stop_event.is_set():
+                self.__loop.run_forever()
+            logging.debug("Flow event loop Death")
+        except Exception:
+            if not self.__stop_event.is_set():
+                logging.exception("Exception on flow event loop")
+            else:
+                logging.debug("Flow event loop Death")
+        finally:
+            if self.__transport:
+                self.__transport.close()
+            self.__loop.close()
+
+    # The event loop both dispatches and forwards
+    dispatcher = run
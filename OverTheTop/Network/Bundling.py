@@ -0,0 +1,93 @@
+import struct
+import time
+
+from OverTheTop import defaults as c
+from OverTheTop.Network.Flow_Packet import FLAG_BUNDLE, FLOW_PACKET_VERSION, InvalidPacket
+
+# A bundle carries several flow datagrams bound to the same next hop in a single UDP datagram:
+#   version:B | flags:B (FLAG_BUNDLE) | flow_hash:I | (length:H | flow datagram)*
+# The header's flow hash is the one of the bundle's first datagram. Bundles bound to a node whose flow port is sharded
+# among data plane workers (by flow hash, see Data_Plane) only carry datagrams of that flow hash, therefore they are
+# spread as their datagrams would be (fragmented datagrams are never bundled, every fragment of a frame keeps reaching
+# the same worker). Bundles bound to other nodes carry the datagrams of any flow.
+BUNDLE_HEADER = struct.Struct('!BBI')
+BUNDLE_ENTRY = struct.Struct('!H')
+HASH_SLICE = slice(2, 6)  # Flow hash of a flow datagram (see Flow_Packet.FLOW_HASH_OFFSET)
+
+
+def is_bundle(view) -> bool:
+    return len(view) >= BUNDLE_HEADER.size and view[0] == FLOW_PACKET_VERSION and view[1] & FLAG_BUNDLE
+
+
+# Returns the flow datagrams of a bundle (slices of view), the whole bundle is validated before anything is returned
+def unbundle(view):
+    datagrams = []
+    offset, end = BUNDLE_HEADER.size, len(view)
+    while offset < end:
+        try:
+            (length,) = BUNDLE_ENTRY.unpack_from(view, offset)
+        except struct.error:
+            raise InvalidPacket("Truncated flow bundle")
+        offset += BUNDLE_ENTRY.size
+        if offset + length > end:
+            raise InvalidPacket("Truncated flow bundle")
+        datagrams.append(view[offset:offset + length])
+        offset += length
+    return datagrams
+
+
+# Small flow datagrams (each a sequence of buffers) waiting to be sent together to a single next hop.
+# The bundle is sent once it's full (limit bytes, the MTU) or once its deadline (the coalescing window after its first
+# datagram) expires, whichever comes first. A bundle of a single datagram is sent as a plain datagram.
+# A datagram of another flow hash than the bundle's doesn't fit a single flow bundle, the bundle must be sent first.
+# The owners of the datagrams (see Packet_Buffer) are held until the bundle is sent or discarded.
+class Bundle:
+    __slots__ = ('limit', 'buffers', 'first', 'flow_hash', 'size', 'count', 'owners', 'deadline')
+
+    def __init__(self, limit=c.DEFAULT_MTU):
+        self.limit = limit
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def reset(self):
+        self.buffers = [None]
+        self.first = None
+        self.flow_hash = None
+        self.size = BUNDLE_HEADER.size
+        self.count = 0
+        self.owners = []
+        self.deadline = None
+
+    # parts: the buffers of a flow datagram, its header is in the first one
+    def fits(self, parts, size, single_flow=False):
+        return self.size + BUNDLE_ENTRY.size + size <= self.limit and \
+            (not single_flow or self.count == 0 or parts[0][HASH_SLICE] == self.flow_hash)
+
+    def expired(self, now=None):
+        return self.count > 0 and (now or time.monotonic()) >= self.deadline
+
+    # The owner's reference is handed over to the bundle
+    def add(self, parts, size, window, owner=None):
+        if self.count == 0:
+            self.first = parts
+            self.flow_hash = bytes(parts[0][HASH_SLICE])
+            self.buffers[0] = BUNDLE_HEADER.pack(FLOW_PACKET_VERSION, FLAG_BUNDLE,
+                                                 int.from_bytes(self.flow_hash, 'big'))
+            self.deadline = time.monotonic() + window
+        self.buffers.append(BUNDLE_ENTRY.pack(size))
+        self.buffers.extend(parts)
+        self.size += BUNDLE_ENTRY.size + size
+        self.count += 1
+        if owner:
+            self.owners.append(owner)
+
+    # Buffers of the datagram to send, to be gathered by sendmsg
+    def parts(self):
+        return self.first if self.count == 1 else self.buffers
+
+    def discard(self):
+        for owner in self.owners:
+            owner.release()
+        self.reset()
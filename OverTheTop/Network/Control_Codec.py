@@ -0,0 +1,246 @@
+import struct
+from functools import lru_cache
+
+# Codec versions, negotiated per connection during the authentication (the highest one both ends support)
+PICKLE_CODEC = 0
+COMPACT_CODEC = 1
+CONTROL_CODEC_VERSION = COMPACT_CODEC
+
+# Pickled frames (protocol 2+) start with the PROTO opcode, compact ones with their codec version, therefore every
+# frame is decoded on its own whatever the codec its sender uses
+PICKLE_PROTO = 0x80
+
+FRAME_HEADER = struct.Struct('!BH')  # codec version, tag
+COUNT = struct.Struct('!I')
+SEQUENCE = struct.Struct('!I')
+LENGTH = struct.Struct('!H')
+NODE_ID = struct.Struct('!Q')
+FLOW_KEY = struct.Struct('!IQ')
+FLOW_REQUEST = struct.Struct('!IQQ')
+PORT = struct.Struct('!H')
+CODEC_VERSION = struct.Struct('!B')
+SHARDED = struct.Struct('!?')
+FLOW_FIGURES = 'IQIIfff'  # flow_key, frames, recovered, loss, delay, frame_rate
+NO_STRING = 0xFFFF
+# Formats of the costs of a distance vector, from the narrowest one, integer formats reject real costs
+COST_FORMATS = 'BHIqd'
+
+
+class InvalidControlFrame(ValueError):
+    pass
+
+
+# Layout of count consecutive fields (ex: every destination of a distance vector), packed by a single call
+@lru_cache(maxsize=256)
+def repeated(fields, count) -> struct.Struct:
+    return struct.Struct('!' + fields * count)
+
+
+# Reads the fields of a compact frame in order
+class Field_Reader:
+    __slots__ = ('view', 'offset')
+
+    def __init__(self, view, offset=0):
+        self.view = view
+        self.offset = offset
+
+    def unpack(self, layout: struct.Struct):
+        fields = layout.unpack_from(self.view, self.offset)
+        self.offset += layout.size
+        return fields
+
+    # Reads count consecutive fields, count comes from the frame, hence it's checked against the bytes left before
+    # its layout is built
+    def repeated(self, fields, count):
+        if struct.calcsize('!' + fields) * count > len(self.view) - self.offset:
+            raise InvalidControlFrame(f"Truncated frame, {count} entries announced")
+        return self.unpack(repeated(fields, count))
+
+    def string(self):
+        (length,) = self.unpack(LENGTH)
+        if length == NO_STRING:
+            return None
+        end = self.offset + length
+        if end > len(self.view):
+            raise InvalidControlFrame("Truncated string")
+        value = str(self.view[self.offset:end], 'utf-8')
+        self.offset = end
+        return value
+
+    def end(self):
+        if self.offset != len(self.view):
+            raise InvalidControlFrame(f"{len(self.view) - self.offset} trailing bytes")
+
+
+def pack_string(value) -> bytes:
+    if value is None:
+        return LENGTH.pack(NO_STRING)
+    data = value.encode('utf-8')
+    if len(data) >= NO_STRING:
+        raise InvalidControlFrame("String too long for a control frame")
+    return LENGTH.pack(len(data)) + data
+
+
+# Tag specific fields (see COMPACT_LAYOUTS in Control_Management). Every encoder returns the fields of a frame's data
+# as a list of buffers, every decoder reads them back from a Field_Reader.
+
+def encode_nothing(_):
+    return []
+
+
+def decode_nothing(_):
+    return None
+
+
+# (node_id, flow_interface (host, port) or None, name or None, codec version, sharded), the version and whether the
+# node's flow port is sharded (see Data_Plane) may be left out, from the last one
+def encode_authentication(data):
+    node_id, interface, name, *extra = data
+    fields = [NODE_ID.pack(node_id)]
+    if interface is None:
+        fields.append(pack_string(None))
+    else:
+        fields += [pack_string(interface[0]), PORT.pack(interface[1])]
+    fields.append(pack_string(name))
+    if extra:
+        fields.append(CODEC_VERSION.pack(extra[0]))
+    if len(extra) > 1:
+        fields.append(SHARDED.pack(extra[1]))
+    return fields
+
+
+def decode_authentication(reader: Field_Reader):
+    (node_id,) = reader.unpack(NODE_ID)
+    host = reader.string()
+    interface = (host, reader.unpack(PORT)[0]) if host is not None else None
+    name = reader.string()
+    (version,) = reader.unpack(CODEC_VERSION) if reader.offset < len(reader.view) else (PICKLE_CODEC,)
+    (sharded,) = reader.unpack(SHARDED) if reader.offset < len(reader.view) else (False,)
+    return node_id, interface, name, version, sharded
+
+
+# Ping payload: a string or None
+def encode_ping(payload):
+    if payload is not None and not isinstance(payload, str):
+        raise InvalidControlFrame(f"Unsupported ping payload {type(payload).__name__}")
+    return [pack_string(payload)]
+
+
+def decode_ping(reader: Field_Reader):
+    return reader.string()
+
+
+# {destination: cost}: the destinations then the costs, all of them in the narrowest format that fits them
+def encode_distance_vector(vector):
+    count = len(vector)
+    for cost_format in COST_FORMATS:
+        try:
+            costs = repeated(cost_format, count).pack(*vector.values())
+            break
+        except struct.error:
+            continue
+    else:
+        raise InvalidControlFrame("Distance vector costs aren't numbers")
+    return [COUNT.pack(count), cost_format.encode(), repeated('Q', count).pack(*vector), costs]
+
+
+def decode_distance_vector(reader: Field_Reader):
+    (count,) = reader.unpack(COUNT)
+    if reader.offset >= len(reader.view):
+        raise InvalidControlFrame("Truncated distance vector")
+    cost_format = chr(reader.view[reader.offset])
+    reader.offset += 1
+    if cost_format not in COST_FORMATS:
+        raise InvalidControlFrame(f"Unknown cost format {cost_format}")
+    destinations = reader.repeated('Q', count)
+    return dict(zip(destinations, reader.repeated(cost_format, count)))
+
+
+# (sequence, {destination: cost} changed, [destination] withdrawn): the sequence, the changed entries as a distance
+# vector, then the withdrawn destinations
+def encode_distance_vector_delta(delta):
+    sequence, changed, withdrawn = delta
+    return ([SEQUENCE.pack(sequence)] + encode_distance_vector(changed) +
+            [COUNT.pack(len(withdrawn)), repeated('Q', len(withdrawn)).pack(*withdrawn)])
+
+
+def decode_distance_vector_delta(reader: Field_Reader):
+    (sequence,) = reader.unpack(SEQUENCE)
+    changed = decode_distance_vector(reader)
+    (count,) = reader.unpack(COUNT)
+    return sequence, changed, list(reader.repeated('Q', count))
+
+
+# {flow_key: name}: the flow keys, whether each flow has a name, then the names (NUL separated)
+def encode_flow_collection(collection):
+    count = len(collection)
+    names = [name for name in collection.values() if name is not None]
+    if any('\0' in name for name in names):
+        raise InvalidControlFrame("Flow names can't hold NUL characters")
+    keys = [field for flow_key in collection for field in flow_key]
+    return [COUNT.pack(count), repeated('IQ', count).pack(*keys),
+            repeated('?', count).pack(*(name is not None for name in collection.values())),
+            '\0'.join(names).encode('utf-8')]
+
+
+def decode_flow_collection(reader: Field_Reader):
+    (count,) = reader.unpack(COUNT)
+    keys = reader.repeated('IQ', count)
+    named = reader.repeated('?', count)
+    names = str(reader.view[reader.offset:], 'utf-8').split('\0') if any(named) else []
+    reader.offset = len(reader.view)
+    if len(names) != sum(named):
+        raise InvalidControlFrame("Flow names don't match the flows")
+    if len(names) != count:
+        names = iter(names)
+        names = [next(names) if has_name else None for has_name in named]
+    return dict(zip(zip(keys[::2], keys[1::2]), names))
+
+
+# (flow_key, name)
+def encode_flow_announce(announcement):
+    flow_key, name = announcement
+    return [FLOW_KEY.pack(*flow_key), pack_string(name)]
+
+
+def decode_flow_announce(reader: Field_Reader):
+    return reader.unpack(FLOW_KEY), reader.string()
+
+
+# (flow_key, destination), flow requests and cancels
+def encode_flow_request(request):
+    (flow_id, origin), destination = request
+    return [FLOW_REQUEST.pack(flow_id, origin, destination)]
+
+
+def decode_flow_request(reader: Field_Reader):
+    flow_id, origin, destination = reader.unpack(FLOW_REQUEST)
+    return (flow_id, origin), destination
+
+
+def encode_flow_key(flow_key):
+    return [FLOW_KEY.pack(*flow_key)]
+
+
+def decode_flow_key(reader: Field_Reader):
+    return reader.unpack(FLOW_KEY)
+
+
+# {flow_key: {'frames', 'recovered', 'loss', 'delay', 'frame_rate'}}, see Branch_Thinning.report
+def encode_flow_report(report):
+    fields = []
+    for (flow_id, origin), figures in report.items():
+        fields += (flow_id, origin, figures['frames'], figures['recovered'], figures['loss'], figures['delay'],
+                   figures['frame_rate'])
+    return [COUNT.pack(len(report)), repeated(FLOW_FIGURES, len(report)).pack(*fields)]
+
+
+def decode_flow_report(reader: Field_Reader):
+    (count,) = reader.unpack(COUNT)
+    fields = reader.repeated(FLOW_FIGURES, count)
+    width = len(FLOW_FIGURES)
+    return {(fields[index], fields[index + 1]): {'frames': fields[index + 2], 'recovered': fields[index + 3],
+                                                 'loss': fields[index + 4], 'delay': fields[index + 5],
+                                                 'frame_rate': fields[index + 6]}
+            for index in range(0, len(fields), width)}
+
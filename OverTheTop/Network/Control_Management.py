@@ -1,24 +1,43 @@
 import logging
 import pickle
 import socket
-from enum import Enum
+import struct
+import threading
+from collections import deque
+from enum import Enum, IntEnum
 
 from OverTheTop import defaults as c
+from OverTheTop.Network.Control_Codec import COMPACT_CODEC, CONTROL_CODEC_VERSION, FRAME_HEADER, PICKLE_CODEC, \
+    PICKLE_PROTO, Field_Reader, InvalidControlFrame, decode_authentication, decode_distance_vector, \
+    decode_distance_vector_delta, decode_flow_announce, decode_flow_collection, decode_flow_key, decode_flow_report, \
+    decode_flow_request, decode_nothing, decode_ping, encode_authentication, encode_distance_vector, \
+    encode_distance_vector_delta, encode_flow_announce, encode_flow_collection, encode_flow_key, encode_flow_report, \
+    encode_flow_request, encode_nothing, encode_ping
 
 
 class Tag(Enum):
     AUTHENTICATION = 0
     AUTHENTICATION_REQUIRED = 10
     DISTANCE_VECTOR = 100
+    DISTANCE_VECTOR_DELTA = 110
+    DISTANCE_VECTOR_RESYNC = 120
     FLOW_COLLECTION = 210
     FLOW_ANNOUNCE = 220
     FLOW_REQUEST = 230
     FLOW_CANCEL = 240
     FLOW_WITHDRAW = 250
+    FLOW_REPORT = 260
     PING_REQUEST = 300
     PING_RESPONSE = 310
 
 
+# Outbound control frames of a higher priority (lower value) are sent first
+class Priority(IntEnum):
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
 class Control_Frame:
     def __init__(self, tag, data):
         self.__tag = tag
@@ -34,16 +53,118 @@ class Control_Frame:
         return self.__tag, self.__data
 
 
+# Tag => (encoder, decoder) of the compact codec (see Control_Codec), every tag has one
+COMPACT_LAYOUTS = {
+    Tag.AUTHENTICATION: (encode_authentication, decode_authentication),
+    Tag.AUTHENTICATION_REQUIRED: (encode_nothing, decode_nothing),
+    Tag.DISTANCE_VECTOR: (encode_distance_vector, decode_distance_vector),
+    Tag.DISTANCE_VECTOR_DELTA: (encode_distance_vector_delta, decode_distance_vector_delta),
+    Tag.DISTANCE_VECTOR_RESYNC: (encode_nothing, decode_nothing),
+    Tag.FLOW_COLLECTION: (encode_flow_collection, decode_flow_collection),
+    Tag.FLOW_ANNOUNCE: (encode_flow_announce, decode_flow_announce),
+    Tag.FLOW_REQUEST: (encode_flow_request, decode_flow_request),
+    Tag.FLOW_CANCEL: (encode_flow_request, decode_flow_request),
+    Tag.FLOW_WITHDRAW: (encode_flow_key, decode_flow_key),
+    Tag.FLOW_REPORT: (encode_flow_report, decode_flow_report),
+    Tag.PING_REQUEST: (encode_ping, decode_ping),
+    Tag.PING_RESPONSE: (encode_ping, decode_ping),
+}
+
+
+TAGS = {tag.value: tag for tag in Tag}
+
+# Tag => Priority of its frames, flow (un)subscriptions are latency sensitive while reports are periodic (the oldest
+# pending ones are dropped when a connection's queue is full), the other frames are of NORMAL priority.
+# Frames that must be applied in order share their priority: requests and cancels, flow announces, collections and
+# withdraws (a withdraw overtaking a pending announce of its flow would leave the peer with the flow)
+PRIORITIES = {
+    Tag.FLOW_REQUEST: Priority.HIGH,
+    Tag.FLOW_CANCEL: Priority.HIGH,
+    Tag.FLOW_REPORT: Priority.LOW,
+}
+
+
+# Compact frames: codec version:B | tag:H | the tag's fields
+def encode_control_frame(frame: Control_Frame, codec=PICKLE_CODEC) -> bytes:
+    layout = COMPACT_LAYOUTS.get(frame.tag()) if codec >= COMPACT_CODEC else None
+    if layout is None:
+        return pickle.dumps(frame)
+    encoder, _ = layout
+    return b''.join([FRAME_HEADER.pack(COMPACT_CODEC, frame.tag().value)] + encoder(frame.data()))
+
+
+# Frames of either codec are decoded, unless codec (the one the sender is known to use) is compact: pickled frames are
+# rejected from then on, a peer that negotiated the compact codec has no reason to send any
+def decode_control_frame(buffer, codec=PICKLE_CODEC) -> Control_Frame:
+    if not len(buffer):
+        raise InvalidControlFrame("Empty control frame")
+    if buffer[0] == PICKLE_PROTO:
+        if codec >= COMPACT_CODEC:
+            raise InvalidControlFrame("Pickled control frame on a compact connection")
+        try:
+            return pickle.loads(buffer)
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError, ImportError, IndexError,
+                KeyError) as e:
+            raise InvalidControlFrame(f"Malformed pickled control frame: {e!r}")
+    try:
+        version, tag = FRAME_HEADER.unpack_from(buffer)
+        if version != COMPACT_CODEC:
+            raise InvalidControlFrame(f"Unsupported control codec {version}")
+        tag = TAGS[tag]
+        reader = Field_Reader(buffer, FRAME_HEADER.size)
+        _, decoder = COMPACT_LAYOUTS[tag]
+        data = decoder(reader)
+        reader.end()
+    except InvalidControlFrame:
+        raise
+    except (struct.error, ValueError, KeyError) as e:
+        raise InvalidControlFrame(f"Malformed control frame: {e}")
+    return Control_Frame(tag, data)
+
+
+# Framed (length prefixed) pickled objects over a TCP connection.
+# Reads go through a reusable receive buffer (recv_into), every read parses as many complete frames as it buffered and
+# frames are unpickled in place. Frames are written whole by a single sendall, several frames may share a single
+# write (see send_many), and writers are serialized so frames sent by different threads never interleave.
+# Nagle's algorithm is disabled, control frames are small and latency sensitive.
+# Frames are pickled until both ends agree on a compact codec (see set_codec), received frames of either codec are
+# decoded until the peer's first compact frame comes in (frames are received in order, the peer sends nothing but
+# compact frames from then on), pickled frames are rejected afterwards.
+# Frames may also be posted to a bounded outbound queue (see post), drained by the connection's own writer thread, so
+# posting never blocks on the peer. Once the queue is full the oldest LOW priority frame is dropped, and if there are
+# none the peer is deemed stalled and the connection is terminated (its reader then fails as on any connection error).
 class Control_Connection:
 
-    def __init__(self, sock, address=None, name=None, flow_interface=None):
+    def __init__(self, sock, address=None, name=None, flow_interface=None, buffer_size=c.DEFAULT_CONTROL_BUFFER_SIZE,
+                 queue_size=c.DEFAULT_CONTROL_QUEUE_SIZE, batch=c.DEFAULT_IO_BATCH_SIZE):
         self.__sock = sock
         self.__name = name
         if address is None:
-            self.__sock = sock.getsockname()
+            self.__address = sock.getpeername()
         else:
             self.__address = address
         self.__flow_interface = flow_interface
+        self.__sharded = False
+        self.__send_lock = threading.Lock()
+        self.__buffer = bytearray(buffer_size)
+        self.__start = 0  # First unparsed byte of the buffer
+        self.__end = 0  # End of the received bytes
+        self.__frames = deque()  # Parsed frames, not yet received
+        self.__codec = PICKLE_CODEC
+        self.__peer_codec = PICKLE_CODEC  # Codec the peer is known to send with
+        # Outbound queue, entries are [frame, key] so pending keyed frames may be replaced in place
+        self.__queues = tuple(deque() for _ in Priority)
+        self.__keyed = {}  # key => pending entry
+        self.__pending = 0
+        self.__queue_size = queue_size
+        self.__batch = batch
+        self.__queue_lock = threading.Condition()
+        self.__writer = None
+        self.__closed = False
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
 
     def __str__(self):
         return f"<Control_Connection name: {self.__name} sock:{self.__sock}/>"
@@ -58,18 +179,38 @@ class Control_Connection:
     def get_address(self):
         return self.__address
 
-    def set_flow_interface(self, interface):
+    # sharded: the peer's flow port is sharded among data plane workers
+    def set_flow_interface(self, interface, sharded=False):
         self.__flow_interface = interface
+        self.__sharded = sharded
 
     def get_interface(self):
         return self.__flow_interface
 
+    @property
+    def sharded(self):
+        return self.__sharded
+
+    # Codec of the frames sent from now on, the one negotiated during the authentication
+    def set_codec(self, codec):
+        self.__codec = codec
+
+    @property
+    def codec(self):
+        return self.__codec
+
     def terminate(self):
+        self.__queue_lock.acquire()
+        try:
+            self.__closed = True
+            self.__queue_lock.notify_all()
+        finally:
+            self.__queue_lock.release()
         try:
             self.__sock.shutdown(socket.SHUT_RDWR)
             self.__sock.close()
             self.__sock = None
-        except socket.error:
+        except (socket.error, AttributeError):  # Already terminated
             pass
 
     # Static Methods
@@ -86,20 +227,177 @@ class Control_Connection:
         s.connect(address)
         return Control_Connection(s, address)
 
-    def send(self, obj):
-        try:
+    # Objects other than control frames are pickled, the peer only accepts them until the compact codec is negotiated
+    def __frame(self, obj):
+        if isinstance(obj, Control_Frame):
+            data = encode_control_frame(obj, self.__codec)
+        else:
             data = pickle.dumps(obj)
-            length = len(data)
-            self.__sock.send(length.to_bytes(c.INTEGER_SIZE, 'little'))
-            self.__sock.send(data)
+        return len(data).to_bytes(c.INTEGER_SIZE, 'little') + data
+
+    def __write(self, data):
+        self.__send_lock.acquire()
+        try:
+            self.__sock.sendall(data)
         except socket.error as e:
             logging.exception("WELP")
             raise e
+        finally:
+            self.__send_lock.release()
+
+    def send(self, obj):
+        self.__write(self.__frame(obj))
+
+    # Sends several objects with a single write
+    def send_many(self, objs):
+        self.__write(b''.join(self.__frame(obj) for obj in objs))
+
+    # Queues a frame to be sent by the connection's writer, frames of the same priority are sent in order.
+    # frame: a Control_Frame or a callable building it (or None, if there's nothing to send) once it's about to be
+    # sent, therefore it holds the state of that moment. Its priority defaults to the one of its tag (see PRIORITIES).
+    # key: a frame with a key replaces the pending frame of the same key, in its place in the queue, unless replace is
+    # False (in which case the frame is discarded, as the pending one, built later, already covers it).
+    # Frames posted once the connection is terminated are discarded.
+    def post(self, frame, priority=None, key=None, replace=True):
+        if priority is None:
+            priority = PRIORITIES.get(frame.tag(), Priority.NORMAL) if isinstance(frame, Control_Frame) \
+                else Priority.NORMAL
+        self.__queue_lock.acquire()
+        try:
+            if self.__closed:
+                return
+            entry = self.__keyed.get(key) if key is not None else None
+            if entry is not None:
+                if replace:
+                    entry[0] = frame
+                return
+            if self.__pending >= self.__queue_size and not self.__drop():
+                self.__closed = True
+                self.__queue_lock.notify_all()
+                stalled = True
+            else:
+                entry = [frame, key]
+                self.__queues[priority].append(entry)
+                if key is not None:
+                    self.__keyed[key] = entry
+                self.__pending += 1
+                if self.__writer is None:
+                    self.__writer = threading.Thread(target=self.__write_queued, daemon=True,
+                                                     name=f"Control writer {self.__name}")
+                    self.__writer.start()
+                self.__queue_lock.notify()
+                stalled = False
+        finally:
+            self.__queue_lock.release()
+        if stalled:
+            logging.warning(f"Outbound control queue of {self.__name} is full, terminating the connection")
+            self.terminate()
+
+    # Drops the oldest pending LOW priority frame, if any (must hold the queue lock)
+    def __drop(self):
+        queue = self.__queues[Priority.LOW]
+        if not queue:
+            return False
+        _, key = queue.popleft()
+        if key is not None:
+            self.__keyed.pop(key, None)
+        self.__pending -= 1
+        logging.debug(f"Dropped a pending control frame to {self.__name}")
+        return True
+
+    # Takes up to batch pending frames, highest priority first (must hold the queue lock)
+    def __take(self):
+        entries = []
+        for queue in self.__queues:
+            while queue and len(entries) < self.__batch:
+                entry = queue.popleft()
+                if entry[1] is not None:
+                    self.__keyed.pop(entry[1], None)
+                entries.append(entry[0])
+        self.__pending -= len(entries)
+        return entries
+
+    # Writer thread, sends the queued frames (several of them per write) until the connection is terminated
+    def __write_queued(self):
+        try:
+            while True:
+                self.__queue_lock.acquire()
+                try:
+                    while not self.__pending and not self.__closed:
+                        self.__queue_lock.wait()
+                    if self.__closed:
+                        return
+                    entries = self.__take()
+                finally:
+                    self.__queue_lock.release()
+                data = []
+                for frame in entries:
+                    try:
+                        if callable(frame):
+                            frame = frame()
+                        if frame is not None:
+                            data.append(self.__frame(frame))
+                    except Exception:
+                        logging.exception(f"Couldn't build a control frame to {self.__name}")
+                if data:
+                    self.__write(b''.join(data))
+        except (socket.error, AttributeError):  # The socket is gone once terminated
+            if not self.__closed:
+                logging.warning(f"Control writer of {self.__name} failed, terminating the connection", exc_info=True)
+                self.terminate()
+
+    # Makes room for needed bytes past the first unparsed one, the unparsed bytes are moved to the buffer's start and
+    # the buffer only grows for frames bigger than itself
+    def __reserve(self, needed):
+        if len(self.__buffer) - self.__start >= needed:
+            return
+        pending = self.__end - self.__start
+        self.__buffer[:pending] = self.__buffer[self.__start:self.__end]
+        self.__start, self.__end = 0, pending
+        if len(self.__buffer) < needed:
+            self.__buffer.extend(bytes(needed - len(self.__buffer)))
+
+    # Parses every complete frame in the buffer
+    def __parse(self):
+        header = c.INTEGER_SIZE
+        with memoryview(self.__buffer) as view:
+            while self.__end - self.__start >= header:
+                length = int.from_bytes(view[self.__start:self.__start + header], 'little')
+                if length > c.MAX_CONTROL_FRAME_SIZE:
+                    raise ConnectionError(f"Control frame of {length} bytes exceeds the limit")
+                if self.__end - self.__start < header + length:
+                    break
+                body = self.__start + header
+                self.__start = body + length
+                # The frame's view is released right away, the logged traceback of a malformed frame would otherwise
+                # keep the buffer from being resized
+                with view[body:body + length] as frame:
+                    try:
+                        self.__frames.append(decode_control_frame(frame, self.__peer_codec))
+                        if self.__peer_codec < self.__codec and frame[0] != PICKLE_PROTO:
+                            self.__peer_codec = self.__codec
+                    except InvalidControlFrame:
+                        logging.warning(f"Discarded malformed control frame from {self.__name}", exc_info=True)
+        if self.__start == self.__end:
+            self.__start = self.__end = 0
+            return
+        # The partial frame (or header) must fit the buffer
+        if self.__end - self.__start >= header:
+            self.__reserve(header + int.from_bytes(self.__buffer[self.__start:self.__start + header], 'little'))
+        else:
+            self.__reserve(header)
 
     def receive(self):
-        length = int.from_bytes(self.__sock.recv(c.INTEGER_SIZE), 'little')
-        data = self.__sock.recv(length)
-        return pickle.loads(data)
+        while not self.__frames:
+            if self.__end == len(self.__buffer):
+                self.__reserve(self.__end - self.__start + 1)
+            with memoryview(self.__buffer) as view:
+                received = self.__sock.recv_into(view[self.__end:])
+            if received == 0:
+                raise EOFError("Control connection closed by the peer")
+            self.__end += received
+            self.__parse()
+        return self.__frames.popleft()
 
 
 class Control_Server:
@@ -0,0 +1,433 @@
+import logging
+import multiprocessing
+import queue
+import threading as thr
+import time
+
+from OverTheTop import defaults as c
+from OverTheTop.Network.FEC import Parity_Decoder
+from OverTheTop.Network.Flow_Management import Flow_Handler
+from OverTheTop.Network.Flow_Packet import SEQUENCE_MASK, Flow_Packet
+from OverTheTop.Network.Fragmentation import Reassembler
+from OverTheTop.Network.Recent_Frames import Recent_Frames
+from OverTheTop.Network.Statistics import Flow_Statistics
+from OverTheTop.Network.Thinning import Branch_Thinning
+
+# Sent through a worker's pipe as (STATISTICS_REQUEST, request_id), the worker replies (request_id, statistics) so
+# the replies to the requests that timed out are told apart (and discarded) from the next ones
+STATISTICS_REQUEST = 'statistics'
+# Sent through a worker's pipe as (FLOW_REPORT, address, report), see Branch_Thinning
+FLOW_REPORT = 'report'
+# Requested by a worker as (RETRANSMISSION_REQUEST, flow_key, address, first, count) for NACKs it can't answer, the
+# datagrams of the flows originated by the node are sent (and cached) by the control plane process. Requests have a
+# queue of their own (the workers' feedback), they never compete with the frames delivered to the control plane
+RETRANSMISSION_REQUEST = 'retransmission'
+# Fed back by a worker as (FLOW_LOSS, shard, {flow_key: loss}) once it took a report into account, the loss of the
+# branches of the flows (see Branch_Thinning.loss), only the worker relaying a flow measures the loss of its branches
+FLOW_LOSS = 'loss'
+# Sent through a worker's pipe as (REPLAY, flow_key, address), see Recent_Frames, a None address stands for the local
+# player. The local player's frames are delivered at once, as (REPLAY, flow_key, chunks)
+REPLAY = 'replay'
+# Sent through a worker's pipe as (FORGET, flow_key) once a flow is withdrawn, the worker drops the flow's state
+FORGET = 'forget'
+
+
+# Forwarding state of a node, pushed by the control plane to the data plane workers.
+# It maps each flow to the neighbours downstream of the node and each neighbour to its flow interface.
+# Snapshots are immutable, a new one is published on every change, therefore its routing decisions are cached as is.
+class Forwarding_Snapshot:
+
+    def __init__(self, node_id=None, flows=None, interfaces=None, sharded=None):
+        self.__node_id = node_id
+        self.__flows = flows or {}
+        self.__interfaces = interfaces or {}
+        self.__sharded = frozenset(sharded or ())  # Interfaces sharded among data plane workers (see Bundling)
+        self.__cache = {}  # flow_key => ({address: Header_Template}, local)
+        self.__hop_field = Flow_Packet.hop_field(node_id or 0)
+
+    def __str__(self):
+        return f"<Forwarding_Snapshot({len(self.__flows)} flows, {len(self.__interfaces)} interfaces)/>"
+
+    def interfaces(self):
+        return set(self.__interfaces.values())
+
+    def flows(self):
+        return set(self.__flows)
+
+    def sharded(self):
+        return self.__sharded
+
+    def interface(self, neighbour):
+        return self.__interfaces.get(neighbour)
+
+    @property
+    def node_id(self):
+        return self.__node_id
+
+    @property
+    def hop_field(self):
+        return self.__hop_field
+
+    # Returns ({address: Header_Template}, local) for the given flow
+    def routes(self, flow_key):
+        decision = self.__cache.get(flow_key)
+        if decision is None:
+            decision = self.__cache[flow_key] = self.__routes(flow_key)
+        return decision
+
+    def __routes(self, flow_key):
+        routes, local = {}, False
+        template = Flow_Packet.template(flow_key, self.__node_id)
+        for neighbour in self.__flows.get(flow_key, ()):
+            if neighbour == self.__node_id:
+                local = True
+                continue
+            address = self.__interfaces.get(neighbour)
+            if address is not None:
+                routes[address] = template
+        return routes, local
+
+
+# Runs in a data plane process. Receives its share of the node's flows (sockets of a SO_REUSEPORT group) and relays
+# them based on the latest snapshot. Chunks addressed to the node itself are delivered to the control plane process.
+# Gaps in the flows are NACKed to the upstream neighbour straight from the worker (see Retransmission).
+class Data_Plane_Worker:
+
+    def __init__(self, address, shard, shards, snapshots, deliveries, feedback, bundle_window=c.DEFAULT_BUNDLE_WINDOW,
+                 retransmission_budget=c.DEFAULT_RETRANSMISSION_BUDGET):
+        self.__shard = shard
+        self.__snapshot = Forwarding_Snapshot()
+        self.__snapshots = snapshots
+        self.__deliveries = deliveries
+        self.__feedback = feedback
+        self.__stop_event = thr.Event()
+        self.__reassembler = Reassembler()
+        self.__fec = Parity_Decoder()
+        self.__statistics = Flow_Statistics()
+        self.__thinning = Branch_Thinning()
+        self.__recent = Recent_Frames()
+        self.__handler = Flow_Handler(address=address, reuse_port=True, bundle_window=bundle_window,
+                                      retransmission_budget=retransmission_budget)
+        if shard == 0 and not self.__handler.shard_by_flow(shards):
+            logging.warning("Flow sharding unavailable, datagrams will be balanced by address")
+
+    def __processor(self):
+        try:
+            while not self.__stop_event.is_set():
+                packet = self.__handler.receive()
+                try:
+                    snapshot = self.__snapshot
+                    if packet.nack:
+                        self.__retransmit(snapshot, packet)
+                        continue
+                    skipped = self.__statistics.record(packet)
+                    if skipped is None:
+                        continue
+                    if 0 < skipped <= c.MAX_NACK_GAP:
+                        address = snapshot.interface(packet.hop)
+                        if address:
+                            first = (packet.sequence - skipped) & SEQUENCE_MASK
+                            self.__handler.request_retransmission(packet.flow_key, address, snapshot.node_id, first,
+                                                                  skipped)
+                    routes, local = snapshot.routes(packet.flow_key)
+                    if routes or local:
+                        self.__recent.add(packet.flow_key, packet.relay_parts(snapshot.hop_field))
+                    if routes:
+                        addresses, flagged = self.__thinning.select(packet.flow_key, packet.frame_num,
+                                                                    routes.keys(), packet.starts_frame, packet.parity)
+                        self.__handler.relay(packet, snapshot.hop_field, addresses, flagged)
+                    if local:
+                        # Flows are sharded, every fragment (and parity) of a frame reaches the same worker
+                        for fragment, chunk in self.__fec.receive(packet):
+                            if packet.parity:
+                                self.__statistics.recover(packet, fragment[1] == 0)
+                            chunk = self.__reassembler.add(packet.flow_key, fragment, chunk)
+                            if chunk:
+                                try:
+                                    self.__deliveries.put_nowait((packet.flow_key,) + chunk)
+                                except queue.Full:
+                                    pass
+                finally:
+                    self.__handler.release(packet)
+        except ConnectionError:
+            logging.debug(f"Data plane {self.__shard} processor death")
+        except Exception:
+            logging.exception(f"Exception in data plane {self.__shard} processor")
+
+    def __retransmit(self, snapshot, packet):
+        address = snapshot.interface(packet.hop)
+        if address is None:
+            return
+        first, _, count = packet.fragment
+        count = min(count, c.MAX_NACK_GAP)
+        if not self.__handler.retransmit(packet.flow_key, address, first, count):
+            try:
+                self.__feedback.put_nowait((RETRANSMISSION_REQUEST, packet.flow_key, address, first, count))
+            except queue.Full:
+                pass
+
+    def __report(self, address, report):
+        self.__thinning.report(address, report)
+        losses = {flow_key: self.__thinning.loss(flow_key, None) for flow_key in report}
+        losses = {flow_key: loss for flow_key, loss in losses.items() if loss is not None}
+        if losses:
+            try:
+                self.__feedback.put_nowait((FLOW_LOSS, self.__shard, losses))
+            except queue.Full:
+                pass
+
+    def __replay(self, flow_key, address):
+        if address:
+            self.__handler.replay(flow_key, address, self.__recent.datagrams(flow_key))
+            return
+        chunks = self.__recent.chunks(flow_key)
+        if chunks:
+            try:
+                self.__deliveries.put_nowait((REPLAY, flow_key, chunks))
+            except queue.Full:
+                pass
+
+    def __forget(self, flow_key):
+        self.__handler.forget_flow(flow_key)
+        self.__statistics.forget(flow_key)
+        self.__thinning.forget(flow_key)
+        self.__fec.forget(flow_key)
+        self.__recent.forget(flow_key)
+
+    def run(self, ready):
+        for target in (self.__handler.dispatcher, self.__processor):
+            thr.Thread(target=target, daemon=True).start()
+        ready.set()
+        try:
+            while True:
+                snapshot = self.__snapshots.recv()
+                if snapshot is None:
+                    break
+                if type(snapshot) is tuple and snapshot[0] == STATISTICS_REQUEST:
+                    self.__snapshots.send((snapshot[1], self.__statistics.snapshot()))
+                    continue
+                if type(snapshot) is tuple and snapshot[0] == FLOW_REPORT:
+                    self.__report(*snapshot[1:])
+                    continue
+                if type(snapshot) is tuple and snapshot[0] == REPLAY:
+                    self.__replay(*snapshot[1:])
+                    continue
+                if type(snapshot) is tuple and snapshot[0] == FORGET:
+                    self.__forget(snapshot[1])
+                    continue
+                # Output ports of neighbours that left are torn down, new neighbours (maybe back) may be sent datagrams,
+                # as may the neighbours whose flow port is no longer (or now) sharded
+                for address in self.__snapshot.interfaces() - snapshot.interfaces():
+                    self.__handler.close_output(address)
+                    self.__thinning.forget_address(address)
+                resharded = (snapshot.sharded() ^ self.__snapshot.sharded()) & snapshot.interfaces()
+                for address in (snapshot.interfaces() - self.__snapshot.interfaces()) | resharded:
+                    self.__handler.open_output(address, address in snapshot.sharded())
+                # So is the state of the flows the node no longer takes part in
+                for flow_key in self.__snapshot.flows().union(self.__recent.flows()):
+                    if not any(snapshot.routes(flow_key)):
+                        self.__recent.forget(flow_key)
+                        self.__fec.forget(flow_key)
+                        self.__thinning.forget(flow_key)
+                self.__snapshot = snapshot
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.__stop_event.set()
+            self.__handler.terminate()
+
+
+# Process entry point
+def run_worker(address, shard, shards, snapshots, deliveries, feedback, ready, log_level=logging.INFO,
+               bundle_window=c.DEFAULT_BUNDLE_WINDOW, retransmission_budget=c.DEFAULT_RETRANSMISSION_BUDGET):
+    logging.basicConfig(format=f"[%(levelname)-5s - %(asctime)s] (data plane {shard}) %(message)s",
+                        level=log_level, datefmt="%H:%M:%S")
+    Data_Plane_Worker(address, shard, shards, snapshots, deliveries, feedback, bundle_window,
+                      retransmission_budget).run(ready)
+
+
+# Control plane side of the multi process data plane.
+# The workers are started (and bound) before any other socket joins the flow port, therefore every flow shard
+# belongs to a worker: worker i holds socket i of the SO_REUSEPORT group and gets the flows whose hash % workers is i.
+# The node's own flow handler joins the group afterwards, as its last socket (index workers), which the sharding
+# program never selects, it only originates flows. Without sharding (see Flow_Handler.shard_by_flow) the kernel
+# balances datagrams by address over every socket of the group, the node's handler included.
+# Snapshots are pushed to every worker and local deliveries are handed to the deliver callback, the recent frames
+# replayed to the local player to the preload one.
+class Data_Plane:
+
+    def __init__(self, address, workers=c.DEFAULT_DATA_PLANE_WORKERS, deliver=None,
+                 bundle_window=c.DEFAULT_BUNDLE_WINDOW, retransmit=None,
+                 retransmission_budget=c.DEFAULT_RETRANSMISSION_BUDGET, preload=None):
+        self.__address = address
+        self.__workers_count = workers
+        self.__deliver = deliver
+        self.__preload = preload
+        self.__retransmit = retransmit
+        self.__bundle_window = bundle_window
+        self.__retransmission_budget = retransmission_budget
+        self.__context = multiprocessing.get_context('spawn')
+        self.__deliveries = self.__context.Queue(c.DEFAULT_FRAME_BUFFER_SIZE)
+        self.__feedback = self.__context.Queue(c.DEFAULT_FRAME_BUFFER_SIZE)
+        self.__losses = {}  # flow_key => {shard: loss}, see FLOW_LOSS
+        self.__pipes = []
+        self.__pipes_lock = thr.Lock()
+        self.__requests = 0  # id of the latest statistics request (must hold the pipes lock)
+        self.__workers = []
+        self.__stop_event = thr.Event()
+
+    def __str__(self):
+        return f"<Data_Plane({self.__address}, workers: {self.__workers_count})/>"
+
+    def __deliverer(self):
+        try:
+            while not self.__stop_event.is_set():
+                delivery = self.__deliveries.get()
+                if delivery is None:
+                    break
+                if delivery[0] == REPLAY:
+                    if self.__preload:
+                        self.__preload(*delivery[1:])
+                    continue
+                flow_key, frame_num, payload = delivery
+                if self.__deliver:
+                    self.__deliver(flow_key, (frame_num, payload))
+        except (EOFError, OSError):
+            pass
+        except Exception:
+            logging.exception("Exception in data plane deliverer")
+
+    def __listener(self):
+        try:
+            while not self.__stop_event.is_set():
+                feedback = self.__feedback.get()
+                if feedback is None:
+                    break
+                if feedback[0] == FLOW_LOSS:
+                    _, shard, losses = feedback
+                    for flow_key, loss in losses.items():
+                        self.__losses.setdefault(flow_key, {})[shard] = loss
+                elif self.__retransmit:
+                    self.__retransmit(*feedback[1:])
+        except (EOFError, OSError):
+            pass
+        except Exception:
+            logging.exception("Exception in data plane listener")
+
+    def start(self, timeout=c.DEFAULT_DATA_PLANE_START_TIMEOUT):
+        for shard in range(self.__workers_count):
+            parent, child = self.__context.Pipe()
+            ready = self.__context.Event()
+            worker = self.__context.Process(
+                target=run_worker, name=f"Data-Plane-{shard}", daemon=True,
+                args=(self.__address, shard, self.__workers_count, child, self.__deliveries, self.__feedback, ready,
+                      logging.getLogger().getEffectiveLevel(), self.__bundle_window, self.__retransmission_budget))
+            worker.start()
+            # Workers must join the SO_REUSEPORT group in shard order
+            if not ready.wait(timeout):
+                self.terminate()
+                raise RuntimeError(f"Data plane worker {shard} failed to start")
+            self.__pipes.append(parent)
+            self.__workers.append(worker)
+        thr.Thread(target=self.__deliverer, name="Data-Plane-Deliverer", daemon=True).start()
+        thr.Thread(target=self.__listener, name="Data-Plane-Listener", daemon=True).start()
+        logging.info(f"Started {self.__workers_count} data plane workers")
+
+    def publish(self, snapshot: Forwarding_Snapshot):
+        self.__pipes_lock.acquire()
+        try:
+            for pipe in self.__pipes:
+                try:
+                    pipe.send(snapshot)
+                except (BrokenPipeError, OSError):
+                    logging.warning("Unable to reach a data plane worker")
+        finally:
+            self.__pipes_lock.release()
+
+    # Replays the recent frames of a flow to address (None for the local player), only the worker of the flow has any
+    def replay(self, flow_key, address=None):
+        self.__pipes_lock.acquire()
+        try:
+            for pipe in self.__pipes:
+                try:
+                    pipe.send((REPLAY, flow_key, address))
+                except (BrokenPipeError, OSError):
+                    logging.warning("Unable to reach a data plane worker")
+        finally:
+            self.__pipes_lock.release()
+
+    # Hands a downstream neighbour's report to every worker, each one thins the branches of its own flows
+    def report(self, address, report):
+        self.__pipes_lock.acquire()
+        try:
+            for pipe in self.__pipes:
+                try:
+                    pipe.send((FLOW_REPORT, address, report))
+                except (BrokenPipeError, OSError):
+                    logging.warning("Unable to reach a data plane worker")
+        finally:
+            self.__pipes_lock.release()
+
+    # Has every worker drop the state of a withdrawn flow
+    def forget(self, flow_key):
+        self.__losses.pop(flow_key, None)
+        self.__pipes_lock.acquire()
+        try:
+            for pipe in self.__pipes:
+                try:
+                    pipe.send((FORGET, flow_key))
+                except (BrokenPipeError, OSError):
+                    logging.warning("Unable to reach a data plane worker")
+        finally:
+            self.__pipes_lock.release()
+
+    # Worst loss of the branches of a flow relayed by the workers, as of their latest reports
+    def loss(self, flow_key):
+        return max(tuple(self.__losses.get(flow_key, {}).values()), default=0.0)
+
+    # Receive statistics of every worker, {flow_key: {hop: stats}}
+    def statistics(self, timeout=c.DEFAULT_DATA_PLANE_START_TIMEOUT):
+        statistics = {}
+        self.__pipes_lock.acquire()
+        try:
+            self.__requests += 1
+            for pipe in self.__pipes:
+                try:
+                    pipe.send((STATISTICS_REQUEST, self.__requests))
+                    deadline = time.monotonic() + timeout
+                    # Late replies to the requests that timed out are skipped
+                    while pipe.poll(max(deadline - time.monotonic(), 0)):
+                        request_id, reply = pipe.recv()
+                        if request_id == self.__requests:
+                            for flow_key, hops in reply.items():
+                                statistics.setdefault(flow_key, {}).update(hops)
+                            break
+                except (EOFError, OSError):
+                    logging.warning("Unable to reach a data plane worker")
+        finally:
+            self.__pipes_lock.release()
+        return statistics
+
+    def terminate(self):
+        self.__stop_event.set()
+        self.__pipes_lock.acquire()
+        try:
+            for pipe in self.__pipes:
+                try:
+                    pipe.send(None)
+                    pipe.close()
+                except OSError:
+                    pass
+            self.__pipes.clear()
+        finally:
+            self.__pipes_lock.release()
+        for deliveries in (self.__deliveries, self.__feedback):
+            try:
+                deliveries.put_nowait(None)
+            except queue.Full:
+                pass
+        for worker in self.__workers:
+            worker.join(c.DEFAULT_DATA_PLANE_START_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+        self.__workers.clear()
@@ -0,0 +1,141 @@
+import struct
+import threading
+from collections import OrderedDict
+
+from OverTheTop import defaults as c
+from OverTheTop.Network.Flow_Packet import SEQUENCE_MASK
+
+# Per datagram fields protected by the parity, besides its payload (the flow fields are shared by the whole group and
+# the sequence number is implied by the datagram's position in the group)
+#   frame_num:I | fragment_index:H | fragment_count:H | payload_length:H
+PARITY_META = struct.Struct('!IHHH')
+
+
+# XOR of byte buffers of any length, shorter buffers are zero padded (at their end).
+# Buffers are XORed as (little endian) integers, the whole buffer is processed by a single native operation instead of
+# byte by byte.
+def xor_bytes(buffers, size=None):
+    accumulator = 0
+    for buffer in buffers:
+        accumulator ^= int.from_bytes(buffer, 'little')
+    size = size if size is not None else max((len(buffer) for buffer in buffers), default=0)
+    return accumulator.to_bytes(size, 'little')
+
+
+# Amount of data datagrams protected by each parity datagram for the given loss rate, 0 disables parity
+# A single loss per group can be recovered, therefore the group shrinks as losses become more frequent
+def parity_group(loss_rate):
+    for threshold, group in c.FEC_GROUPS:
+        if loss_rate >= threshold:
+            return group
+    return 0
+
+
+def parity_unit(frame_num, fragment, payload):
+    _, index, count = fragment
+    return PARITY_META.pack(frame_num, index, count, len(payload)) + bytes(payload)
+
+
+# Builds the parity datagrams of the flows originated by the node, a parity every group data datagrams.
+# Its payload is the XOR of the units (PARITY_META + payload) of the datagrams it protects, its sequence number is the
+# one of the first of them and its fragment count is the size of the group (see FLAG_PARITY).
+class Parity_Encoder:
+    __slots__ = ('group', 'first', 'count', 'accumulator', 'size')
+
+    def __init__(self, group):
+        self.group = group
+        self.reset()
+
+    def reset(self):
+        self.first = None
+        self.count = 0
+        self.accumulator = 0
+        self.size = 0
+
+    # Returns (first sequence, group size, parity payload) once a group is complete, None otherwise
+    def add(self, sequence, frame_num, fragment, payload):
+        if self.first is None:
+            self.first = sequence
+        unit = parity_unit(frame_num, fragment, payload)
+        self.accumulator ^= int.from_bytes(unit, 'little')
+        self.size = max(self.size, len(unit))
+        self.count += 1
+        if self.count < self.group:
+            return None
+        parity = self.first, self.count, self.accumulator.to_bytes(self.size, 'little')
+        self.reset()
+        return parity
+
+
+# Recovers lost datagrams of the flows that carry parity datagrams, at their destinations.
+# Flows are only tracked once a parity datagram of theirs arrives, the other flows go through untouched (and
+# uncopied). The units of the latest window datagrams of a tracked flow are kept, once a parity arrives the single
+# datagram of its group that is missing (if any) is rebuilt. Datagrams that arrive after being rebuilt are discarded.
+class Parity_Decoder:
+
+    def __init__(self, window=c.DEFAULT_FEC_WINDOW):
+        self.__window = window
+        self.__flows = {}  # flow_key => OrderedDict(sequence => unit)
+        self.__recovered = {}  # flow_key => datagrams rebuilt
+        self.__lock = threading.Lock()
+
+    def __str__(self):
+        return f"<Parity_Decoder({len(self.__flows)} flows)/>"
+
+    def __store(self, units, sequence, unit):
+        units[sequence] = unit
+        while len(units) > self.__window:
+            units.popitem(last=False)
+
+    # Returns the [(fragment, chunk)] to be reassembled because of the given packet: the packet's own, the datagram
+    # rebuilt by a parity or none (duplicates and parities without losses)
+    def receive(self, packet):
+        if not packet.parity:
+            units = self.__flows.get(packet.flow_key)
+            if units is None:
+                return [(packet.fragment, packet.chunk)]
+            self.__lock.acquire()
+            try:
+                if packet.sequence in units:
+                    return []
+                self.__store(units, packet.sequence, parity_unit(packet.frame_num, packet.fragment, packet.payload))
+            finally:
+                self.__lock.release()
+            return [(packet.fragment, packet.chunk)]
+
+        first, _, group = packet.fragment
+        self.__lock.acquire()
+        try:
+            units = self.__flows.get(packet.flow_key)
+            if units is None:
+                units = self.__flows[packet.flow_key] = OrderedDict()
+            sequences = [(first + offset) & SEQUENCE_MASK for offset in range(group)]
+            missing = [sequence for sequence in sequences if sequence not in units]
+            if len(missing) != 1:
+                return []
+            sequence = missing[0]
+            parity = packet.payload
+            unit = xor_bytes([parity] + [units[s] for s in sequences if s != sequence], len(parity))
+            frame_num, index, count, length = PARITY_META.unpack_from(unit)
+            self.__store(units, sequence, unit)
+            self.__recovered[packet.flow_key] = self.__recovered.get(packet.flow_key, 0) + 1
+        finally:
+            self.__lock.release()
+        payload = memoryview(unit)[PARITY_META.size:PARITY_META.size + length]
+        return [(((sequence - index) & SEQUENCE_MASK, index, count), (frame_num, payload))]
+
+    def forget(self, flow_key):
+        self.__lock.acquire()
+        try:
+            self.__flows.pop(flow_key, None)
+            self.__recovered.pop(flow_key, None)
+        finally:
+            self.__lock.release()
+
+    # {flow_key: datagrams rebuilt}
+    def stats(self):
+        self.__lock.acquire()
+        try:
+            return dict(self.__recovered)
+        finally:
+            self.__lock.release()
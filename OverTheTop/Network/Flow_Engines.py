@@ -0,0 +1,20 @@
+from enum import Enum
+
+from OverTheTop.Network.Async_Flow_Management import Async_Flow_Handler
+from OverTheTop.Network.Flow_Management import Flow_Handler
+
+
+class Flow_Engine(Enum):
+    THREADED = 'threaded'
+    ASYNCIO = 'asyncio'
+
+
+class Flow_Engine_Library:
+    __engines = {
+        Flow_Engine.THREADED: Flow_Handler,
+        Flow_Engine.ASYNCIO: Async_Flow_Handler
+    }
+
+    @staticmethod
+    def get_engine(engine):
+        return Flow_Engine_Library.__engines[Flow_Engine(engine)]
@@ -1,9 +1,206 @@
 import logging
-import pickle
 import socket
 import threading as thr
+import time
 
 from OverTheTop import defaults as c
+from OverTheTop.Network.Bundling import Bundle, is_bundle, unbundle
+from OverTheTop.Network.Flow_Packet import FLAG_THINNED, Flow_Packet, InvalidPacket
+from OverTheTop.Network.Fragmentation import Fragmenter
+from OverTheTop.Network.Packet_Buffer import Buffer_Pool
+from OverTheTop.Network.Retransmission import Retransmission_Cache, nack_datagram
+from OverTheTop.Network.Scheduling import Flow_Scheduler
+from Utils import socket_extra
+from Utils.collections_extra import Ring_Buffer
+
+# Non blocking receive flag, platforms without it fall back to one datagram per dispatcher wake-up
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', None)
+
+
+# Output queue and sender of a single neighbour (flow interface).
+# Every port has its own socket, per flow scheduler and forwarder thread, therefore a slow or lossy next hop only
+# backs up its own queue. Datagrams that can't be sent are dropped, a port whose forwarder died anyway stops taking
+# entries (see alive) and is replaced by the handler.
+# If a bundle window is given, small unfragmented datagrams are coalesced into bundles (see Bundling) that are sent
+# once they fill the MTU or once the window expires. Bundles only carry a single flow if the next hop is sharded.
+class Output_Port:
+
+    def __init__(self, address, capacity=c.DEFAULT_FRAME_BUFFER_SIZE, flow_queue_bytes=c.DEFAULT_FLOW_QUEUE_BYTES,
+                 batch_size=c.DEFAULT_IO_BATCH_SIZE, weights=None, mtu=c.DEFAULT_MTU,
+                 bundle_window=c.DEFAULT_BUNDLE_WINDOW, bundle_threshold=c.DEFAULT_BUNDLE_THRESHOLD, single_flow=False):
+        self.__address = address
+        self.__single_flow = single_flow
+        self.__batch_size = batch_size
+        self.__mtu = mtu
+        self.__bundle_window = bundle_window
+        self.__bundle_threshold = bundle_threshold if bundle_window is not None else -1
+        self.__bundles = 0
+        self.__bundled = 0
+        self.__buff = Flow_Scheduler(capacity, flow_queue_bytes)
+        for flow_key, weight in (weights or {}).items():
+            self.__buff.set_weight(flow_key, weight)
+        self.__cond = thr.Condition()
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__stop_event = thr.Event()
+        self.__thread = thr.Thread(target=self.forwarder, name=f"Forwarder-{address[0]}:{address[1]}", daemon=True)
+
+    def __str__(self):
+        return f"<Output_Port({self.__address}, {self.__buff})>"
+
+    @staticmethod
+    def __release(entries):
+        for _, owner, _ in entries:
+            if owner:
+                owner.release()
+
+    @property
+    def address(self):
+        return self.__address
+
+    @property
+    def alive(self):
+        return not self.__stop_event.is_set()
+
+    def start(self):
+        self.__thread.start()
+
+    # Applies from the next bundled datagram on
+    def set_single_flow(self, single_flow):
+        self.__single_flow = single_flow
+
+    def set_weight(self, flow_key, weight):
+        self.__cond.acquire()
+        try:
+            self.__buff.set_weight(flow_key, weight)
+        finally:
+            self.__cond.release()
+
+    # The flow's pending entries are discarded
+    def forget(self, flow_key):
+        self.__cond.acquire()
+        try:
+            dropped = self.__buff.forget(flow_key)
+        finally:
+            self.__cond.release()
+        self.__release(dropped)
+
+    def stats(self):
+        self.__cond.acquire()
+        try:
+            stats = self.__buff.stats()
+            stats.update(bundles=self.__bundles, bundled=self.__bundled)
+            return stats
+        finally:
+            self.__cond.release()
+
+    # Queues the datagrams (each a sequence of buffers to be gathered) of an entry
+    # The entry's owner must have been retained for this port, it's released once sent or dropped
+    # Only entries of a single (unfragmented) datagram may be bundled
+    def push(self, flow_key, datagrams, owner=None, single=False):
+        size = sum(len(part) for parts in datagrams for part in parts)
+        entry = (datagrams, owner, single and size <= self.__bundle_threshold)
+        self.__cond.acquire()
+        try:
+            if self.__stop_event.is_set():
+                dropped = [entry]
+            else:
+                dropped = self.__buff.push(flow_key, entry, size)
+        finally:
+            self.__cond.notify()
+            self.__cond.release()
+        self.__release(dropped)
+
+    def close(self):
+        self.__cond.acquire()
+        try:
+            self.__stop_event.set()
+            pending = self.__buff.pop_many(len(self.__buff))
+        finally:
+            self.__cond.notify_all()
+            self.__cond.release()
+        self.__release(pending)
+        self.__sock.close()
+
+    # Scatter/gather send, the datagram's parts (ex: header and payload) are joined by the kernel
+    def __sendmsg(self, parts):
+        try:
+            self.__sock.sendmsg(parts, (), 0, self.__address)
+        except OSError:
+            if not self.__stop_event.is_set():
+                logging.debug(f"Unable to send flow packet to {self.__address}", exc_info=True)
+
+    def __flush(self, bundle: Bundle):
+        try:
+            self.__sendmsg(bundle.parts())
+            if len(bundle) > 1:
+                self.__bundles += 1
+                self.__bundled += len(bundle)
+        finally:
+            bundle.discard()
+
+    # Waits for entries, or until the pending bundle's window expires
+    def __wait(self, bundle: Bundle):
+        while self.__buff.empty() and not self.__stop_event.is_set():
+            if not bundle:
+                self.__cond.wait()
+                continue
+            remaining = bundle.deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self.__cond.wait(remaining)
+
+    # Pops up to a batch of output entries per lock acquisition and sends them outside the lock
+    # Bundled datagrams are held until their bundle is full or its window expires, a datagram that isn't bundled
+    # flushes the pending bundle first, therefore the datagrams of a flow are sent in order
+    def forwarder(self):
+        bundle = Bundle(self.__mtu)
+        try:
+            logging.debug(f"Forwarder Launched for {self.__address}")
+            while not self.__stop_event.is_set():
+                self.__cond.acquire()
+                try:
+                    self.__wait(bundle)
+                    batch = self.__buff.pop_many(self.__batch_size)
+                finally:
+                    self.__cond.release()
+                pending = iter(batch)
+                try:
+                    for datagrams, owner, bundled in pending:
+                        try:
+                            if bundled:
+                                size = sum(len(part) for part in datagrams[0])
+                                if bundle and not bundle.fits(datagrams[0], size, self.__single_flow):
+                                    self.__flush(bundle)
+                                # The owner is handed over to the bundle
+                                bundle.add(datagrams[0], size, self.__bundle_window, owner)
+                                owner = None
+                                continue
+                            if bundle:
+                                self.__flush(bundle)
+                            for parts in datagrams:
+                                self.__sendmsg(parts)
+                        finally:
+                            if owner:
+                                owner.release()
+                    if bundle.expired():
+                        self.__flush(bundle)
+                finally:
+                    self.__release(pending)
+            logging.debug(f"Forwarder Death for {self.__address}")
+        except Exception:
+            if not self.__stop_event.is_set():
+                logging.exception(f"Exception on flow Forwarder for {self.__address}")
+            else:
+                logging.debug(f"Forwarder Death for {self.__address}")
+        finally:
+            bundle.discard()
+            self.__cond.acquire()
+            try:
+                self.__stop_event.set()
+                pending = self.__buff.pop_many(len(self.__buff))
+            finally:
+                self.__cond.release()
+            self.__release(pending)
 
 
 class Flow_Handler:
@@ -11,21 +208,19 @@ class Flow_Handler:
     #       Socket security is on the waiting room and probably wont be developed
     #       however, if this is not true, it's implementation should be done here
 
-    # Note: These buffers provide scale to the transport layer (allows multiple dispatchers and forwarders)
-    #       and make handling packets easier in general
-
-    # Input buffer
-    # Dispatchers will place Datagram Packets in here
-    in_buff = []
-    in_cond = thr.Condition()
+    # Note: The input buffer provides scale to the transport layer (allows multiple dispatchers) and makes handling
+    #       packets easier in general. It is bounded per instance by buffer_size packets and, optionally, by
+    #       buffer_bytes bytes. Outgoing packets go through the Output_Port of their neighbour, opened on demand.
 
-    # Output buffer
-    # Forwarders will launch Datagram Packets from here
-    out_buff = []
-    out_cond = thr.Condition()
+    # Packets are handed to processors through receive(), see Async_Flow_Handler for the inline alternative
+    inline_processing = False
 
+    # reuse_port allows several handlers (ex: data plane worker processes) to share the same flow port
     def __init__(self, address=None, port=c.DEFAULT_PORT, packet_size=c.DEFAULT_PACKET_SIZE,
-                 buffer_size=c.DEFAULT_FRAME_BUFFER_SIZE):
+                 buffer_size=c.DEFAULT_FRAME_BUFFER_SIZE, buffer_bytes=c.DEFAULT_FRAME_BUFFER_BYTES,
+                 batch_size=c.DEFAULT_IO_BATCH_SIZE, pool_size=c.DEFAULT_BUFFER_POOL_SIZE, reuse_port=False,
+                 mtu=c.DEFAULT_MTU, flow_queue_bytes=c.DEFAULT_FLOW_QUEUE_BYTES, bundle_window=c.DEFAULT_BUNDLE_WINDOW,
+                 bundle_threshold=c.DEFAULT_BUNDLE_THRESHOLD, retransmission_budget=c.DEFAULT_RETRANSMISSION_BUDGET):
         if type(address) is tuple:
             pass
         elif address is None:
@@ -33,11 +228,31 @@ class Flow_Handler:
         else:
             address = (address, port)
 
+        # Input buffer
+        # Dispatchers will place Datagram Packets in here
+        self.in_buff = Ring_Buffer(buffer_size, buffer_bytes)
+        self.in_cond = thr.Condition()
+        # Output ports, one per neighbour flow interface
+        self.__ports = {}
+        self.__ports_lock = thr.Lock()
+        self.__closed = set()  # Addresses whose output was closed, their ports aren't opened again (see open_output)
+        self.__sharded = set()  # Addresses of the sharded next hops, bundles bound to them carry a single flow
+        self.__weights = {}
+
         self.__buffer_size = buffer_size
+        self.__flow_queue_bytes = flow_queue_bytes
+        self.__mtu = mtu
+        self.__bundle_window = bundle_window
+        self.__bundle_threshold = bundle_threshold
         self.__packet_size = packet_size
+        self.__batch_size = max(batch_size, 1) if MSG_DONTWAIT is not None else 1
+        self.__pool = Buffer_Pool(packet_size, pool_size)
+        self.__fragmenter = Fragmenter(mtu)
+        self.__sent = Retransmission_Cache(retransmission_budget)
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            socket_extra.reuse_port(self.__sock)
         self.__sock.bind(address)
-        self.__whatever = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__stop_event = thr.Event()
 
     def __str__(self):
@@ -45,104 +260,269 @@ class Flow_Handler:
 
     # Private Methods
 
-    def __can_input(self):
-        return len(self.in_buff) < self.__packet_size
-
-    def __can_output(self):
-        return len(self.out_buff) < self.__packet_size
+    def __can_input(self, size=0):
+        return not self.in_buff.full(size)
 
     def __empty_input(self):
-        return len(self.in_buff) == 0
+        return self.in_buff.empty()
 
-    def __empty_output(self):
-        return len(self.out_buff) == 0
+    # Returns the output port of address, opened on demand, None if the address' output is closed
+    def __port(self, address) -> Output_Port:
+        port = self.__ports.get(address)
+        if port is None or not port.alive:
+            self.__ports_lock.acquire()
+            try:
+                port = self.__ports.get(address)
+                if port is not None and not port.alive:
+                    logging.warning(f"Replacing the dead output port of {address}")
+                    self.__ports.pop(address).close()
+                    port = None
+                if port is None and not self.__stop_event.is_set() and address not in self.__closed:
+                    port = Output_Port(address, self.__buffer_size, self.__flow_queue_bytes, self.__batch_size,
+                                       self.__weights, self.__mtu, self.__bundle_window, self.__bundle_threshold,
+                                       address in self.__sharded)
+                    port.start()
+                    self.__ports[address] = port
+            finally:
+                self.__ports_lock.release()
+        return port
+
+    def __all_ports(self):
+        self.__ports_lock.acquire()
+        try:
+            return list(self.__ports.values())
+        finally:
+            self.__ports_lock.release()
 
     # Public Methods
     @property
     def interface(self):
         return self.__sock.getsockname()
 
-    def send(self, flow_header, data, destination):
-        packet = pickle.dumps((flow_header, data))
+    # Steers the datagrams received by the port's SO_REUSEPORT group to its sockets by flow (flow hash % shards)
+    def shard_by_flow(self, shards) -> bool:
+        return socket_extra.attach_reuseport_program(
+            self.__sock, socket_extra.word_modulo_program(Flow_Packet.FLOW_HASH_OFFSET, shards))
+
+    # Relative share of the output bandwidth given to the flow (on every port)
+    def set_flow_weight(self, flow_key, weight):
+        self.__weights[flow_key] = weight
+        for port in self.__all_ports():
+            port.set_weight(flow_key, weight)
+
+    # A parity datagram every group datagrams of a flow originated by the node (see FEC), 0 disables parity
+    def set_flow_parity(self, flow_key, group):
+        self.__fragmenter.set_parity(flow_key, group)
+
+    def flow_parity(self, flow_key):
+        return self.__fragmenter.parity(flow_key)
+
+    def forget_flow(self, flow_key):
+        self.__weights.pop(flow_key, None)
+        for port in self.__all_ports():
+            port.forget(flow_key)
+        self.__fragmenter.forget(flow_key)
+
+    # Lets datagrams be sent to address again, once its output was closed
+    # sharded: the flow port of address is sharded among data plane workers (see Bundling)
+    def open_output(self, address, sharded=False):
+        self.__ports_lock.acquire()
         try:
-            self.out_cond.acquire()
-            while not self.__can_output():
-                self.out_cond.wait()
-            self.out_buff.append((packet, destination))
+            self.__closed.discard(address)
+            if sharded:
+                self.__sharded.add(address)
+            else:
+                self.__sharded.discard(address)
+            port = self.__ports.get(address)
         finally:
-            self.out_cond.notify()
-            self.out_cond.release()
+            self.__ports_lock.release()
+        if port:
+            port.set_single_flow(sharded)
 
-    def receive(self):
+    # Tears down the output port of a neighbour, its pending packets are discarded. Datagrams sent to address later
+    # on (ex: by forwarding decisions made before) are discarded until its output is opened again
+    def close_output(self, address):
+        self.__ports_lock.acquire()
+        try:
+            self.__closed.add(address)
+            self.__sharded.discard(address)
+            port = self.__ports.pop(address, None)
+        finally:
+            self.__ports_lock.release()
+        if port:
+            port.close()
+        self.__sent.forget(address)
+
+    # Current length, size, high-water mark and drops of the input buffer (none, the dispatcher waits for room) and of
+    # every output port (by address)
+    def queue_stats(self):
+        self.in_cond.acquire()
         try:
-            self.in_cond.acquire()
-            while self.__empty_input() and not self.__stop_event.is_set():
-                self.in_cond.wait()
-            packet = self.in_buff.pop(0)
-        except IndexError:
-            raise ConnectionError
+            stats = {'input': dict(self.in_buff.stats(), dropped=0)}
         finally:
             self.in_cond.release()
-        return pickle.loads(packet)
+        stats['output'] = {port.address: port.stats() for port in self.__all_ports()}
+        return stats
+
+    # Queues a chunk for every gateway in routes ({address: Header_Template}), in their respective output ports.
+    # The payload is shared by all gateways, only the (small) flow header is built per gateway and fragment.
+    # Chunks bigger than the MTU are fragmented.
+    # If the payload lives in a pooled buffer, its owner is retained until every port has sent it
+    # Never blocks, if the flow's queue of a port is full its oldest chunks are dropped
+    # Returns the datagrams built for every gateway, {address: [parts]}
+    def send(self, flow_key, chunk, routes, owner=None):
+        datagrams = self.__fragmenter.datagrams(flow_key, chunk, routes)
+        for address, packets in datagrams.items():
+            port = self.__port(address)
+            if port:
+                for parts in packets:
+                    self.__sent.add(flow_key, parts, (address,), owner is not None)
+                port.push(flow_key, packets, owner.retain() if owner else None, len(packets) == 1)
+        return datagrams
+
+    # Queues a received packet's datagram, as relayed by hop_field, for every address (see Flow_Packet.relay_parts)
+    # The datagram is never decoded nor copied, its owner is retained until every port has sent it. The addresses in
+    # flagged get it with FLAG_THINNED (see Branch_Thinning)
+    def relay(self, packet: Flow_Packet, hop_field, addresses, flagged=()):
+        datagrams = (packet.relay_parts(hop_field),)
+        single = not packet.fragmented
+        self.__sent.add(packet.flow_key, datagrams[0], addresses)
+        for address in addresses:
+            port = self.__port(address)
+            if port:
+                parts = (packet.relay_parts(hop_field, FLAG_THINNED),) if address in flagged else datagrams
+                port.push(packet.flow_key, parts, packet.owner.retain() if packet.owner else None, single)
+
+    # Sends again the datagrams of a flow, from sequence first on, that were recently sent to address and are still
+    # cached, returns how many were
+    def retransmit(self, flow_key, address, first, count):
+        return self.replay(flow_key, address, self.__sent.get(flow_key, address, first, count))
+
+    # Queues already built datagrams (each a sequence of buffers) of a flow for address, returns how many were
+    def replay(self, flow_key, address, datagrams):
+        port = self.__port(address) if datagrams else None
+        if port:
+            port.push(flow_key, tuple(datagrams))
+            return len(datagrams)
+        return 0
+
+    # Asks the upstream neighbour at address to retransmit count datagrams of a flow, from sequence first on, to the
+    # current machine (hop), see Retransmission
+    def request_retransmission(self, flow_key, address, hop, first, count):
+        if not self.__sent.enabled:
+            return
+        port = self.__port(address)
+        if port:
+            port.push(flow_key, ((nack_datagram(flow_key, hop, first, count),),), None, True)
+
+    # Returns the next valid Flow_Packet, malformed datagrams are discarded
+    # The caller owns the returned packet and must release() it once done with its payload
+    def receive(self) -> Flow_Packet:
+        while True:
+            try:
+                self.in_cond.acquire()
+                while self.__empty_input() and not self.__stop_event.is_set():
+                    self.in_cond.wait()
+                datagram, buffer = self.in_buff.pop()
+            except IndexError:
+                raise ConnectionError
+            finally:
+                self.in_cond.notify()
+                self.in_cond.release()
+            try:
+                return Flow_Packet.unpack(datagram, buffer)
+            except InvalidPacket:
+                buffer.release()
+                logging.debug("Discarded malformed flow packet", exc_info=True)
+
+    @staticmethod
+    def release(packet: Flow_Packet):
+        if packet.owner:
+            packet.owner.release()
 
     # Runnables and Worker Management
 
     def terminate(self):
         self.in_cond.acquire()
-        self.out_cond.acquire()
         try:
             self.__stop_event.set()
         finally:
             self.in_cond.notify_all()
-            self.out_cond.notify_all()
             self.in_cond.release()
-            self.out_cond.release()
         self.__sock.close()
-        self.__whatever.close()
+        self.__ports_lock.acquire()
+        try:
+            ports = list(self.__ports.values())
+            self.__ports.clear()
+        finally:
+            self.__ports_lock.release()
+        for port in ports:
+            port.close()
 
     def reset(self):
         self.__stop_event.clear()
 
+    # Blocks for the first datagram and then drains every datagram already queued in the socket (up to the batch
+    # size) into pooled buffers, which are handed over to the input buffer in a single lock acquisition
+    def __receive_batch(self):
+        batch = []
+        flags = 0
+        while len(batch) < self.__batch_size:
+            buffer = self.__pool.acquire()
+            try:
+                buffer.fill(self.__sock.recv_into(buffer.data, self.__packet_size, flags))
+            except BlockingIOError:
+                buffer.release()
+                break
+            except Exception:
+                buffer.release()
+                raise
+            batch.extend(self.__demultiplex(buffer))
+            flags = MSG_DONTWAIT
+        return batch
+
+    # Returns the (datagram, buffer) pairs of a received buffer, bundles are split in their datagrams, each holding
+    # its own reference to the buffer
+    @staticmethod
+    def __demultiplex(buffer):
+        view = buffer.view
+        if not is_bundle(view):
+            return [(view, buffer)]
+        try:
+            datagrams = unbundle(view)
+        except InvalidPacket:
+            logging.debug("Discarded malformed flow bundle", exc_info=True)
+            datagrams = []
+        for _ in range(len(datagrams) - 1):
+            buffer.retain()
+        if not datagrams:
+            buffer.release()
+        return [(datagram, buffer) for datagram in datagrams]
+
     def dispatcher(self):
         try:
             logging.debug("Dispatcher Launched")
             while not self.__stop_event.is_set():
-                packet = self.__sock.recv(self.__packet_size)
+                batch = self.__receive_batch()
+                pending = iter(batch)
                 self.in_cond.acquire()
                 try:
-                    while (not self.__can_input()) and (not self.__stop_event.is_set()):
-                        self.in_cond.wait()
-                    self.in_buff.append(packet)
+                    for datagram, buffer in pending:
+                        while (not self.__can_input(len(datagram))) and (not self.__stop_event.is_set()):
+                            self.in_cond.wait()
+                        if self.__stop_event.is_set():
+                            # Terminating while the input buffer is full, the rest of the batch is discarded
+                            buffer.release()
+                            break
+                        self.in_buff.push((datagram, buffer), len(datagram))
                 finally:
-                    self.in_cond.notify()
+                    self.in_cond.notify(len(batch))
                     self.in_cond.release()
+                for _, buffer in pending:
+                    buffer.release()
             logging.debug("Dispatcher Death")
         except Exception:
             if not self.__stop_event.is_set():
                 logging.exception(f"Exception on flow Dispatcher")
             else:
                 logging.debug("Dispatcher Death")
-
-    def forwarder(self):
-        try:
-            logging.debug("Forwarder Launched")
-            while not self.__stop_event.is_set():
-                self.out_cond.acquire()
-                try:
-                    while self.__empty_output() and not self.__stop_event.is_set():
-                        self.out_cond.wait()
-                    packet, address = self.out_buff.pop(0)
-                finally:
-                    self.out_cond.release()
-                if packet and address:
-                    if isinstance(address, (list, set)):
-                        for add in address:
-                            self.__whatever.sendto(packet, add)
-                    else:
-                        self.__whatever.sendto(packet, address)
-            logging.debug("Forwarder Death")
-        except Exception:
-            if not self.__stop_event.is_set():
-                logging.exception("Exception on flow Forwarder")
-            else:
-                logging.debug("Forwarder Death")
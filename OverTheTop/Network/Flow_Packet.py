@@ -0,0 +1,218 @@
+import struct
+import time
+import zlib
+
+FLOW_PACKET_VERSION = 1
+
+# Fragment of a chunk that fits in a single datagram
+SINGLE_FRAGMENT = (0, 0, 1)
+
+# Set on datagrams that carry several flow datagrams (see Bundling)
+FLAG_BUNDLE = 0x80
+# Set on parity datagrams, their sequence is the first one they protect and their fragment count the amount of
+# datagrams protected (see FEC)
+FLAG_PARITY = 0x40
+# Set on retransmission requests, sent upstream by the node in their hop field for fragment count datagrams starting at
+# their sequence (see Retransmission)
+FLAG_NACK = 0x20
+# Set on the first datagram a node sends a neighbour after thinning frames out of its branch, the sequence gap before it
+# isn't a loss and isn't NACKed (see Branch_Thinning). Relays forward it as is, the frames are missing downstream too
+FLAG_THINNED = 0x10
+
+# Sequence numbers and timestamps are 32 bit and wrap around
+SEQUENCE_MASK = 0xFFFFFFFF
+TIMESTAMP_MASK = 0xFFFFFFFF
+
+
+# Milliseconds of a monotonic clock, only differences between timestamps of the same origin are meaningful
+def timestamp() -> int:
+    return int(time.monotonic() * 1000) & TIMESTAMP_MASK
+
+
+class InvalidPacket(ValueError):
+    pass
+
+
+# Header fields of a flow datagram that only depend on its flow and on the node sending it (hop).
+# These are encoded once per flow (see the forwarding caches) and only the per datagram fields (frame and fragment
+# numbers, timestamp) are packed for every datagram.
+class Header_Template:
+    __slots__ = ('fields', 'size', 'frame_flags', 'parity')
+
+    def __init__(self, fields, size, frame_flags=0, parity=True):
+        self.fields = fields  # (flow_hash, flow_id, origin, hop)
+        self.size = size
+        self.frame_flags = frame_flags  # Set on the first datagram of every frame (ex: FLAG_THINNED)
+        self.parity = parity  # Whether the gateway gets the parity datagrams of the flow (see FEC)
+
+    def pack(self, frame_num, fragment=SINGLE_FRAGMENT, flags=0, stamp=0) -> bytes:
+        flow_hash, flow_id, origin, hop = self.fields
+        if not fragment[1]:
+            flags |= self.frame_flags
+        return Flow_Packet.pack_fields(flags, flow_hash, frame_num, fragment, flow_id, origin, hop, stamp)
+
+    # The same template, setting the given flags on the first datagram of every frame, without parity datagrams unless
+    # parity is set
+    def flagged(self, frame_flags=0, parity=True):
+        return Header_Template(self.fields, self.size, self.frame_flags | frame_flags, self.parity and parity)
+
+
+# Binary representation of a flow datagram. The header has a fixed layout (network byte order):
+#   version:B | flags:B | flow_hash:I | frame_num:I | sequence:I | fragment_index:H | fragment_count:H |
+#   flow_id:I | origin:Q | hop:Q | timestamp:I
+# Flow and node ids are integers (see Identifiers), therefore the header has a fixed size.
+# The sequence number counts the datagrams of a flow at its origin, the fragments of a frame have consecutive
+# sequence numbers and the frame is identified by the sequence number of its first fragment (frame_id).
+# The hop is the node that sent the datagram and the timestamp is the origin's send time (see timestamp()), both
+# feed the receive statistics of every node (see Statistics).
+# Packets don't carry their destinations, every node forwards them based on its own flow table (see Flow_Data).
+# The remaining bytes of the datagram are the raw chunk payload, which is never copied on decoding.
+# The flow hash sits at a fixed offset (FLOW_HASH_OFFSET) so datagrams can be steered by flow without parsing them.
+# Chunks bigger than a datagram are split in fragments (frame_id, fragment_index, fragment_count), see Fragmentation.
+# A decoded packet only holds the header fields and the datagram, the chunk is only built if it's asked for.
+# Relays forward the datagram as it is, only replacing its hop (see relay_parts).
+# Small datagrams bound to the same next hop may travel together in a bundle (FLAG_BUNDLE), see Bundling.
+class Flow_Packet:
+    __slots__ = ('__fields', '__datagram', '__owner', '__flow_key')
+    FLOW_HASH_OFFSET = 2
+    SEQUENCE_OFFSET = 10
+    FRAGMENT_INDEX_OFFSET = 14
+    HOP_OFFSET = 30
+    __header = struct.Struct('!BBIIIHHIQQI')
+    __flow_key_struct = struct.Struct('!IQ')
+    __hop = struct.Struct('!Q')
+
+    # fields: the unpacked header, datagram: the whole datagram (header included)
+    def __init__(self, fields, datagram, owner=None):
+        self.__fields = fields
+        self.__datagram = datagram
+        self.__owner = owner
+        self.__flow_key = (fields[7], fields[8])
+
+    def __str__(self):
+        return f"<Flow_Packet({self.__flow_key}, #{self.frame_num}, {self.payload_size} bytes)/>"
+
+    @property
+    def flow_key(self):
+        return self.__flow_key
+
+    @property
+    def frame_num(self):
+        return self.__fields[3]
+
+    @property
+    def sequence(self):
+        return self.__fields[4]
+
+    # (frame_id, fragment_index, fragment_count)
+    @property
+    def fragment(self):
+        _, _, _, _, sequence, index, count, *_ = self.__fields
+        return (sequence - index) & SEQUENCE_MASK, index, count
+
+    @property
+    def fragmented(self):
+        return self.__fields[6] > 1
+
+    @property
+    def parity(self):
+        return self.__fields[1] & FLAG_PARITY != 0
+
+    @property
+    def nack(self):
+        return self.__fields[1] & FLAG_NACK != 0
+
+    @property
+    def thinned(self):
+        return self.__fields[1] & FLAG_THINNED != 0
+
+    # Whether the datagram is the first one of a frame
+    @property
+    def starts_frame(self):
+        return self.__fields[5] == 0 and not self.__fields[1] & FLAG_PARITY
+
+    @property
+    def payload(self) -> memoryview:
+        return self.__datagram[Flow_Packet.__header.size:]
+
+    @property
+    def payload_size(self):
+        return len(self.__datagram) - Flow_Packet.__header.size
+
+    @property
+    def flags(self):
+        return self.__fields[1]
+
+    # The neighbour the datagram came from
+    @property
+    def hop(self):
+        return self.__fields[9]
+
+    # Origin's send time
+    @property
+    def stamp(self):
+        return self.__fields[10]
+
+    # The Packet_Buffer the datagram points to (None if the datagram owns its memory)
+    @property
+    def owner(self):
+        return self.__owner
+
+    @property
+    def chunk(self):
+        return self.frame_num, self.payload
+
+    # The datagram as relayed by the given hop (Flow_Packet.hop_field), as buffers to be gathered by sendmsg
+    # Nothing is copied nor written, the datagram may be shared with other readers. Datagrams relayed with extra flags
+    # (ex: FLAG_THINNED) get a copy of the header up to the hop instead
+    def relay_parts(self, hop_field, flags=0):
+        datagram = self.__datagram
+        head = datagram[:Flow_Packet.HOP_OFFSET]
+        if flags & ~self.__fields[1]:
+            head = bytearray(head)
+            head[1] |= flags
+        return head, hop_field, datagram[Flow_Packet.HOP_OFFSET + len(hop_field):]
+
+    # Static Methods
+
+    @staticmethod
+    def flow_hash(flow_key) -> int:
+        return zlib.crc32(Flow_Packet.__flow_key_struct.pack(*flow_key))
+
+    @staticmethod
+    def hop_field(hop) -> bytes:
+        return Flow_Packet.__hop.pack(hop)
+
+    @staticmethod
+    def pack_fields(flags, flow_hash, frame_num, fragment, flow_id, origin, hop, stamp) -> bytes:
+        frame_id, index, count = fragment
+        return Flow_Packet.__header.pack(FLOW_PACKET_VERSION, flags, flow_hash, frame_num,
+                                         (frame_id + index) & SEQUENCE_MASK, index, count, flow_id, origin, hop, stamp)
+
+    @staticmethod
+    def template(flow_key, hop) -> Header_Template:
+        return Header_Template((Flow_Packet.flow_hash(flow_key),) + tuple(flow_key) + (hop,), Flow_Packet.__header.size)
+
+    @staticmethod
+    def pack_header(flow_key, hop, frame_num, fragment=SINGLE_FRAGMENT, flags=0, stamp=0) -> bytes:
+        return Flow_Packet.template(flow_key, hop).pack(frame_num, fragment, flags, stamp)
+
+    @staticmethod
+    def pack(flow_key, hop, chunk, flags=0) -> bytes:
+        frame_num, payload = chunk
+        return Flow_Packet.pack_header(flow_key, hop, frame_num, flags=flags, stamp=timestamp()) + payload
+
+    @staticmethod
+    def unpack(buffer, owner=None):
+        view = memoryview(buffer)
+        try:
+            fields = Flow_Packet.__header.unpack_from(view)
+        except struct.error:
+            raise InvalidPacket("Truncated flow packet")
+        if fields[0] != FLOW_PACKET_VERSION:
+            raise InvalidPacket(f"Unsupported flow packet version {fields[0]}")
+        if fields[1] & FLAG_BUNDLE:
+            raise InvalidPacket("Flow bundles must be unbundled before being unpacked")
+        if fields[5] >= fields[6]:
+            raise InvalidPacket("Invalid flow packet fragment")
+        return Flow_Packet(fields, view, owner)
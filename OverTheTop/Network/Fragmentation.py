@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import OrderedDict
+
+from OverTheTop import defaults as c
+from OverTheTop.Network.FEC import PARITY_META, Parity_Encoder
+from OverTheTop.Network.Flow_Packet import FLAG_PARITY, SEQUENCE_MASK, timestamp
+
+MAX_FRAGMENTS = 0xFFFF
+
+
+# Builds the datagrams of a chunk for every gateway in routes ({address: Header_Template}).
+# Chunks that don't fit the MTU are split in fragments of a new frame (relays forward datagrams as they are, therefore
+# only origins fragment). The payload is never copied, the fragments are memoryview slices of it.
+# Every datagram of a flow gets its own sequence number, a frame is identified by the sequence of its first fragment.
+# Flows with parity (see FEC) get a parity datagram after every group of data datagrams, their fragments leave room
+# for the parity's own fields so parity datagrams fit the MTU as well. Gateways whose template has no parity (ex:
+# thinned branches, see Branch_Thinning) don't get parity datagrams.
+class Fragmenter:
+
+    def __init__(self, mtu=c.DEFAULT_MTU, min_fragment_size=c.MIN_FRAGMENT_SIZE):
+        self.__mtu = mtu
+        self.__min_fragment_size = min_fragment_size
+        self.__sequences = {}
+        self.__encoders = {}  # flow_key => Parity_Encoder
+        self.__lock = threading.Lock()
+
+    # Reserves count sequence numbers of the flow, returns the first one
+    def __next_frame_id(self, flow_key, count):
+        self.__lock.acquire()
+        try:
+            frame_id = self.__sequences.get(flow_key, 0)
+            self.__sequences[flow_key] = (frame_id + count) & SEQUENCE_MASK
+            return frame_id
+        finally:
+            self.__lock.release()
+
+    def forget(self, flow_key):
+        self.__lock.acquire()
+        try:
+            self.__sequences.pop(flow_key, None)
+            self.__encoders.pop(flow_key, None)
+        finally:
+            self.__lock.release()
+
+    # A parity datagram every group data datagrams of the flow, 0 disables parity
+    def set_parity(self, flow_key, group):
+        self.__lock.acquire()
+        try:
+            encoder = self.__encoders.get(flow_key)
+            if not group:
+                self.__encoders.pop(flow_key, None)
+            elif encoder is None or encoder.group != group:
+                self.__encoders[flow_key] = Parity_Encoder(group)
+        finally:
+            self.__lock.release()
+
+    def parity(self, flow_key):
+        encoder = self.__encoders.get(flow_key)
+        return encoder.group if encoder else 0
+
+    # Returns {address: [(header, payload)]}
+    def datagrams(self, flow_key, chunk, routes):
+        frame_num, payload = chunk
+        stamp = timestamp()
+        encoder = self.__encoders.get(flow_key)
+        # Header lengths don't depend on the fragment numbers
+        header_size = max(template.size for template in routes.values())
+        if encoder:
+            header_size += PARITY_META.size
+        fragment_size = max(self.__mtu - header_size, self.__min_fragment_size)
+        count = max((len(payload) + fragment_size - 1) // fragment_size, 1)
+        if count > MAX_FRAGMENTS:
+            raise ValueError(f"Chunk of {len(payload)} bytes exceeds the fragment limit")
+        frame_id = self.__next_frame_id(flow_key, count)
+        if count == 1:
+            pieces = [payload]
+        else:
+            view = memoryview(payload)
+            pieces = [view[index * fragment_size:(index + 1) * fragment_size] for index in range(count)]
+
+        parities = []
+        if encoder:
+            for index, piece in enumerate(pieces):
+                parity = encoder.add((frame_id + index) & SEQUENCE_MASK, frame_num, (frame_id, index, count), piece)
+                if parity:
+                    parities.append(parity)
+        return {address: [(template.pack(frame_num, (frame_id, index, count), stamp=stamp), piece)
+                          for index, piece in enumerate(pieces)] +
+                         [(template.pack(0, (first, 0, group), FLAG_PARITY, stamp), parity)
+                          for first, group, parity in (parities if template.parity else ())]
+                for address, template in routes.items()}
+
+
+class Partial_Frame:
+    __slots__ = ('frame_num', 'pieces', 'missing', 'size', 'deadline')
+
+    def __init__(self, frame_num, count, deadline):
+        self.frame_num = frame_num
+        self.pieces = [None] * count
+        self.missing = count
+        self.size = 0
+        self.deadline = deadline
+
+
+# Rebuilds the chunks of fragmented frames.
+# Incomplete frames are bounded both in memory (budget, in bytes) and in time (timeout, in seconds), the oldest ones
+# being discarded first. Fragments are copied since their payload may live in a recycled receive buffer.
+class Reassembler:
+
+    def __init__(self, budget=c.DEFAULT_REASSEMBLY_BUDGET, timeout=c.DEFAULT_REASSEMBLY_TIMEOUT):
+        self.__budget = budget
+        self.__timeout = timeout
+        self.__frames = OrderedDict()  # (flow_key, frame_id) => Partial_Frame, ordered by arrival
+        self.__size = 0
+        self.__lock = threading.Lock()
+        self.__discarded = 0
+
+    def __str__(self):
+        return f"<Reassembler({len(self.__frames)} frames, {self.__size}/{self.__budget} bytes)/>"
+
+    @property
+    def discarded(self):
+        return self.__discarded
+
+    def __discard_oldest(self):
+        _, frame = self.__frames.popitem(last=False)
+        self.__size -= frame.size
+        self.__discarded += 1
+
+    def __expire(self, now):
+        while self.__frames and next(iter(self.__frames.values())).deadline <= now:
+            self.__discard_oldest()
+
+    # Returns the complete chunk (frame_num, payload) once every fragment of its frame has arrived, None otherwise
+    def add(self, flow_key, fragment, chunk):
+        frame_id, index, count = fragment
+        frame_num, piece = chunk
+        if count <= 1:
+            return frame_num, bytes(piece)
+
+        key = (flow_key, frame_id)
+        now = time.monotonic()
+        self.__lock.acquire()
+        try:
+            self.__expire(now)
+            frame = self.__frames.get(key)
+            if frame is None:
+                frame = self.__frames[key] = Partial_Frame(frame_num, count, now + self.__timeout)
+            elif len(frame.pieces) != count or frame.pieces[index] is not None:
+                return None  # Duplicate or inconsistent fragment
+            frame.pieces[index] = bytes(piece)
+            frame.missing -= 1
+            frame.size += len(piece)
+            self.__size += len(piece)
+            if frame.missing == 0:
+                self.__frames.pop(key)
+                self.__size -= frame.size
+                return frame.frame_num, b''.join(frame.pieces)
+            while self.__size > self.__budget and self.__frames:
+                self.__discard_oldest()
+            return None
+        finally:
+            self.__lock.release()
+
+    def clear(self):
+        self.__lock.acquire()
+        try:
+            self.__frames.clear()
+            self.__size = 0
+        finally:
+            self.__lock.release()
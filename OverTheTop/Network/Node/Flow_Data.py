@@ -1,3 +1,4 @@
+import logging
 import sys
 import threading
 
@@ -6,10 +7,13 @@ from Utils.threading_extra import RWLock
 
 
 # Enumeration corresponding to each state a flow can have
+# ACTIVE: the node is a destination, STREAMING: the node is the origin and sends the flow to others, RELAYING: the
+# node relays the flow to others
 class Flow_State(OrderedEnum):
     ACTIVE = 1
     STREAMING = 2
-    HOLD = 3
+    RELAYING = 3
+    HOLD = 4
     INVALID = sys.maxsize
 
 
@@ -23,14 +27,19 @@ class InvalidState(InvalidFlow):
     pass
 
 
+# Destinations are mapped to the neighbour the flow is sent to in order to reach them (downstream), which is the
+# neighbour their request came from. Flow packets follow the reverse path of the requests, from the origin down to
+# every destination, and each node forwards them based on its own entry.
+# The upstream is the neighbour the node requested the flow from (None at the origin), cancels are sent there.
 class Flow_Entry:
     def __init__(self, destinations=None, state=Flow_State.HOLD):  # Missing Arguments
         self.__state: Flow_State = state  # Origins => Estado
-        self.__destinations: set = set(destinations) if destinations else set()  # Destinos
+        self.__destinations: dict = dict(destinations) if destinations else {}  # Destinos => Downstream
+        self.__upstream = None
         self.__cond = threading.Condition()
 
     def __str__(self):
-        return f"<FlowEntry({self.__state}, {self.__destinations})/>"
+        return f"<FlowEntry({self.__state}, {self.__destinations}, upstream: {self.__upstream})/>"
 
     @property
     def active(self):
@@ -46,7 +55,23 @@ class Flow_Entry:
 
     @property
     def destinations(self):
-        return self.__destinations.copy()
+        return set(self.__destinations)
+
+    # Neighbours the flow is sent to (the node itself, if it's a destination)
+    @property
+    def downstream(self):
+        return set(self.__destinations.values())
+
+    @property
+    def upstream(self):
+        return self.__upstream
+
+    def set_upstream(self, upstream):
+        self.__upstream = upstream
+
+    # The neighbour the destination is reached through, None if it isn't a destination
+    def downstream_of(self, destination):
+        return self.__destinations.get(destination)
 
     def set_state(self, state: Flow_State):
         self.__cond.acquire()
@@ -84,29 +109,34 @@ class Flow_Entry:
         finally:
             self.__cond.release()
 
-    def add_destination(self, destination, upgrade=False):
-        self.__destinations.add(destination)
-        if upgrade:
+    # state: ACTIVE if the destination is the node itself, STREAMING or RELAYING otherwise (see Flow_State)
+    def add_destination(self, destination, downstream=None, state=Flow_State.RELAYING):
+        self.__destinations[destination] = downstream or destination
+        if state == Flow_State.ACTIVE:
             self.set_state(Flow_State.ACTIVE)
         else:
-            self.upgrade_state(Flow_State.STREAMING)
+            self.upgrade_state(state)
 
-    def strip_destinations(self):
-        tmp = self.__destinations
-        self.__destinations = set()
-        self.set_state(Flow_State.HOLD)
-        return tmp
-
-    def rm_destination(self, destination, downgrade=False):
+    # downgrade: the state of the flow if other destinations remain (ex: the node was the destination)
+    def rm_destination(self, destination, downgrade=None):
         if type(destination) is iter:
             for dest in destination:
-                self.__destinations.remove(dest)
+                self.__destinations.pop(dest)
         else:
-            self.__destinations.remove(destination)
+            self.__destinations.pop(destination)
         if len(self.__destinations) <= 0:
             self.set_state(Flow_State.HOLD)
         elif downgrade:
-            self.set_state(Flow_State.STREAMING)
+            self.set_state(downgrade)
+
+    # Drops every destination reached through the given neighbour, returns whether any was dropped
+    def rm_downstream(self, neighbour):
+        lost = [destination for destination, downstream in self.__destinations.items() if downstream == neighbour]
+        for destination in lost:
+            self.__destinations.pop(destination)
+        if lost and len(self.__destinations) <= 0:
+            self.set_state(Flow_State.HOLD)
+        return len(lost) > 0
 
 
 # This table stores the information relative to the different stream data flows that come
@@ -116,9 +146,11 @@ class Flow_Table:
 
     def __init__(self):
         self.__ids = {}  # Support to __table
+        self.__names = {}  # Flow id => flow name, flows are only known by name outside of the node
         self.__origins = {}  # Support to __table keys and origin
         self.__table = {}  # The actual flow table
         self.__lock = RWLock()  # Concurrency lock
+        self.__version = 0  # Bumped on every change of the table's flows or destinations
 
     # Static methods
     @staticmethod
@@ -145,8 +177,12 @@ class Flow_Table:
             self.__lock.release_read()
         return f"{res}/>"
 
-    def __register_key(self, key) -> None:
+    def __register_key(self, key, name=None) -> None:
         flow_id, origin = key
+        if name is not None:
+            known = self.__names.setdefault(flow_id, name)
+            if known != name:
+                logging.warning(f"Flow id {flow_id} is shared by {known} and {name}")
         if flow_id not in self.__ids:
             self.__ids[flow_id] = {origin}
         else:
@@ -160,6 +196,7 @@ class Flow_Table:
         flow_id, origin = key
         if len(self.__ids[flow_id]) <= 1:
             self.__ids.pop(flow_id)
+            self.__names.pop(flow_id, None)
         else:
             self.__ids[flow_id].remove(origin)
         if len(self.__origins[origin]) <= 1:
@@ -169,6 +206,10 @@ class Flow_Table:
 
     # Public Methods
 
+    @property
+    def version(self):
+        return self.__version
+
     def get_origins(self, flow_id) -> set:
         self.__lock.acquire_read()
         try:
@@ -176,10 +217,14 @@ class Flow_Table:
         finally:
             self.__lock.release_read()
 
+    def get_name(self, flow_id):
+        return self.__names.get(flow_id, str(flow_id))
+
+    # Flow names (see get_name)
     def get_flow_ids(self):
         self.__lock.acquire_read()
         try:
-            return self.__ids.keys()
+            return {self.get_name(flow_id) for flow_id in self.__ids}
         finally:
             self.__lock.release_read()
 
@@ -188,27 +233,30 @@ class Flow_Table:
         self.__lock.acquire_read()
         try:
             for flow_id, origins in self.__ids.items():
-                res[flow_id] = min({self.__table[self.key(flow_id, o)].state for o in origins})
+                res[self.get_name(flow_id)] = min({self.__table[self.key(flow_id, o)].state for o in origins})
         finally:
             self.__lock.release_read()
         return res
 
-    def flow_collection(self) -> set:
+    # Every known flow along with its name, {flow_key: name}
+    def flow_collection(self) -> dict:
         self.__lock.acquire_read()
         try:
-            return set(self.__table.keys())
+            return {flow_key: self.get_name(self.flow_id(flow_key)) for flow_key in self.__table}
         finally:
             self.__lock.release_read()
 
-    def merge_flow_collection(self, flow_collection: set):
-        new_flows = set()
+    def merge_flow_collection(self, flow_collection: dict):
+        new_flows = {}
         self.__lock.acquire_write()
         try:
-            for flow_key in flow_collection:
+            for flow_key, name in flow_collection.items():
                 if flow_key not in self.__table:
-                    self.__register_key(flow_key)
+                    self.__register_key(flow_key, name)
                     self.__table[flow_key] = Flow_Entry()
-                    new_flows.add(flow_key)
+                    new_flows[flow_key] = name
+            if new_flows:
+                self.__version += 1
         finally:
             self.__lock.release_write()
         if len(new_flows) > 0:
@@ -222,29 +270,43 @@ class Flow_Table:
         finally:
             self.__lock.release_read()
 
-    def register_supplier(self, flow_key, state=Flow_State.HOLD):
+    def register_supplier(self, flow_key, state=Flow_State.HOLD, name=None):
         self.__lock.acquire_write()
         try:
-            self.__register_key(flow_key)
+            self.__register_key(flow_key, name)
             self.__table[flow_key] = Flow_Entry(state=state)
+            self.__version += 1
         finally:
             self.__lock.release_write()
 
-    def flow_recovery(self, flow_key, destination):
+    def get_upstream(self, flow_key):
+        self.__lock.acquire_read()
+        try:
+            return self.__table[flow_key].upstream
+        except KeyError:
+            raise InvalidFlow(f"No data flow registered for key {flow_key}")
+        finally:
+            self.__lock.release_read()
+
+    # Returns the previous upstream of the flow and its destinations
+    def set_upstream(self, flow_key, upstream):
         self.__lock.acquire_write()
         try:
-            self.__table[flow_key].add_destination(destination)
+            entry = self.__table[flow_key]
+            previous = entry.upstream
+            entry.set_upstream(upstream)
+            return previous, entry.destinations
         except KeyError:
             raise InvalidFlow(f"No data flow registered for key {flow_key}")
         finally:
             self.__lock.release_write()
-        return Flow_Table.origin(flow_key)
 
     def flow_remove(self, flow_key):
         self.__lock.acquire_write()
         try:
             entry = self.__table.pop(flow_key)
             entry.set_state(Flow_State.INVALID)
+            self.__version += 1
         except KeyError:
             raise InvalidFlow(f"No data flow registered for key {flow_key}")
         finally:
@@ -261,63 +323,94 @@ class Flow_Table:
             self.__lock.release_read()
         return entry.await_state()
 
-    def get_destinations(self, flow_key):
+    def get_downstream(self, flow_key):
         self.__lock.acquire_read()
         try:
-            return self.__table[flow_key].destinations
+            return self.__table[flow_key].downstream
         except KeyError:
             raise InvalidFlow(f"No data flow registered for key {flow_key}")
         finally:
             self.__lock.release_read()
 
-    def flow_request(self, flow_key, destination, master):
+    # Maps every flow to the neighbours it is sent to (the master included, if it's a destination)
+    def get_forwarding(self):
+        self.__lock.acquire_read()
+        try:
+            return {flow_key: entry.downstream for flow_key, entry in self.__table.items()}
+        finally:
+            self.__lock.release_read()
+
+    # State of a flow the master sends to others
+    def __forwarding_state(self, flow_key, master):
+        return Flow_State.STREAMING if self.origin(flow_key) == master else Flow_State.RELAYING
+
+    # Every node on the request's path registers the destination, along with the neighbour it came from (downstream)
+    def flow_request(self, flow_key, destination, master, downstream=None):
         origin = self.origin(flow_key)
-        b = master == destination
-        if origin == master or b:
-            self.__lock.acquire_write()
-            try:
-                self.__table[flow_key].add_destination(destination, upgrade=b)
-            except KeyError:
-                raise InvalidFlow(f"No data flow registered for key {flow_key}")
-            finally:
-                self.__lock.release_write()
+        state = Flow_State.ACTIVE if master == destination else self.__forwarding_state(flow_key, master)
+        self.__lock.acquire_write()
+        try:
+            self.__table[flow_key].add_destination(destination, downstream, state)
+            self.__version += 1
+        except KeyError:
+            raise InvalidFlow(f"No data flow registered for key {flow_key}")
+        finally:
+            self.__lock.release_write()
         if origin != master:
             return origin
         return None
 
-    def flow_renunciation(self, flow_key, destination, master):
-        origin = self.origin(flow_key)
-        x = master == destination
-        if destination == origin:
-            self.__lock.acquire_write()
-            try:
-                self.__table[flow_key].rm_destination(destination, downgrade=x)
-            except KeyError:
-                raise InvalidFlow(f"No data flow registered for key {flow_key}")
-            finally:
-                self.__lock.release_write()
-            return origin
+    # Every node on the request's path drops the destination, as long as it's reached through the neighbour the cancel
+    # came from (downstream, the destination itself if None), other cancels are ignored (ex: the destination's branch
+    # moved to another neighbour meanwhile). Returns the upstream neighbour the cancel goes on to, if any.
+    def flow_renunciation(self, flow_key, destination, master, downstream=None):
+        downgrade = self.__forwarding_state(flow_key, master) if master == destination else None
+        self.__lock.acquire_write()
+        try:
+            entry = self.__table[flow_key]
+            if entry.downstream_of(destination) != (downstream or destination):
+                return None
+            entry.rm_destination(destination, downgrade)
+            self.__version += 1
+            return entry.upstream
+        except KeyError:
+            return None
+        finally:
+            self.__lock.release_write()
 
+    # Applies the routing changes to the flows, heavy are the nodes whose route got longer and critical the lost ones
+    #   - Flows of lost origins are removed, lost destinations are dropped.
+    #   - The branches behind a neighbour that got heavier or was lost are dropped (a neighbour only gets heavier once
+    #     its link is gone), their destinations request the flow again through another path.
+    #   - Flows whose origin got heavier or whose upstream neighbour is gone keep their destinations, they are to be
+    #     moved to the current route towards their origin (see Node.reroute).
+    # Returns the flows to be rerouted, along with the removed ones the master was a destination of
     def clean_flows(self, master, heavy: set, critical: set):
         losses = set()
         if len(heavy) > 0 or len(critical) > 0:
+            changed = heavy.union(critical)
             self.__lock.acquire_write()
             try:
-                for node in heavy.union(critical):
-                    rm = node in critical
-                    if node in self.__origins:
-                        for flow_id in self.__origins[node]:
-                            key = Flow_Table.key(flow_id, node)
-                            if master in self.__table[key].strip_destinations():
-                                losses.add(key)
-                            if rm:
-                                self.__remove_key(key)
-                                self.__table.pop(key)
-                    for key in self.__table:
-                        try:
-                            self.__table[key].rm_destination(node)
-                        except KeyError:
-                            pass
+                for node in critical:
+                    for flow_id in list(self.__origins.get(node, ())):
+                        key = Flow_Table.key(flow_id, node)
+                        entry = self.__table.pop(key)
+                        if master in entry.destinations:
+                            losses.add(key)
+                        entry.set_state(Flow_State.INVALID)
+                        self.__remove_key(key)
+                for key, entry in self.__table.items():
+                    for node in changed:
+                        if node in critical and entry.downstream_of(node) is not None:
+                            entry.rm_destination(node)
+                        entry.rm_downstream(node)
+                    if entry.upstream in changed:
+                        entry.set_upstream(None)
+                        if entry.destinations:
+                            losses.add(key)
+                    elif self.origin(key) in heavy and entry.destinations:
+                        losses.add(key)
+                self.__version += 1
             finally:
                 self.__lock.release_write()
         return losses
@@ -326,21 +419,23 @@ class Flow_Table:
         self.__lock.acquire_write()
         try:
             self.__ids.clear()
+            self.__names.clear()
             self.__origins.clear()
             for _, entry in self.__table.items():
                 entry.cancel()
             self.__table.clear()
+            self.__version += 1
         finally:
             self.__lock.release_write()
 
     def get_keys(self, origins):
-        res = set()
+        res = {}
         self.__lock.acquire_read()
         try:
             for node in origins:
                 try:
                     for flow_id in self.__origins[node]:
-                        res.add(self.key(flow_id, node))
+                        res[self.key(flow_id, node)] = self.get_name(flow_id)
                 except KeyError:
                     pass
         finally:
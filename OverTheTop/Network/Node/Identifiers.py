@@ -0,0 +1,36 @@
+import hashlib
+import uuid
+
+# Node and flow identifiers are small integers, they are compared, hashed and serialized in every hot path (flow
+# headers, distance vectors, flow tables). Their textual forms are only used at the API/UI boundary.
+NODE_ID_BITS = 64
+FLOW_ID_BITS = 32
+NODE_ID_MASK = (1 << NODE_ID_BITS) - 1
+
+
+class InvalidIdentifier(ValueError):
+    pass
+
+
+# Random 64 bit id, unique overlay wide (with overwhelming probability) without any negotiation
+def new_node_id() -> int:
+    return uuid.uuid4().int & NODE_ID_MASK
+
+
+def node_label(node_id) -> str:
+    return f"{node_id:016x}"
+
+
+# Accepts both the integer id and its label
+def parse_node_id(node_id) -> int:
+    if type(node_id) is int:
+        return node_id
+    try:
+        return int(node_id, 16)
+    except (TypeError, ValueError):
+        raise InvalidIdentifier(f"{node_id} is not a valid node id")
+
+
+# Flows are identified by a 32 bit digest of their name, therefore every origin of the same content agrees on its id
+def flow_number(name) -> int:
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=FLOW_ID_BITS // 8).digest(), 'big')
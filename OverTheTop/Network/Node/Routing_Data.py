@@ -1,3 +1,4 @@
+import math
 from operator import itemgetter
 from threading import RLock
 
@@ -8,6 +9,9 @@ from Utils.threading_extra import RWLock
 # and the second key represents the next node.
 # The value represents the cost of traveling to the second key node through the first key node
 
+# Distance vector deltas are numbered per neighbour, the numbers are 32 bit and wrap around
+DELTA_SEQUENCE_MASK = 0xFFFFFFFF
+
 
 class NoRoute(Exception):
     pass
@@ -17,6 +21,10 @@ class InvalidNode(LookupError):
     pass
 
 
+class OutOfSequence(Exception):
+    pass
+
+
 class Routing_Table:
 
     def __init__(self):
@@ -28,6 +36,13 @@ class Routing_Table:
         # The global distance vector
         self.__global_distance_vector = {}
         self.__gdv_lock = RWLock()
+        # Bumped whenever the global distance vector changes, allows routing decisions to be cached
+        self.__version = 0
+        # Incremental distance vectors (see gen_distance_vector_delta), the advertisement lock is taken after the gdv's
+        self.__advertised = {}  # neighbour => (sequence, {destination: cost}), the vector the neighbour was sent
+        self.__pending = {}  # neighbour => destinations of the global distance vector that changed since
+        self.__advertised_lock = RLock()
+        self.__received = {}  # neighbour => sequence of the last delta applied, None while awaiting a whole vector
 
     # Private Methods
     def __gen_global_vector(self):
@@ -39,8 +54,18 @@ class Routing_Table:
     def __str__(self):
         return f"<RoutingTable(table: {self.__table}, gdv: {self.__global_distance_vector})>"
 
-    def __update_gdv(self, new_gdv: dict):
-        sym_diff = {k for k, _ in set(self.__global_distance_vector.items()).symmetric_difference(set(new_gdv.items()))}
+    # Routes of the given destinations, None for the unreachable ones (must hold the table lock)
+    def __gen_routes(self, destinations):
+        return {n: min(self.__table[n].items(), key=itemgetter(1, 0)) if n in self.__table else None
+                for n in destinations}
+
+    # keys: the only destinations that may have changed, every one of them is compared otherwise
+    def __update_gdv(self, new_gdv: dict, keys=None):
+        if keys is None:
+            old_items = set(self.__global_distance_vector.items())
+            sym_diff = {k for k, _ in old_items.symmetric_difference(set(new_gdv.items()))}
+        else:
+            sym_diff = {k for k in keys if self.__global_distance_vector.get(k) != new_gdv.get(k)}
         new, light, heavy, lost = set(), set(), set(), set()
         for key in sym_diff:
             if key in self.__global_distance_vector:
@@ -54,11 +79,38 @@ class Routing_Table:
             else:
                 new.add(key)
         self.__global_distance_vector = new_gdv
+        if sym_diff:
+            self.__version += 1
+            self.__advertised_lock.acquire()
+            try:
+                for pending in self.__pending.values():
+                    pending.update(sym_diff)
+            finally:
+                self.__advertised_lock.release()
 
         return new, light, heavy, lost
 
+    # The distance vector of a neighbour out of a global distance vector, without the routes through the neighbour
+    @staticmethod
+    def __distance_vector(gdv, neighbour_id):
+        return {route: cost for route, (gateway, cost) in gdv.items()
+                if route != neighbour_id and gateway != neighbour_id}
+
+    def __forget_neighbour(self, neighbour_id):
+        self.__received.pop(neighbour_id, None)
+        self.__advertised_lock.acquire()
+        try:
+            self.__advertised.pop(neighbour_id, None)
+            self.__pending.pop(neighbour_id, None)
+        finally:
+            self.__advertised_lock.release()
+
     # Public Methods
 
+    @property
+    def version(self):
+        return self.__version
+
     # Updates the current table based on the distance vector provided from the neighbour with the specific connection
     # Returns the resulting distance vector changes
     def update(self, neighbour_id, connection_cost=0, distance_vector: dict = None):
@@ -81,6 +133,8 @@ class Routing_Table:
             # Register new table nodes (aka the remaining keys in the distance vector)
             for k in distance_vector:
                 self.__table[k] = {neighbour_id: distance_vector[k] + connection_cost}
+            # Deltas of the neighbour continue from its whole vector
+            self.__received[neighbour_id] = 0
         finally:
             new_vector = self.__gen_global_vector()
             self.__gdv_lock.acquire_write()
@@ -90,27 +144,104 @@ class Routing_Table:
         finally:
             self.__gdv_lock.release_write()
 
-    # Generates a distance vector for the given neighbour_id
-    def gen_distance_vector(self, neighbour_id):
+    # Applies the entries of a neighbour's distance vector that changed since its previous one (see
+    # gen_distance_vector_delta), only the routes of those destinations are computed again
+    # Raises OutOfSequence once a delta went missing, the following ones are ignored until the neighbour's whole
+    # vector is received (see update), as are the deltas of unregistered neighbours
+    def update_delta(self, neighbour_id, connection_cost, sequence, changed: dict, withdrawn):
+        self.__table_lock.acquire()
+        try:
+            last = self.__received.get(neighbour_id)
+            if last is None:
+                return set(), set(), set(), set()
+            if sequence != (last + 1) & DELTA_SEQUENCE_MASK:
+                self.__received[neighbour_id] = None
+                raise OutOfSequence(f"Expected delta {(last + 1) & DELTA_SEQUENCE_MASK} of {neighbour_id}, "
+                                    f"got {sequence}")
+            self.__received[neighbour_id] = sequence
+            # The route to the neighbour itself only goes away with the neighbour (see remove_node)
+            for k in withdrawn:
+                routes = self.__table.get(k)
+                if routes is not None and k != neighbour_id:
+                    routes.pop(neighbour_id, None)
+                    if len(routes) == 0:
+                        self.__table.pop(k)
+            for k, cost in changed.items():
+                if k != neighbour_id:
+                    self.__table.setdefault(k, {})[neighbour_id] = cost + connection_cost
+            keys = set(changed).union(withdrawn)
+            routes = self.__gen_routes(keys)
+            self.__gdv_lock.acquire_write()
+        finally:
+            self.__table_lock.release()
+        try:
+            new_vector = self.__global_distance_vector.copy()
+            for k, route in routes.items():
+                if route is None:
+                    new_vector.pop(k, None)
+                else:
+                    new_vector[k] = route
+            return self.__update_gdv(new_vector, keys)
+        finally:
+            self.__gdv_lock.release_write()
+
+    # Generates the whole distance vector of the neighbour, its deltas start over from it
+    # Must be sent before any later delta (see gen_distance_vector_deltas)
+    def gen_full_distance_vector(self, neighbour_id):
         self.__gdv_lock.acquire_read()
         try:
-            pre_vector = self.__global_distance_vector.copy()
+            vector = self.__distance_vector(self.__global_distance_vector, neighbour_id)
+            self.__advertised_lock.acquire()
+            try:
+                self.__advertised[neighbour_id] = (0, vector.copy())
+                self.__pending[neighbour_id] = set()
+            finally:
+                self.__advertised_lock.release()
         finally:
             self.__gdv_lock.release_read()
-        pre_vector.pop(neighbour_id, None)
-        vector = {}
-        for route, v in pre_vector.items():
-            gateway, cost = v
-            if gateway != neighbour_id:
-                vector[route] = cost
         return vector
 
-    def gen_distance_vectors(self, neighbours):
+    # Returns the entries of the neighbour's distance vector that changed since the last vector (or delta) it was sent,
+    # as (sequence, {destination: cost}, [withdrawn destination]), only the destinations whose route changed meanwhile
+    # are compared. Returns None if nothing changed or if the neighbour was never sent its whole vector.
+    # New (or shorter) routes through the held gateways stay pending (see Routing_Scheduler)
+    def __gen_distance_vector_delta(self, neighbour_id, held=()):
+        state = self.__advertised.get(neighbour_id)
+        pending = self.__pending.get(neighbour_id)
+        if state is None or not pending:
+            return None
+        self.__pending[neighbour_id] = kept = set()
+        sequence, vector = state
+        changed, withdrawn = {}, []
+        for destination in pending:
+            route = self.__global_distance_vector.get(destination)
+            if route is None or destination == neighbour_id or route[0] == neighbour_id:
+                if destination in vector:
+                    del vector[destination]
+                    withdrawn.append(destination)
+            elif route[0] in held and route[1] < vector.get(destination, math.inf):
+                kept.add(destination)
+            elif vector.get(destination) != route[1]:
+                vector[destination] = changed[destination] = route[1]
+        if not (changed or withdrawn):
+            return None
+        sequence = (sequence + 1) & DELTA_SEQUENCE_MASK
+        self.__advertised[neighbour_id] = (sequence, vector)
+        return sequence, changed, withdrawn
+
+    # Generates the deltas of the given neighbours, {neighbour: delta}, neighbours with nothing to be sent are left out
+    # held: gateways whose new (or shorter) routes are held down
+    def gen_distance_vector_deltas(self, neighbours, held=()):
         self.__gdv_lock.acquire_read()
         try:
-            return {n: self.gen_distance_vector(n) for n in neighbours}
+            self.__advertised_lock.acquire()
+            try:
+                deltas = {n: self.__gen_distance_vector_delta(n, held) for n in neighbours}
+            finally:
+                self.__advertised_lock.release()
         finally:
             self.__gdv_lock.release_read()
+        return {n: delta for n, delta in deltas.items() if delta is not None}
 
     def __next_node_modular(self, destination, tuple_target):
         self.__gdv_lock.acquire_read()
@@ -162,6 +293,7 @@ class Routing_Table:
                 self.__table[n].pop(neighbour_id, None)
                 if len(self.__table[n]) == 0:
                     self.__table.pop(n)
+            self.__forget_neighbour(neighbour_id)
         except KeyError:
             raise InvalidNode(f"The neighbour {neighbour_id} is not registered in the routing table")
         else:
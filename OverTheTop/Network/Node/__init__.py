@@ -2,20 +2,11 @@ import logging
 from operator import itemgetter
 
 from OverTheTop.Network.Node.Flow_Data import Flow_Table, InvalidFlow
-from OverTheTop.Network.Node.Routing_Data import Routing_Table
+from OverTheTop.Network.Node.Identifiers import flow_number, node_label
+from OverTheTop.Network.Node.Routing_Data import NoRoute, Routing_Table
 from Utils.str_extra import add_tabs
 
 
-def invert_dict(dictionary: dict):
-    res = {}
-    for k, v in dictionary.items():
-        if v in res:
-            res[v].add(k)
-        else:
-            res[v] = {k}
-    return res
-
-
 class Node:
 
     def __init__(self, node_id, name=None):
@@ -35,24 +26,38 @@ class Node:
     def node_id(self):
         return self.__node_id
 
+    # Changes whenever the routing or the flow table does, cached forwarding decisions are valid while it holds
+    # (both counters only grow, therefore so does their sum)
+    @property
+    def version(self):
+        return self.__route.version + self.__flow.version
+
     def __str__(self):
-        return (f"<Node:\n\tID: {add_tabs(self.__node_id)}\n" +
+        return (f"<Node:\n\tID: {add_tabs(node_label(self.__node_id))}\n" +
                 f"\tRouting:\n{add_tabs(self.__route, n_tabs=2)}\n\tFlow:\n{add_tabs(self.__flow, n_tabs=2)}\n>")
 
+    # Returns None if the routes didn't change, (losses, collection, worse) otherwise, where worse tells whether routes
+    # were lost or got longer (as opposed to new or shorter ones only)
     def __process_changes(self, dva_changes):
         new, light, heavy, lost = dva_changes
         if len(heavy) > 0 or len(lost) > 0:
             losses = self.__flow.clean_flows(self.__node_id, heavy, lost)
             collection = self.__flow.get_keys(heavy)
-            return losses, collection
+            return losses, collection, True
         if len(light) + len(new) > 0:
-            return set(), set()
+            return set(), set(), False
         return None
 
     def receive_distance_vector(self, neighbour_id, distance_vector, cost=1):
         dva = self.__route.update(neighbour_id, cost, distance_vector)
         return self.__process_changes(dva)
 
+    # delta: (sequence, {destination: cost}, [withdrawn destination]), see Routing_Table.update_delta
+    def receive_distance_vector_delta(self, neighbour_id, delta, cost=1):
+        sequence, changed, withdrawn = delta
+        dva = self.__route.update_delta(neighbour_id, cost, sequence, changed, withdrawn)
+        return self.__process_changes(dva)
+
     def new_neighbour(self, neighbour_id, cost=1):
         return self.__process_changes(self.__route.update(neighbour_id, cost))
 
@@ -60,23 +65,26 @@ class Node:
         dva = self.__route.remove_node(neighbour_id)
         return self.__process_changes(dva)
 
-    def next_gateways(self, destinations):
+    # Returns the neighbours a flow is sent to and whether the node itself is one of its destinations
+    def downstream(self, flow_key):
         try:
-            destinations.remove(self.__node_id)
-            local = True
+            neighbours = self.__flow.get_downstream(flow_key)
+        except InvalidFlow:
+            return set(), False
+        try:
+            neighbours.remove(self.__node_id)
+            return neighbours, True
         except KeyError:
-            local = False
-        node_to_gateway, _ = self.__route.next_nodes(destinations)
-        return invert_dict(node_to_gateway), local
+            return neighbours, False
 
-    def destinations(self, flow_key):
-        return self.__flow.get_destinations(flow_key)
+    def forwarding(self):
+        return self.__flow.get_forwarding()
 
-    def gen_distance_vector(self, neighbour):
-        return self.__route.gen_distance_vector(neighbour)
+    def gen_full_distance_vector(self, neighbour):
+        return self.__route.gen_full_distance_vector(neighbour)
 
-    def gen_distance_vectors(self, neighbours):
-        return self.__route.gen_distance_vectors(neighbours)
+    def gen_distance_vector_deltas(self, neighbours, held=()):
+        return self.__route.gen_distance_vector_deltas(neighbours, held)
 
     def flow_collection(self):
         return self.__flow.flow_collection()
@@ -84,20 +92,35 @@ class Node:
     def receive_flow_collection(self, flow_collection):
         return self.__flow.merge_flow_collection(flow_collection)
 
-    def __process_flow_request(self, flow_key, destination):
-        supplier = self.__flow.flow_request(flow_key, destination, self.__node_id)
+    # Requests go on to the flow's upstream neighbour, the next node towards its origin unless it was requested before
+    # (every destination of a flow gets it through the same neighbour, until it's rerouted)
+    def __process_flow_request(self, flow_key, destination, downstream=None):
+        supplier = self.__flow.flow_request(flow_key, destination, self.__node_id, downstream)
         if supplier and supplier != self.__node_id:
-            return self.__route.next_node(supplier)
+            upstream = self.__flow.get_upstream(flow_key)
+            if upstream is None:
+                upstream = self.__route.next_node(supplier)
+                self.__flow.set_upstream(flow_key, upstream)
+            return upstream
         return None
 
-    def flow_recovery(self, flow_key):
+    # Moves a flow to the current route towards its origin, returns (previous upstream, upstream, requests) where the
+    # requests (one per destination of the flow) are to be sent to the upstream and their cancels to the previous one,
+    # if they differ. Returns None if the flow is gone or its origin can't be reached.
+    def reroute(self, flow_key):
+        origin = Flow_Table.origin(flow_key)
+        if origin == self.__node_id:
+            return None, None, []
         try:
-            return self.__process_flow_request(flow_key, self.__node_id), \
-                   (flow_key, self.__node_id)
-        except InvalidFlow:
-            return None, None
+            upstream = self.__route.next_node(origin)
+            previous, destinations = self.__flow.set_upstream(flow_key, upstream)
+        except (NoRoute, InvalidFlow):
+            return None
+        return previous, upstream, [(flow_key, destination) for destination in destinations]
 
-    def flow_request(self, flow_id, origin=None):
+    # Flows are requested by name
+    def flow_request(self, name, origin=None):
+        flow_id = flow_number(name)
         if origin is None:
             origins = self.__flow.get_origins(flow_id)
             if self.__node_id in origins:
@@ -105,27 +128,23 @@ class Node:
                 logging.debug(f"Requesting flow {flow_id} from local streamer")
             else:
                 origins, _ = self.__route.next_nodes_costs(origins)
-                origin = min(origins, key=itemgetter(1))
+                origin, _ = min(origins.items(), key=itemgetter(1))
                 logging.debug(f"Requesting flow {flow_id} from source {origin}")
 
         flow_key = Flow_Table.key(flow_id, origin)
         return self.__process_flow_request(flow_key, self.__node_id), flow_key, (flow_key, self.__node_id)
 
-    def handle_flow_request(self, flow_request):
+    def handle_flow_request(self, flow_request, neighbour_id):
         flow_key, destination = flow_request
-        return self.__process_flow_request(flow_key, destination)
-
-    def __process_flow_cancel(self, flow_key, destination):
-        supplier = self.__flow.flow_renunciation(flow_key, destination, self.__node_id)
-        if supplier is not None:
-            return self.__route.next_node(supplier)
+        return self.__process_flow_request(flow_key, destination, neighbour_id)
 
+    # Cancels go on to the upstream neighbour the flow was requested from
     def flow_cancel(self, flow_key):
-        return self.__process_flow_cancel(flow_key, self.__node_id), (flow_key, self.__node_id)
+        return self.__flow.flow_renunciation(flow_key, self.__node_id, self.__node_id), (flow_key, self.__node_id)
 
-    def handle_flow_cancel(self, flow_request):
+    def handle_flow_cancel(self, flow_request, neighbour_id):
         flow_key, destination = flow_request
-        return self.__process_flow_cancel(flow_key, destination)
+        return self.__flow.flow_renunciation(flow_key, destination, self.__node_id, neighbour_id)
 
     def next_node(self, destination):
         return self.__route.next_node(destination)
@@ -133,17 +152,20 @@ class Node:
     def next_nodes(self, destinations):
         return self.__route.next_nodes(destinations)
 
-    def announcement(self, flow_key) -> bool:
+    def announcement(self, flow_key, name) -> bool:
         if not self.__flow.contains_key(flow_key):
-            self.__flow.register_supplier(flow_key)
+            self.__flow.register_supplier(flow_key, name=name)
             return True
         return False
 
-    def register_flow(self, flow_id):
-        flow_key = (flow_id, self.__node_id)
-        self.__flow.register_supplier(flow_key)
+    def register_flow(self, name):
+        flow_key = Flow_Table.key(flow_number(name), self.__node_id)
+        self.__flow.register_supplier(flow_key, name=name)
         return flow_key
 
+    def flow_name(self, flow_key):
+        return self.__flow.get_name(Flow_Table.flow_id(flow_key))
+
     def get_flow_ids(self):
         return self.__flow.get_flow_ids()
 
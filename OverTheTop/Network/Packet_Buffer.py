@@ -0,0 +1,84 @@
+import threading
+
+from OverTheTop import defaults as c
+
+
+# A preallocated receive buffer lent by a Buffer_Pool.
+# Ownership: the buffer is reference counted. The dispatcher that fills it holds the first reference, which is
+# handed over to whoever takes the packet out of the input buffer. Every additional holder (ex: an output entry
+# that still has to send the payload) must retain() it, and every holder must release() it once it no longer
+# touches the memory. When the last reference is released the buffer returns to its pool and is overwritten,
+# therefore any data that has to outlive the packet (ex: chunks handed to a player) must be copied out first.
+class Packet_Buffer:
+    __slots__ = ('__pool', '__data', '__length', '__references')
+
+    def __init__(self, pool, size):
+        self.__pool = pool
+        self.__data = bytearray(size)
+        self.__length = 0
+        self.__references = 0
+
+    def __len__(self):
+        return self.__length
+
+    @property
+    def data(self) -> bytearray:
+        return self.__data
+
+    @property
+    def view(self) -> memoryview:
+        return memoryview(self.__data)[:self.__length]
+
+    def fill(self, length):
+        self.__length = length
+
+    def retain(self):
+        self.__pool.retain(self)
+        return self
+
+    def release(self):
+        self.__pool.release(self)
+
+    # Reference counting is serialized by the pool lock
+    def _adjust_references(self, delta):
+        self.__references += delta
+        return self.__references
+
+
+class Buffer_Pool:
+
+    def __init__(self, buffer_size=c.DEFAULT_PACKET_SIZE, capacity=c.DEFAULT_BUFFER_POOL_SIZE):
+        self.__buffer_size = buffer_size
+        self.__capacity = capacity
+        self.__lock = threading.Lock()
+        self.__free = [Packet_Buffer(self, buffer_size) for _ in range(capacity)]
+
+    def __str__(self):
+        return f"<Buffer_Pool(free: {len(self.__free)}/{self.__capacity}, size: {self.__buffer_size})>"
+
+    # Lends a buffer with a single reference. If the pool is exhausted a new buffer is allocated, it will be
+    # discarded instead of being pooled if the pool is already full when it's released.
+    def acquire(self) -> Packet_Buffer:
+        self.__lock.acquire()
+        try:
+            buffer = self.__free.pop() if self.__free else Packet_Buffer(self, self.__buffer_size)
+            buffer._adjust_references(1)
+        finally:
+            self.__lock.release()
+        buffer.fill(0)
+        return buffer
+
+    def retain(self, buffer: Packet_Buffer):
+        self.__lock.acquire()
+        try:
+            buffer._adjust_references(1)
+        finally:
+            self.__lock.release()
+
+    def release(self, buffer: Packet_Buffer):
+        self.__lock.acquire()
+        try:
+            if buffer._adjust_references(-1) == 0 and len(self.__free) < self.__capacity:
+                self.__free.append(buffer)
+        finally:
+            self.__lock.release()
@@ -0,0 +1,94 @@
+import logging
+import struct
+import threading
+from collections import deque
+
+from OverTheTop import defaults as c
+from OverTheTop.Network.Flow_Packet import FLAG_PARITY, Flow_Packet, InvalidPacket
+from OverTheTop.Network.Fragmentation import Reassembler
+
+FRAGMENT_INDEX = struct.Struct('!H')
+
+
+# The datagrams of the latest frames of every flow going through the node, replayed to whoever joins the flow (a
+# local player or a downstream neighbour) so it can start playing without waiting for frames to build up.
+# Frames are bounded per flow both in count (frames) and in bytes (budget), the oldest ones being evicted first.
+# Datagrams are kept as relayed by the node (its hop field in place) therefore they are replayed as they are, a flow's
+# first frame is only cached from its first datagram on. Parity datagrams aren't kept.
+# Datagrams are copied unless their buffers are never recycled (ex: the frames of a memory mapped source).
+class Recent_Frames:
+
+    def __init__(self, frames=c.DEFAULT_RECENT_FRAMES, budget=c.DEFAULT_RECENT_FRAMES_BUDGET):
+        self.__frames = frames
+        self.__budget = budget
+        self.__flows = {}  # flow_key => deque([parts])
+        self.__sizes = {}  # flow_key => bytes
+        self.__lock = threading.Lock()
+
+    def __str__(self):
+        return f"<Recent_Frames({len(self.__flows)} flows, {sum(self.__sizes.values())} bytes)/>"
+
+    # parts: the buffers of a flow datagram, as given to sendmsg, its header is in the first one
+    # copy: whether the buffers may be recycled (ex: pooled receive buffers) once the call returns
+    def add(self, flow_key, parts, copy=True):
+        if not self.__frames or parts[0][1] & FLAG_PARITY:
+            return
+        (index,) = FRAGMENT_INDEX.unpack_from(parts[0], Flow_Packet.FRAGMENT_INDEX_OFFSET)
+        starts_frame = index == 0
+        self.__lock.acquire()
+        try:
+            frames = self.__flows.get(flow_key)
+            if frames is None:
+                if not starts_frame:
+                    return
+                frames = self.__flows[flow_key] = deque()
+                self.__sizes[flow_key] = 0
+            datagram = (b''.join(parts),) if copy else tuple(parts)
+            if starts_frame:
+                frames.append([datagram])
+            else:
+                frames[-1].append(datagram)
+            size = self.__sizes[flow_key] + sum(len(part) for part in datagram)
+            while len(frames) > self.__frames or (size > self.__budget and len(frames) > 1):
+                size -= sum(len(part) for evicted in frames.popleft() for part in evicted)
+            self.__sizes[flow_key] = size
+        finally:
+            self.__lock.release()
+
+    # Returns the cached datagrams (parts) of the flow, oldest first
+    def datagrams(self, flow_key):
+        self.__lock.acquire()
+        try:
+            return [datagram for frame in self.__flows.get(flow_key, ()) for datagram in frame]
+        finally:
+            self.__lock.release()
+
+    # Returns the cached frames of the flow as chunks (frame_num, payload), oldest first, incomplete frames are skipped
+    def chunks(self, flow_key):
+        reassembler = Reassembler()
+        chunks = []
+        for datagram in self.datagrams(flow_key):
+            try:
+                packet = Flow_Packet.unpack(b''.join(datagram))
+            except InvalidPacket:
+                logging.debug("Discarded malformed cached datagram", exc_info=True)
+                continue
+            chunk = reassembler.add(flow_key, packet.fragment, packet.chunk)
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    def flows(self):
+        self.__lock.acquire()
+        try:
+            return list(self.__flows)
+        finally:
+            self.__lock.release()
+
+    def forget(self, flow_key):
+        self.__lock.acquire()
+        try:
+            self.__flows.pop(flow_key, None)
+            self.__sizes.pop(flow_key, None)
+        finally:
+            self.__lock.release()
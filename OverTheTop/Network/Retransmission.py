@@ -0,0 +1,84 @@
+import struct
+import threading
+from collections import OrderedDict
+
+from OverTheTop import defaults as c
+from OverTheTop.Network.Flow_Packet import FLAG_NACK, FLAG_PARITY, SEQUENCE_MASK, Flow_Packet
+
+SEQUENCE = struct.Struct('!I')
+
+
+# Builds the NACK datagram a node (hop) sends to its upstream neighbour for count datagrams of a flow, starting at
+# sequence first (see FLAG_NACK). It carries the flow hash as any other flow datagram, therefore it reaches the data
+# plane worker that relays the flow.
+def nack_datagram(flow_key, hop, first, count) -> bytes:
+    return Flow_Packet.template(flow_key, hop).pack(0, (first, 0, count), FLAG_NACK)
+
+
+# Recently sent datagrams, per outgoing neighbour (address), keyed by flow and sequence number.
+# Every ring is bounded by budget bytes, the oldest datagrams being evicted first. A datagram sent to several
+# neighbours is copied once and shared by their rings, datagrams whose buffers are never recycled (ex: the frames of a
+# memory mapped source) aren't copied at all. Parity datagrams (see FEC) aren't kept, their sequence numbers are the
+# ones of the data datagrams they protect.
+# Relayed datagrams live in recycled receive buffers and must be copied, therefore the cache is opt-in (no budget by
+# default) and NACKs are only sent by nodes that cache.
+class Retransmission_Cache:
+
+    def __init__(self, budget=c.DEFAULT_RETRANSMISSION_BUDGET):
+        self.__budget = budget
+        self.__rings = {}  # address => OrderedDict((flow_key, sequence) => parts)
+        self.__sizes = {}  # address => bytes
+        self.__lock = threading.Lock()
+
+    def __str__(self):
+        return f"<Retransmission_Cache({len(self.__rings)} neighbours, {sum(self.__sizes.values())} bytes)/>"
+
+    @property
+    def enabled(self):
+        return bool(self.__budget)
+
+    # parts: the buffers of a flow datagram, as given to sendmsg, its header is in the first one
+    # copy: whether the buffers may be recycled (ex: pooled receive buffers) once the call returns
+    def add(self, flow_key, parts, addresses, copy=True):
+        if not self.__budget or parts[0][1] & FLAG_PARITY:
+            return
+        (sequence,) = SEQUENCE.unpack_from(parts[0], Flow_Packet.SEQUENCE_OFFSET)
+        datagram = (b''.join(parts),) if copy else tuple(parts)
+        length = sum(len(part) for part in datagram)
+        key = (flow_key, sequence)
+        self.__lock.acquire()
+        try:
+            for address in addresses:
+                ring = self.__rings.get(address)
+                if ring is None:
+                    ring = self.__rings[address] = OrderedDict()
+                    self.__sizes[address] = 0
+                previous = ring.pop(key, None)
+                size = self.__sizes[address] + length - (sum(len(part) for part in previous) if previous else 0)
+                ring[key] = datagram
+                while size > self.__budget and ring:
+                    _, evicted = ring.popitem(last=False)
+                    size -= sum(len(part) for part in evicted)
+                self.__sizes[address] = size
+        finally:
+            self.__lock.release()
+
+    # Returns the cached datagrams (parts), sent to address, of count sequence numbers of the flow starting at first
+    def get(self, flow_key, address, first, count):
+        self.__lock.acquire()
+        try:
+            ring = self.__rings.get(address)
+            if ring is None:
+                return []
+            datagrams = (ring.get((flow_key, (first + offset) & SEQUENCE_MASK)) for offset in range(count))
+            return [datagram for datagram in datagrams if datagram is not None]
+        finally:
+            self.__lock.release()
+
+    def forget(self, address):
+        self.__lock.acquire()
+        try:
+            self.__rings.pop(address, None)
+            self.__sizes.pop(address, None)
+        finally:
+            self.__lock.release()
@@ -0,0 +1,201 @@
+import logging
+import math
+import threading
+import time
+
+from OverTheTop import defaults as c
+
+
+# Flap damping state of a neighbour, its penalty decays exponentially (halved every half life) from the given time
+class Damping:
+    __slots__ = ('penalty', 'time', 'suppressed')
+
+    def __init__(self, now):
+        self.penalty = 0.0
+        self.time = now
+        self.suppressed = False
+
+    def decay(self, now, half_life):
+        if half_life:
+            self.penalty *= 0.5 ** ((now - self.time) / half_life)
+        self.time = now
+        return self.penalty
+
+
+# Schedules the distance vectors (deltas, see Routing_Table) sent to the neighbours, instead of flooding them on every
+# routing change.
+#   - Coalescing: a change is sent window seconds after it happened, along with every later change until then (the
+#     routing table keeps the destinations changed per neighbour, therefore a flush only sends their latest routes).
+#   - Rate limiting: a neighbour is sent new (or shorter) routes at most once every min_interval seconds.
+#   - Flap damping: every time a neighbour's link goes down it earns a penalty, which decays exponentially. Once it
+#     exceeds suppress the neighbour is held down until its penalty decays below reuse, the routes it brings back
+#     meanwhile only reach the other neighbours once the hold down is over. Their changes have their own due times,
+#     other changes flushed earlier leave out the routes through the held down neighbours (see flush). Penalties are
+#     capped so a neighbour is never held down for more than max_hold_down seconds.
+# Lost (or longer) routes are neither rate limited nor held down, they are sent as soon as the window is over so the
+# neighbours stop using them.
+# Vectors are sent by flush(neighbours, held), called by the scheduler's worker (see run), never by the threads
+# reporting the changes. held is the set of neighbours still held down, the new (or shorter) routes through them must
+# be kept pending. The worker also calls resync() every resync_period seconds, so the neighbours get their whole
+# vectors.
+class Routing_Scheduler:
+
+    def __init__(self, flush, resync=None, window=c.DEFAULT_ROUTING_UPDATE_WINDOW,
+                 min_interval=c.DEFAULT_ROUTING_UPDATE_INTERVAL, penalty=c.FLAP_PENALTY, suppress=c.FLAP_SUPPRESS,
+                 reuse=c.FLAP_REUSE, half_life=c.FLAP_HALF_LIFE, max_hold_down=c.MAX_HOLD_DOWN,
+                 resync_period=c.DEFAULT_DISTANCE_VECTOR_RESYNC_PERIOD, forget=c.FLAP_FORGET):
+        self.__flush = flush
+        self.__resync = resync
+        self.__resync_period = resync_period if resync else None
+        self.__window = window
+        self.__min_interval = min_interval
+        self.__penalty = penalty
+        self.__suppress = suppress
+        self.__reuse = reuse
+        self.__half_life = half_life
+        self.__forget = forget
+        self.__max_penalty = reuse * 2 ** (max_hold_down / half_life) if half_life else suppress
+        self.__due = {}  # neighbour => time its pending changes are sent
+        self.__held = {}  # neighbour => {held down source: time the changes it caused are sent}
+        self.__last = {}  # neighbour => time it was last sent its changes
+        self.__damping = {}  # neighbour => Damping
+        self.__stopped = False
+        self.__lock = threading.Condition()
+
+    def __str__(self):
+        return f"<Routing_Scheduler({len(self.__due)} due, {len(self.__held)} held, {len(self.__damping)} damped)/>"
+
+    # Time the changes caused by the neighbour may be sent, now unless the neighbour is held down (must hold the lock)
+    def __hold_down(self, neighbour, now):
+        damping = self.__damping.get(neighbour)
+        if damping is None or not damping.suppressed:
+            return now
+        penalty = damping.decay(now, self.__half_life)
+        if penalty < self.__reuse:
+            damping.suppressed = False
+            logging.info(f"Neighbour {neighbour} is stable again, its routing changes are no longer held down")
+            return now
+        return now + self.__half_life * math.log2(penalty / self.__reuse)
+
+    # The routes have changed (because of source, if given), the given neighbours are sent their changes
+    # worse tells whether routes were lost or got longer
+    def changed(self, neighbours, source=None, worse=False):
+        self.__lock.acquire()
+        try:
+            now = time.monotonic()
+            hold_down = now if worse else self.__hold_down(source, now)
+            for neighbour in neighbours:
+                due = max(now + self.__window, hold_down)
+                if not worse:
+                    due = max(due, self.__last.get(neighbour, -math.inf) + self.__min_interval)
+                if hold_down > now:
+                    held = self.__held.setdefault(neighbour, {})
+                    held[source] = min(due, held.get(source, math.inf))
+                else:
+                    self.__due[neighbour] = min(due, self.__due.get(neighbour, math.inf))
+            self.__lock.notify()
+        finally:
+            self.__lock.release()
+
+    # The neighbour's link went down
+    def flap(self, neighbour):
+        self.__lock.acquire()
+        try:
+            now = time.monotonic()
+            damping = self.__damping.get(neighbour)
+            if damping is None:
+                damping = self.__damping[neighbour] = Damping(now)
+            damping.penalty = min(damping.decay(now, self.__half_life) + self.__penalty, self.__max_penalty)
+            if not damping.suppressed and damping.penalty > self.__suppress:
+                damping.suppressed = True
+                logging.warning(f"Neighbour {neighbour} is flapping, holding down its routing changes")
+        finally:
+            self.__lock.release()
+
+    # The neighbour is gone, its pending changes are dropped along with the damping state that decayed away (the
+    # neighbour's own is kept, so it's still damped if it comes back)
+    def forget(self, neighbour):
+        self.__lock.acquire()
+        try:
+            self.__due.pop(neighbour, None)
+            self.__held.pop(neighbour, None)
+            self.__last.pop(neighbour, None)
+            for held in self.__held.values():
+                held.pop(neighbour, None)
+            now = time.monotonic()
+            for source, damping in list(self.__damping.items()):
+                if source != neighbour and damping.decay(now, self.__half_life) < self.__forget:
+                    del self.__damping[source]
+        finally:
+            self.__lock.release()
+
+    # Neighbours still held down (must hold the lock)
+    def __held_down(self, now):
+        return {source for source in self.__damping if self.__hold_down(source, now) > now}
+
+    # Neighbours whose held down changes are due, the changes of sources held down for longer are due later
+    # (must hold the lock)
+    def __held_due(self, now):
+        neighbours = set()
+        for neighbour, held in list(self.__held.items()):
+            for source, due in list(held.items()):
+                if due <= now:
+                    hold_down = self.__hold_down(source, now)
+                    if hold_down > now:
+                        held[source] = hold_down
+                    else:
+                        del held[source]
+                        neighbours.add(neighbour)
+            if not held:
+                del self.__held[neighbour]
+        return neighbours
+
+    # Returns {neighbour: (penalty, held down)} of the neighbours whose links went down lately
+    def damping(self):
+        self.__lock.acquire()
+        try:
+            now = time.monotonic()
+            return {neighbour: (damping.decay(now, self.__half_life), self.__hold_down(neighbour, now) > now)
+                    for neighbour, damping in self.__damping.items()}
+        finally:
+            self.__lock.release()
+
+    # Sends the neighbours their changes as they come due, until stopped
+    def run(self):
+        resync = time.monotonic() + self.__resync_period if self.__resync_period else math.inf
+        while True:
+            self.__lock.acquire()
+            try:
+                while True:
+                    if self.__stopped:
+                        return
+                    now = time.monotonic()
+                    neighbours = {neighbour for neighbour, due in self.__due.items() if due <= now}
+                    neighbours.update(self.__held_due(now))
+                    if neighbours or now >= resync:
+                        break
+                    deadline = min(min(self.__due.values(), default=math.inf),
+                                   min((min(held.values()) for held in self.__held.values()), default=math.inf), resync)
+                    self.__lock.wait(deadline - now if deadline != math.inf else None)
+                for neighbour in neighbours:
+                    self.__due.pop(neighbour, None)
+                    self.__last[neighbour] = now
+                held = self.__held_down(now) if neighbours else set()
+            finally:
+                self.__lock.release()
+            try:
+                if neighbours:
+                    self.__flush(neighbours, held)
+                if now >= resync:
+                    resync = now + self.__resync_period
+                    self.__resync()
+            except Exception:
+                logging.exception("Exception while sending routing updates")
+
+    def stop(self):
+        self.__lock.acquire()
+        try:
+            self.__stopped = True
+            self.__lock.notify_all()
+        finally:
+            self.__lock.release()
@@ -0,0 +1,143 @@
+import math
+from collections import deque
+
+from OverTheTop import defaults as c
+from Utils.collections_extra import Ring_Buffer
+
+
+class Flow_Queue:
+    __slots__ = ('queue', 'weight', 'deficit', 'turn', 'dropped')
+
+    def __init__(self, capacity, max_bytes, weight):
+        self.queue = Ring_Buffer(capacity, max_bytes)
+        self.weight = weight
+        self.deficit = 0
+        self.turn = False
+        self.dropped = 0
+
+
+# Output scheduler that shares the link between flows with deficit round robin.
+# Every flow has its own bounded queue and, on each round, may send up to quantum * weight bytes. When a flow's queue
+# overflows its oldest entries are dropped (a late frame is worthless for live content), other flows are unaffected.
+# Entries bigger than a quantum are sent once their flow's deficit, carried from round to round, covers them. Rounds
+# in which no entry would fit are skipped at once, their quanta being credited to every flow.
+# Flows are dropped once their queue is drained (their weight is kept), only backlogged flows have a queue.
+# It is not thread safe, concurrency control is left to the owner.
+class Flow_Scheduler:
+
+    def __init__(self, capacity=c.DEFAULT_FRAME_BUFFER_SIZE, max_bytes=c.DEFAULT_FLOW_QUEUE_BYTES,
+                 quantum=c.DEFAULT_SCHEDULER_QUANTUM):
+        self.__capacity = capacity
+        self.__max_bytes = max_bytes
+        self.__quantum = quantum
+        self.__flows = {}  # Backlogged flows only
+        self.__weights = {}
+        self.__active = deque()  # Flows with queued entries, in round robin order
+        self.__count = 0
+        self.__bytes = 0
+        self.__high_water = 0
+        self.__dropped = 0
+
+    def __str__(self):
+        return f"<Flow_Scheduler({self.__count} entries, {len(self.__active)} active flows)>"
+
+    def __len__(self):
+        return self.__count
+
+    def __flow(self, flow_key) -> Flow_Queue:
+        flow = self.__flows.get(flow_key)
+        if flow is None:
+            weight = self.__weights.get(flow_key, c.DEFAULT_FLOW_WEIGHT)
+            flow = self.__flows[flow_key] = Flow_Queue(self.__capacity, self.__max_bytes, weight)
+        return flow
+
+    def __pop_head(self, flow: Flow_Queue):
+        size = flow.queue.peek_size()
+        self.__count -= 1
+        self.__bytes -= size
+        return flow.queue.pop(), size
+
+    def empty(self):
+        return self.__count == 0
+
+    def set_weight(self, flow_key, weight):
+        if weight <= 0:
+            raise ValueError("Flow weights must be positive")
+        self.__weights[flow_key] = weight
+        if flow_key in self.__flows:
+            self.__flows[flow_key].weight = weight
+
+    # Drops the flow along with its queued entries, returns them
+    def forget(self, flow_key):
+        self.__weights.pop(flow_key, None)
+        flow = self.__flows.pop(flow_key, None)
+        if flow is None:
+            return []
+        dropped = []
+        while not flow.queue.empty():
+            dropped.append(self.__pop_head(flow)[0])
+        self.__active.remove(flow_key)
+        return dropped
+
+    # Credits every active flow (none of which has its turn) with the quanta of the rounds it would take before any
+    # of their head entries fits
+    def __skip_rounds(self):
+        flows = [self.__flows[flow_key] for flow_key in self.__active]
+        rounds = min(math.ceil((flow.queue.peek_size() - flow.deficit) / (self.__quantum * flow.weight))
+                     for flow in flows) - 1
+        if rounds > 0:
+            for flow in flows:
+                flow.deficit += rounds * self.__quantum * flow.weight
+
+    # Queues an entry of the given flow, returns the entries dropped to make room for it
+    def push(self, flow_key, entry, size=0):
+        flow = self.__flow(flow_key)
+        if flow.queue.empty():
+            self.__active.append(flow_key)
+        dropped = []
+        while flow.queue.full(size):
+            dropped.append(self.__pop_head(flow)[0])
+        flow.dropped += len(dropped)
+        self.__dropped += len(dropped)
+        flow.queue.push(entry, size)
+        self.__count += 1
+        self.__bytes += size
+        if self.__count > self.__high_water:
+            self.__high_water = self.__count
+        return dropped
+
+    def pop(self):
+        idle = 0  # Flows passed over in a row
+        while self.__active:
+            flow_key = self.__active[0]
+            flow = self.__flows[flow_key]
+            if not flow.turn:
+                flow.deficit += self.__quantum * flow.weight
+                flow.turn = True
+            if len(self.__active) == 1:
+                # Nothing to share the link with, no need to go through the rounds
+                flow.deficit = max(flow.deficit, flow.queue.peek_size())
+            if flow.queue.peek_size() <= flow.deficit:
+                entry, size = self.__pop_head(flow)
+                flow.deficit -= size
+                if flow.queue.empty():
+                    del self.__flows[flow_key]
+                    self.__active.popleft()
+                return entry
+            # The flow has spent its quantum, the deficit is carried to its next turn
+            flow.turn = False
+            self.__active.rotate(-1)
+            idle += 1
+            if idle == len(self.__active):
+                self.__skip_rounds()
+                idle = 0
+        raise IndexError("pop from an empty scheduler")
+
+    def pop_many(self, n):
+        return [self.pop() for _ in range(min(n, self.__count))]
+
+    def stats(self):
+        return {'length': self.__count, 'bytes': self.__bytes, 'high_water': self.__high_water,
+                'dropped': self.__dropped,
+                'flows': {flow_key: dict(flow.queue.stats(), weight=flow.weight, dropped=flow.dropped)
+                          for flow_key, flow in self.__flows.items()}}
@@ -0,0 +1,165 @@
+import threading
+import time
+
+from OverTheTop import defaults as c
+from OverTheTop.Network.Flow_Packet import SEQUENCE_MASK, TIMESTAMP_MASK
+
+HALF_SEQUENCE = (SEQUENCE_MASK + 1) // 2
+HALF_TIMESTAMP = (TIMESTAMP_MASK + 1) // 2
+JITTER_GAIN = 1 / 16  # RFC 3550, 6.4.1
+DELAY_GAIN = 1 / 16
+
+
+# Signed difference between two wrapping counters
+def wrapping_delta(a, b, half=HALF_SEQUENCE, mask=SEQUENCE_MASK):
+    return ((a - b + half) & mask) - half
+
+
+# Receive statistics of a flow from a single upstream neighbour.
+# Sequence numbers are tracked in a fixed window (seen), older datagrams can't be told apart from duplicates and are
+# counted as late. Loss is the amount of datagrams expected (by the highest sequence number) but never received.
+# Jitter is the RFC 3550 interarrival jitter, in milliseconds, based on the origin's timestamps.
+# Delay is the (smoothed) queueing delay, in milliseconds: the transit time above the smallest one seen, which
+# doesn't depend on the offset between the origin's clock and the local one.
+# Frames counts the first datagram of every frame, lost first fragments lose their frame anyway. Recovered counts the
+# frames whose first datagram was lost but rebuilt from parity datagrams (see FEC).
+# Thinned counts the sequence numbers of the frames thinned upstream (gaps before FLAG_THINNED datagrams), never sent
+# therefore neither lost nor worth a retransmission.
+class Receive_Stats:
+    __slots__ = ('packets', 'bytes', 'received', 'frames', 'recovered', 'duplicates', 'reordered', 'late', 'extended',
+                 'thinned', 'highest', 'transit', 'base_transit', 'jitter', 'delay', 'seen', 'window')
+
+    def __init__(self, window=c.DEFAULT_STATS_WINDOW):
+        self.packets = 0
+        self.bytes = 0
+        self.received = 0
+        self.frames = 0
+        self.recovered = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.late = 0
+        self.extended = 0  # Highest sequence number relative to the first one, does not wrap
+        self.thinned = 0
+        self.highest = None
+        self.transit = 0
+        self.base_transit = None
+        self.jitter = 0.0
+        self.delay = 0.0
+        self.seen = bytearray(window)
+        self.window = window
+
+    # Returns the amount of sequence numbers skipped right before this one, None for duplicates and late datagrams
+    # Gaps before thinned datagrams aren't skipped
+    def record(self, sequence, size, stamp, arrival, first=True, thinned=False):
+        self.packets += 1
+        self.bytes += size
+        window = self.window
+        if self.highest is None:
+            self.highest = sequence
+        delta = wrapping_delta(sequence, self.highest)
+        skipped = max(delta - 1, 0)
+        if delta > 0:
+            if delta >= window:
+                self.seen[:] = bytes(window)
+            else:
+                for missing in range(self.highest + 1, self.highest + delta):
+                    self.seen[missing % window] = 0
+            self.highest = sequence
+            self.extended += delta
+            if thinned:
+                self.thinned += skipped
+                skipped = 0
+        elif -delta >= window:
+            self.late += 1
+            return None
+        elif self.seen[sequence % window]:
+            self.duplicates += 1
+            return None
+        elif delta < 0:
+            self.reordered += 1
+        self.seen[sequence % window] = 1
+        self.received += 1
+        if first:
+            self.frames += 1
+
+        transit = (arrival - stamp) & TIMESTAMP_MASK
+        if self.received > 1:
+            difference = abs(wrapping_delta(transit, self.transit, HALF_TIMESTAMP, TIMESTAMP_MASK))
+            self.jitter += (difference - self.jitter) * JITTER_GAIN
+        self.transit = transit
+        if self.base_transit is None or wrapping_delta(transit, self.base_transit, HALF_TIMESTAMP, TIMESTAMP_MASK) < 0:
+            self.base_transit = transit
+        queueing = wrapping_delta(transit, self.base_transit, HALF_TIMESTAMP, TIMESTAMP_MASK)
+        self.delay += (queueing - self.delay) * DELAY_GAIN
+        return skipped
+
+    def stats(self):
+        expected = self.extended + 1 - self.thinned if self.highest is not None else 0
+        lost = max(expected - self.received, 0)
+        return {'packets': self.packets, 'bytes': self.bytes, 'expected': expected, 'lost': lost,
+                'loss_rate': lost / expected if expected > 0 else 0.0, 'reordered': self.reordered,
+                'thinned': self.thinned, 'duplicates': self.duplicates, 'late': self.late, 'frames': self.frames,
+                'recovered': self.recovered, 'jitter': self.jitter,
+                'delay': self.delay}
+
+
+# Receive statistics of every flow, per upstream neighbour (hop).
+# Comparing the statistics of the nodes along a flow's path shows the hop where datagrams start to be lost or delayed.
+class Flow_Statistics:
+
+    def __init__(self, window=c.DEFAULT_STATS_WINDOW):
+        self.__window = window
+        self.__flows = {}  # flow_key => {hop: Receive_Stats}
+        self.__lock = threading.Lock()
+
+    def __str__(self):
+        return f"<Flow_Statistics({len(self.__flows)} flows)/>"
+
+    # Called by the flow processors, the arrival time is taken when the packet is processed
+    # Parity datagrams (see FEC) and retransmission requests are not part of the flow's sequence, therefore they aren't
+    # recorded. Returns the amount of sequence numbers skipped right before the datagram (a gap) or None if the
+    # datagram is a duplicate (or too late to tell)
+    def record(self, packet):
+        if packet.parity or packet.nack:
+            return 0
+        arrival = int(time.monotonic() * 1000) & TIMESTAMP_MASK
+        self.__lock.acquire()
+        try:
+            hops = self.__flows.get(packet.flow_key)
+            if hops is None:
+                hops = self.__flows[packet.flow_key] = {}
+            stats = hops.get(packet.hop)
+            if stats is None:
+                stats = hops[packet.hop] = Receive_Stats(self.__window)
+            return stats.record(packet.sequence, packet.payload_size, packet.stamp, arrival, packet.starts_frame,
+                                packet.thinned)
+        finally:
+            self.__lock.release()
+
+    # A datagram rebuilt thanks to the given parity packet, only frames (first datagrams) are counted
+    def recover(self, packet, first):
+        if not first:
+            return
+        self.__lock.acquire()
+        try:
+            stats = self.__flows.get(packet.flow_key, {}).get(packet.hop)
+            if stats is not None:
+                stats.recovered += 1
+        finally:
+            self.__lock.release()
+
+    def forget(self, flow_key):
+        self.__lock.acquire()
+        try:
+            self.__flows.pop(flow_key, None)
+        finally:
+            self.__lock.release()
+
+    # {flow_key: {hop: stats}}
+    def snapshot(self):
+        self.__lock.acquire()
+        try:
+            return {flow_key: {hop: stats.stats() for hop, stats in hops.items()}
+                    for flow_key, hops in self.__flows.items()}
+        finally:
+            self.__lock.release()
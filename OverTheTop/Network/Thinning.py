@@ -0,0 +1,177 @@
+import logging
+import threading
+
+from OverTheTop import defaults as c
+
+
+# Thinning state of a flow towards one downstream branch (the interface of a neighbour).
+# sent counts the frames forwarded to the branch, the reported counters are the ones of the latest report, therefore
+# the loss of each report's interval is measured on the frames that were actually forwarded (thinned frames don't
+# count as lost). Loss is the one of the link, residual the one left once frames are rebuilt from parity (see FEC) and
+# downstream the worst loss reported by the branch about its own branches. thinned tells whether frames were thinned
+# since the latest frame forwarded to the branch.
+class Branch:
+    __slots__ = ('factor', 'sent', 'thinned', 'reported_sent', 'reported_frames', 'reported_recovered', 'calm', 'loss',
+                 'residual', 'downstream', 'delay', 'frame_rate')
+
+    def __init__(self, frames=0, recovered=0):
+        self.factor = 1
+        self.sent = 0
+        self.thinned = False
+        self.reported_sent = 0
+        self.reported_frames = frames
+        self.reported_recovered = recovered
+        self.calm = 0
+        self.loss = 0.0
+        self.residual = 0.0
+        self.downstream = 0.0
+        self.delay = 0.0
+        self.frame_rate = 0.0
+
+    def stats(self):
+        return {'factor': self.factor, 'loss': self.loss, 'residual': self.residual, 'downstream': self.downstream,
+                'delay': self.delay, 'frame_rate': self.frame_rate}
+
+
+# Receiver driven temporal thinning of flows, per downstream branch.
+# Receivers periodically report (see Tag.FLOW_REPORT) the frames they got from the current machine, their queueing
+# delay and achieved frame rate. A congested branch (residual loss or delay above the high marks) gets one frame out of
+# factor (frame_num % factor == 0), the factor grows by one per congested report up to max_factor. Once a branch has
+# been calm (below the low marks) for recovery reports in a row its factor shrinks by one. Other branches are never
+# affected.
+# Every fragment of a frame shares its frame number, therefore frames are either forwarded whole or not at all.
+# The first frame forwarded to a branch after thinned ones is flagged (FLAG_THINNED) so the receiver doesn't take
+# the sequence gap for a loss. Thinned branches don't get parity datagrams (see FEC), their groups span frames the
+# branches never get.
+class Branch_Thinning:
+
+    def __init__(self, max_factor=c.MAX_THINNING_FACTOR, loss_marks=(c.THINNING_LOSS_LOW, c.THINNING_LOSS_HIGH),
+                 delay_marks=(c.THINNING_DELAY_LOW, c.THINNING_DELAY_HIGH), recovery=c.THINNING_RECOVERY_REPORTS):
+        self.__max_factor = max_factor
+        self.__loss_low, self.__loss_high = loss_marks
+        self.__delay_low, self.__delay_high = delay_marks
+        self.__recovery = recovery
+        self.__branches = {}  # (flow_key, address) => Branch
+        self.__lock = threading.Lock()
+
+    def __str__(self):
+        return f"<Branch_Thinning({len(self.__branches)} branches)/>"
+
+    # Returns (addresses, flagged): the addresses a frame is forwarded to and the ones among them whose datagram must be
+    # flagged with FLAG_THINNED, first tells whether the datagram is the first one of its frame and parity whether it's
+    # a parity datagram
+    # Forwarding hot path, branches without reports are never looked at
+    def select(self, flow_key, frame_num, addresses, first=True, parity=False):
+        if not self.__branches:
+            return addresses, ()
+        selected, flagged = [], []
+        self.__lock.acquire()
+        try:
+            for address in addresses:
+                branch = self.__branches.get((flow_key, address))
+                if branch is not None:
+                    if parity:
+                        if branch.factor > 1:
+                            continue
+                    elif frame_num % branch.factor:
+                        branch.thinned = True
+                        continue
+                    if first:
+                        branch.sent += 1
+                        if branch.thinned:
+                            branch.thinned = False
+                            flagged.append(address)
+                selected.append(address)
+        finally:
+            self.__lock.release()
+        return selected, flagged
+
+    # report: {flow_key: {'frames': total frames received, 'recovered': total frames rebuilt, 'loss': worst loss of
+    # its own branches, 'delay': ms, 'frame_rate': fps}} of the branch at address
+    def report(self, address, report):
+        self.__lock.acquire()
+        try:
+            for flow_key, figures in report.items():
+                branch = self.__branches.get((flow_key, address))
+                if branch is None:
+                    # The first report is the baseline of the branch
+                    self.__branches[(flow_key, address)] = Branch(figures['frames'], figures['recovered'])
+                    continue
+                sent = branch.sent - branch.reported_sent
+                received = figures['frames'] - branch.reported_frames
+                recovered = figures['recovered'] - branch.reported_recovered
+                branch.reported_sent, branch.reported_frames = branch.sent, figures['frames']
+                branch.reported_recovered = figures['recovered']
+                branch.downstream, branch.delay, branch.frame_rate = figures['loss'], figures['delay'], \
+                    figures['frame_rate']
+                if sent <= 0:
+                    continue
+                branch.loss = max(sent - received, 0) / sent
+                branch.residual = max(sent - received - recovered, 0) / sent
+                self.__adapt(flow_key, address, branch)
+        finally:
+            self.__lock.release()
+
+    def __adapt(self, flow_key, address, branch: Branch):
+        factor = branch.factor
+        if branch.residual > self.__loss_high or branch.delay > self.__delay_high:
+            branch.calm = 0
+            factor = min(factor + 1, self.__max_factor)
+        elif branch.residual < self.__loss_low and branch.delay < self.__delay_low:
+            branch.calm += 1
+            if branch.calm >= self.__recovery:
+                branch.calm = 0
+                factor = max(factor - 1, 1)
+        if factor != branch.factor:
+            logging.info(f"Flow {flow_key} thinned to 1/{factor} frames towards {address} "
+                         f"(loss: {branch.residual:.1%}, delay: {branch.delay:.0f} ms, {branch.frame_rate:.1f} fps)")
+            branch.factor = factor
+
+    # Returns the addresses whose branch of the flow is thinned
+    def thinned(self, flow_key, addresses):
+        if not self.__branches:
+            return []
+        thinned = []
+        self.__lock.acquire()
+        try:
+            for address in addresses:
+                branch = self.__branches.get((flow_key, address))
+                if branch is not None and branch.factor > 1:
+                    thinned.append(address)
+        finally:
+            self.__lock.release()
+        return thinned
+
+    # Worst loss (of the latest reports, before any frame is rebuilt) among the branches of the flow and theirs, default
+    # if the flow has no branch
+    def loss(self, flow_key, default=0.0):
+        self.__lock.acquire()
+        try:
+            return max((max(branch.loss, branch.downstream) for key, branch in self.__branches.items()
+                        if key[0] == flow_key), default=default)
+        finally:
+            self.__lock.release()
+
+    def forget(self, flow_key):
+        self.__lock.acquire()
+        try:
+            for key in [key for key in self.__branches if key[0] == flow_key]:
+                self.__branches.pop(key)
+        finally:
+            self.__lock.release()
+
+    def forget_address(self, address):
+        self.__lock.acquire()
+        try:
+            for key in [key for key in self.__branches if key[1] == address]:
+                self.__branches.pop(key)
+        finally:
+            self.__lock.release()
+
+    # {(flow_key, address): {'factor', 'loss', 'delay', 'frame_rate'}}
+    def stats(self):
+        self.__lock.acquire()
+        try:
+            return {key: branch.stats() for key, branch in self.__branches.items()}
+        finally:
+            self.__lock.release()
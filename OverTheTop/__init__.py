@@ -1,14 +1,26 @@
 import threading
-import uuid
+import time
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import OverTheTop.defaults
 from OverTheTop.Content.Player_Manager import Player_Handler
 from OverTheTop.Content.Streamer import MPEG_Streamer, Streamer, InvalidExtension
 from OverTheTop.Network.Control_Management import *
-from OverTheTop.Network.Flow_Management import Flow_Handler
+from OverTheTop.Network.Data_Plane import Data_Plane, Forwarding_Snapshot
+from OverTheTop.Network.FEC import Parity_Decoder, parity_group
+from OverTheTop.Network.Flow_Engines import Flow_Engine_Library
+from OverTheTop.Network.Flow_Packet import FLAG_THINNED, SEQUENCE_MASK, Flow_Packet
+from OverTheTop.Network.Fragmentation import Reassembler
 from OverTheTop.Network.Node import Node
 from OverTheTop.Network.Node.Flow_Data import InvalidFlow
+from OverTheTop.Network.Node.Identifiers import InvalidIdentifier, new_node_id, node_label, parse_node_id
+from OverTheTop.Network.Node.Routing_Data import OutOfSequence
+from OverTheTop.Network.Recent_Frames import Recent_Frames
+from OverTheTop.Network.Routing_Updates import Routing_Scheduler
+from OverTheTop.Network.Statistics import Flow_Statistics
+from OverTheTop.Network.Thinning import Branch_Thinning
 from Utils import Scaling_Method, Scaling_Method_Library
 from Utils.threading_extra import RWLock
 
@@ -22,13 +34,25 @@ class OTT:
     def __init__(self, max_connections=None,
                  bind_port=None, bind_address=None, name=None,
                  max_authentication_tries=None,
-                 max_reconnect_tries=None
+                 max_reconnect_tries=None,
+                 flow_engine=None,
+                 data_plane_workers=None,
+                 bundle_window=None,
+                 control_codec=None,
+                 routing_window=None,
+                 retransmission_budget=None
                  ):
         max_reconnect_tries = max_reconnect_tries or defaults.MAX_RECONNECTION_TRIES
         max_authentication_tries = max_authentication_tries or defaults.MAX_AUTHENTICATION_TRIES
         max_connections = max_connections or c.DEFAULT_MAX_CONNECTIONS
         bind_port = bind_port or c.DEFAULT_PORT
         bind_address = bind_address or socket.gethostbyname(socket.gethostname())
+        flow_engine = flow_engine or defaults.DEFAULT_FLOW_ENGINE
+        data_plane_workers = data_plane_workers or defaults.DEFAULT_DATA_PLANE_WORKERS
+        bundle_window = bundle_window if bundle_window is not None else defaults.DEFAULT_BUNDLE_WINDOW
+        control_codec = control_codec if control_codec is not None else defaults.DEFAULT_CONTROL_CODEC
+        routing_window = routing_window if routing_window is not None else defaults.DEFAULT_ROUTING_UPDATE_WINDOW
+        retransmission_budget = retransmission_budget or defaults.DEFAULT_RETRANSMISSION_BUDGET
         logging.info(f"Attempting to bind to {bind_address}:{bind_port}")
         # Thread Pools
         self.__stop_event = threading.Event()
@@ -36,16 +60,39 @@ class OTT:
         self.__control_connection_pool = ThreadPoolExecutor(max_connections)
         self.__streamer_pool = ThreadPoolExecutor()
         # Main Instances
-        self.__flow_handler = Flow_Handler(address=bind_address, port=bind_port)
+        self.__data_plane = None
+        if data_plane_workers > 0:
+            # Workers bind the flow port first, the local handler joins the port's reuseport group last, out of reach of
+            # the flow sharding (see Data_Plane), and only originates flows
+            self.__data_plane = Data_Plane((bind_address, bind_port), data_plane_workers, self.__deliver_chunk,
+                                           bundle_window, self.__retransmit_sent, retransmission_budget,
+                                           self.__preload_chunks)
+            self.__data_plane.start()
+        self.__flow_handler = Flow_Engine_Library.get_engine(flow_engine)(address=bind_address, port=bind_port,
+                                                                          reuse_port=self.__data_plane is not None,
+                                                                          bundle_window=bundle_window,
+                                                                          retransmission_budget=retransmission_budget)
         self.__control_server = Control_Server(address=bind_address, port=bind_port)
         self.__max_reconnect_tries = max_reconnect_tries
         self.__max_auth_tries = max_authentication_tries
+        self.__control_codec = min(control_codec, CONTROL_CODEC_VERSION)
         self.__connections = {}
         self.__connections_lock = RWLock()
+        self.__connections_epoch = 0  # Bumped (under the write lock) whenever the connections change
+        self.__routing_scheduler = Routing_Scheduler(self.__advertise, self.__resync_distance_vectors, routing_window)
+        # flow_key => (version, {interface: Header_Template}, local), oldest decision first
+        self.__forwarding_cache = OrderedDict()
         self.__icu = {}
         self.__icu_lock = threading.Condition()
         self.__player_handler = Player_Handler()
-        self.__node = Node(uuid.uuid4().hex, name)
+        self.__reassembler = Reassembler()
+        self.__statistics = Flow_Statistics()
+        self.__thinning = Branch_Thinning()
+        self.__fec = Parity_Decoder()
+        self.__recent = Recent_Frames()
+        self.__adaptive_parity = set()  # Flows whose parity follows the loss reported by the downstream neighbours
+        self.__node = Node(new_node_id(), name)
+        self.__hop_field = Flow_Packet.hop_field(self.__node.node_id)
         self.__flow_event = threading.Event()
         self.__overlay_event = threading.Event()
 
@@ -62,29 +109,35 @@ class OTT:
     def __doctor_enabled(self):
         return self.__max_reconnect_tries > 0
 
+    # Frames are queued to the neighbour's connection (see Control_Connection.post), a slow neighbour never holds up
+    # the caller
     def __send_control(self, neighbour, control_tag: Tag, control_data):
-        self.__connections[neighbour].send(Control_Frame(control_tag, control_data))
+        self.__connections[neighbour].post(Control_Frame(control_tag, control_data))
 
+    def __authentication_frame(self):
+        return Control_Frame(Tag.AUTHENTICATION, (self.__node.node_id, self.__flow_handler.interface, self.__node.name,
+                                                  self.__control_codec, self.__data_plane is not None))
+
+    # Both ends offer the highest control codec they support, frames are sent with the lowest of both from then on
+    # (nodes that don't offer any only understand pickle). Each end also tells whether its flow port is sharded among
+    # data plane workers, the bundles bound to it only carry a single flow then (see Bundling)
     def __authentication(self, connection: Control_Connection):
         fails = 0
-        connection.send(
-            Control_Frame(Tag.AUTHENTICATION,
-                          (self.__node.node_id, self.__flow_handler.interface, self.__node.name)))
+        connection.send(self.__authentication_frame())
         while fails < defaults.MAX_AUTHENTICATION_TRIES:
             try:
                 frame = connection.receive()
                 if frame.tag() == Tag.AUTHENTICATION:
-                    neighbour_id, flow_interface, name = frame.data()
+                    neighbour_id, flow_interface, name, *extra = frame.data()
                     if name:
                         connection.set_name(name)
                     if flow_interface:
-                        connection.set_flow_interface(flow_interface)
+                        connection.set_flow_interface(flow_interface, len(extra) > 1 and extra[1])
+                    connection.set_codec(min(extra[0], self.__control_codec) if extra else PICKLE_CODEC)
                     return neighbour_id
                 elif frame.tag() == Tag.AUTHENTICATION_REQUIRED:
-                    connection.send(
-                        Control_Frame(Tag.AUTHENTICATION,
-                                      (self.__node.node_id, self.__flow_handler.interface, self.__node.name)))
-                    connection.send(Control_Frame(Tag.AUTHENTICATION_REQUIRED, None))
+                    connection.send_many((self.__authentication_frame(),
+                                          Control_Frame(Tag.AUTHENTICATION_REQUIRED, None)))
                 else:
                     fails += 1
                     connection.send(Control_Frame(Tag.AUTHENTICATION_REQUIRED, None))
@@ -108,10 +161,12 @@ class OTT:
             try:
                 self.__connections[neighbour_id].terminate()
                 connection = self.__connections.pop(neighbour_id)
+                self.__connections_epoch += 1
             except KeyError:  # Already dealt with
                 return
             finally:
                 self.__connections_lock.release_write()
+            self.__close_output(connection.get_interface())
             if self.__doctor_enabled():
                 self.__process_update(self.__node.time_out(neighbour_id), neighbour_id)
                 self.__register_in_icu(neighbour_id, connection)
@@ -120,6 +175,9 @@ class OTT:
             else:
                 self.__process_update(self.__node.rm_neighbour(neighbour_id), neighbour_id)
                 logging.error(f"{neighbour_id} Timeout. Connection closed.")
+            # Only the routes the neighbour brings back are held down, not the losses above
+            self.__routing_scheduler.forget(neighbour_id)
+            self.__routing_scheduler.flap(neighbour_id)
         except Exception:
             logging.exception(f"Couldn't time out neighbour {neighbour_id}.")
 
@@ -151,9 +209,11 @@ class OTT:
         if self.__doctor_enabled():
             self.__discharge_neighbour(neighbour_id)
         # Register Connection
+        self.__flow_handler.open_output(connection.get_interface(), connection.sharded)
         self.__connections_lock.acquire_write()
         try:
             self.__connections[neighbour_id] = connection
+            self.__connections_epoch += 1
         finally:
             self.__connections_lock.release_write()
         self.__process_update(self.__node.new_neighbour(neighbour_id), neighbour_id)
@@ -161,17 +221,73 @@ class OTT:
 
         return neighbour_id
 
+    # Moves the flows whose route towards their origin changed to the current one, their destinations are requested
+    # from the new upstream neighbour and cancelled at the previous one (if it's still a neighbour). The players of
+    # flows that can't be reached anymore are cancelled.
     def __recover_flows(self, losses):
         for flow_key in losses:
-            gateway, request = self.__node.flow_recovery(flow_key)
-            if gateway:
-                self.__send_control(gateway, Tag.FLOW_REQUEST, request)
-            else:
-                self.__player_handler.cancel_key(flow_key)
+            reroute = self.__node.reroute(flow_key)
+            if reroute is None:
+                try:
+                    self.__player_handler.cancel_key(flow_key)
+                except KeyError:
+                    pass
+                continue
+            previous, upstream, requests = reroute
+            if previous == upstream:
+                continue
+            self.__connections_lock.acquire_read()
+            try:
+                for request in requests:
+                    if previous in self.__connections:
+                        self.__send_control(previous, Tag.FLOW_CANCEL, request)
+                    if upstream in self.__connections:
+                        self.__send_control(upstream, Tag.FLOW_REQUEST, request)
+            finally:
+                self.__connections_lock.release_read()
+        if losses:
+            self.__publish_forwarding_state()
+
+    # Pushes the current forwarding state to the data plane workers (if any)
+    # The recent frames of flows that no longer go through the node are stale by the time they come back
+    def __publish_forwarding_state(self):
+        for flow_key in self.__recent.flows():
+            if not any(self.__node.downstream(flow_key)):
+                self.__recent.forget(flow_key)
+        if self.__data_plane is None:
+            return
+        self.__connections_lock.acquire_read()
+        try:
+            interfaces = {n: connection.get_interface() for n, connection in self.__connections.items()}
+            sharded = {connection.get_interface() for connection in self.__connections.values() if connection.sharded}
+        finally:
+            self.__connections_lock.release_read()
+        self.__data_plane.publish(Forwarding_Snapshot(self.__node.node_id, self.__node.forwarding(), interfaces,
+                                                      sharded))
+
+    # {flow_key: {hop: stats}} of this process and of the data plane workers
+    def __receive_statistics(self):
+        statistics = self.__statistics.snapshot()
+        if self.__data_plane:
+            for flow_key, hops in self.__data_plane.statistics().items():
+                statistics.setdefault(flow_key, {}).update(hops)
+        return statistics
+
+    # Tears down the output port (and thinning state) of a neighbour's flow interface
+    def __close_output(self, address):
+        self.__flow_handler.close_output(address)
+        self.__thinning.forget_address(address)
+
+    def __deliver_chunk(self, flow_key, chunk):
+        self.__player_handler.insert_chunk(flow_key, chunk)
+
+    def __preload_chunks(self, flow_key, chunks):
+        self.__player_handler.preload(flow_key, chunks)
 
     def __process_update(self, update_record, source=None):
         if update_record is not None:
-            losses, collection = update_record
+            self.__publish_forwarding_state()
+            losses, collection, worse = update_record
             self.__overlay_event.set()
             self.__flow_event.set()
 
@@ -181,44 +297,135 @@ class OTT:
                 b = source in neighbours
                 if b:
                     neighbours.remove(source)
-                for neighbour, vector in self.__node.gen_distance_vectors(neighbours).items():
-                    self.__send_control(neighbour, Tag.DISTANCE_VECTOR, vector)
+                # Neighbours get the changes of their vectors once the scheduler coalesced them (see __advertise)
+                self.__routing_scheduler.changed(neighbours, source, worse)
                 if b and collection:
                     self.__send_control(source, Tag.FLOW_COLLECTION, collection)
             finally:
                 self.__connections_lock.release_read()
-            if source and collection and len(collection) > 0:
+            if losses:
                 self.__recover_flows(losses)
 
-    # Forwards a flow chunk to the corresponding neighbours based on the current flow destinations
-    # If the current machine is among the destinations, the chunk is also forwarded to the video player
-    def __forward_flow(self, flow_key, destinations, chunk):
-        headers = {}
-        gateways, local = self.__node.next_gateways(destinations)
+    # Returns ({interface: Header_Template}, local) where the interfaces are the ones of the neighbours downstream of
+    # the current machine, as recorded in its flow table, and local tells whether the machine is a destination
+    # Forwarding decisions are cached per flow, they hold until the routing table, the flow table or the connections
+    # change (version)
+    def __routes(self, flow_key):
+        version = self.__node.version + self.__connections_epoch
+        decision = self.__forwarding_cache.get(flow_key)
+        if decision is None or decision[0] != version:
+            decision = self.__forwarding_decision(flow_key, version)
+        return decision[1], decision[2]
+
+    # Forwards a chunk streamed by the current machine to the flow's destinations (the video player included)
+    # Congested branches only get some of the frames, without parity (see Branch_Thinning)
+    def __forward_flow(self, flow_key, chunk):
+        routes, local = self.__routes(flow_key)
+        if routes:
+            selected, flagged = self.__thinning.select(flow_key, chunk[0], routes)
+            if selected is not routes:
+                routes = {address: routes[address] for address in selected}
+                for address in flagged:
+                    routes[address] = routes[address].flagged(FLAG_THINNED)
+                for address in self.__thinning.thinned(flow_key, routes):
+                    routes[address] = routes[address].flagged(parity=False)
+        if routes:
+            datagrams = self.__flow_handler.send(flow_key, chunk, routes)
+            # Streamers hand over frames that are never overwritten (ex: memory mapped), they are cached as they are
+            for parts in next(iter(datagrams.values()), ()):
+                self.__recent.add(flow_key, parts, False)
+        if local:
+            self.__player_handler.insert_chunk(flow_key, chunk)
+
+    # Relays a received flow packet, the datagram is forwarded as it is (only its hop is replaced) and only decoded
+    # (reassembled) if the current machine is a destination. In which case, the chunk's payload is copied before being
+    # handed to the player since the receive buffer is recycled once the packet is released
+    def __relay_flow(self, packet):
+        routes, local = self.__routes(packet.flow_key)
+        if routes or local:
+            self.__recent.add(packet.flow_key, packet.relay_parts(self.__hop_field))
+        if routes:
+            addresses, flagged = self.__thinning.select(packet.flow_key, packet.frame_num, routes.keys(),
+                                                        packet.starts_frame, packet.parity)
+            self.__flow_handler.relay(packet, self.__hop_field, addresses, flagged)
+        if local:
+            # Lost datagrams are rebuilt from parity datagrams (if the flow has them) before reassembly
+            for fragment, chunk in self.__fec.receive(packet):
+                if packet.parity:
+                    self.__statistics.recover(packet, fragment[1] == 0)
+                chunk = self.__reassembler.add(packet.flow_key, fragment, chunk)
+                if chunk:
+                    self.__player_handler.insert_chunk(packet.flow_key, chunk)
+
+    def __forwarding_decision(self, flow_key, version):
+        routes = {}
+        neighbours, local = self.__node.downstream(flow_key)
+        template = Flow_Packet.template(flow_key, self.__node.node_id)
 
         self.__connections_lock.acquire_read()
         try:
-            for g in gateways:
-                if g in self.__connections:
-                    headers[self.__connections[g].get_interface()] = (flow_key, gateways[g])
+            for n in neighbours:
+                if n in self.__connections:
+                    routes[self.__connections[n].get_interface()] = template
         finally:
             self.__connections_lock.release_read()
-        for address in headers:
-            self.__flow_handler.send(headers[address], chunk, address)
-        if local:
-            self.__player_handler.insert_chunk(flow_key, chunk)
+        # A full cache evicts its oldest decisions, the refreshed one goes last
+        self.__forwarding_cache.pop(flow_key, None)
+        while len(self.__forwarding_cache) >= c.DEFAULT_FORWARDING_CACHE_SIZE:
+            try:
+                self.__forwarding_cache.popitem(last=False)
+            except KeyError:  # Evicted by another thread meanwhile
+                break
+        decision = self.__forwarding_cache[flow_key] = (version, routes, local)
+        return decision
 
     def __request_flow(self, flow_id):
         gateway, flow_key, flow_request = self.__node.flow_request(flow_id)
+        self.__publish_forwarding_state()
         if gateway:
             self.__send_control(gateway, Tag.FLOW_REQUEST, flow_request)
         return flow_key
 
     def __announce(self, flow_key):
+        announcement = (flow_key, self.__node.flow_name(flow_key))
         self.__connections_lock.acquire_read()
         try:
             for connection in self.__connections:
-                self.__send_control(connection, Tag.FLOW_ANNOUNCE, flow_key)
+                self.__send_control(connection, Tag.FLOW_ANNOUNCE, announcement)
+        finally:
+            self.__connections_lock.release_read()
+
+    # Distance vectors are built by the writer of the neighbour's connection, right before being sent, therefore a
+    # neighbour has at most one of them pending (the newest one) and gets its deltas in sequence.
+    # A pending whole vector covers any later delta, a whole vector replaces a pending delta.
+    def __distance_vector_frame(self, neighbour_id):
+        return Control_Frame(Tag.DISTANCE_VECTOR, self.__node.gen_full_distance_vector(neighbour_id))
+
+    def __distance_vector_delta_frame(self, neighbour_id, held=()):
+        delta = self.__node.gen_distance_vector_deltas((neighbour_id,), held).get(neighbour_id)
+        return Control_Frame(Tag.DISTANCE_VECTOR_DELTA, delta) if delta else None
+
+    # Sends the given neighbours the entries of their vector that changed since the last one they were sent, but for
+    # the new (or shorter) routes through the held down neighbours (see Routing_Scheduler)
+    def __advertise(self, neighbours, held=()):
+        self.__connections_lock.acquire_read()
+        try:
+            for neighbour in neighbours:
+                connection = self.__connections.get(neighbour)
+                if connection:
+                    connection.post(partial(self.__distance_vector_delta_frame, neighbour, held),
+                                    key=Tag.DISTANCE_VECTOR, replace=False)
+        finally:
+            self.__connections_lock.release_read()
+
+    # Sends every neighbour its whole distance vector (periodically, see Routing_Scheduler), in case a delta went
+    # missing unnoticed (the neighbour only notices a missing delta once the next one arrives) or its resynchronization
+    # request did
+    def __resync_distance_vectors(self):
+        self.__connections_lock.acquire_read()
+        try:
+            for neighbour in self.__connections:
+                self.__send_distance_vector(neighbour)
         finally:
             self.__connections_lock.release_read()
 
@@ -226,19 +433,36 @@ class OTT:
     def __process_distance_vector(self, neighbour_id, distance_vector):
         self.__process_update(self.__node.receive_distance_vector(neighbour_id, distance_vector), neighbour_id)
 
+    # A missing delta (ex: a control frame discarded as malformed) asks the neighbour for its whole vector, the
+    # deltas received until then are ignored
+    def __process_distance_vector_delta(self, neighbour_id, delta):
+        try:
+            update_record = self.__node.receive_distance_vector_delta(neighbour_id, delta)
+        except OutOfSequence as e:
+            logging.warning(f"{e}, resynchronizing the distance vector of {neighbour_id}")
+            self.__send_control(neighbour_id, Tag.DISTANCE_VECTOR_RESYNC, None)
+            return
+        self.__process_update(update_record, neighbour_id)
+
+    # Sends the neighbour its whole distance vector, the following deltas build on it
+    def __send_distance_vector(self, neighbour_id):
+        self.__connections[neighbour_id].post(partial(self.__distance_vector_frame, neighbour_id),
+                                              key=Tag.DISTANCE_VECTOR)
+
     def __general_flood(self, tag, data, source=None):
         self.__connections_lock.acquire_read()
         try:
             for neighbour in self.__connections:
-                if neighbour is not source:
+                if neighbour != source:
                     self.__send_control(neighbour, tag, data)
         finally:
             self.__connections_lock.release_read()
         self.__flow_event.set()
 
-    def __handle_flow_announce(self, neighbour_id, flow_key):
-        if self.__node.announcement(flow_key):
-            self.__general_flood(Tag.FLOW_ANNOUNCE, flow_key, neighbour_id)
+    # Announcements carry the flow's name along with its key, (flow_key, name)
+    def __handle_flow_announce(self, neighbour_id, announcement):
+        if self.__node.announcement(*announcement):
+            self.__general_flood(Tag.FLOW_ANNOUNCE, announcement, neighbour_id)
 
     def __handle_flow_collection(self, neighbour_id, flow_data):
         collection = self.__node.receive_flow_collection(flow_data)
@@ -248,26 +472,103 @@ class OTT:
     def __send_withdraw(self, flow_key):
         self.__general_flood(Tag.FLOW_WITHDRAW, flow_key)
 
-    def __handle_flow_request(self, flow_request):
-        gateway = self.__node.handle_flow_request(flow_request)
+    # The neighbour the request came from becomes the downstream of its destination
+    # A neighbour that joins a flow going through the node gets its recent frames first, before any live datagram
+    def __handle_flow_request(self, neighbour_id, flow_request):
+        flow_key = flow_request[0]
+        address = self.__neighbour_interface(neighbour_id)
+        if address and neighbour_id not in self.__node.downstream(flow_key)[0]:
+            self.__replay(flow_key, address)
+        try:
+            gateway = self.__node.handle_flow_request(flow_request, neighbour_id)
+        except InvalidFlow:
+            logging.debug(f"Discarded request for unknown flow {flow_request[0]}")
+            return
+        self.__publish_forwarding_state()
         self.__flow_event.set()
         if gateway:
             self.__send_control(gateway, Tag.FLOW_REQUEST, flow_request)
 
-    def __handle_flow_cancel(self, flow_request):
-        gateway = self.__node.handle_flow_cancel(flow_request)
+    # Feedback of a downstream neighbour about the flows it gets from the current machine
+    def __handle_flow_report(self, neighbour_id, report):
+        self.__connections_lock.acquire_read()
+        try:
+            connection = self.__connections.get(neighbour_id)
+        finally:
+            self.__connections_lock.release_read()
+        if connection is None:
+            return
+        self.__thinning.report(connection.get_interface(), report)
+        if self.__data_plane:
+            self.__data_plane.report(connection.get_interface(), report)
+        for flow_key in self.__adaptive_parity.intersection(report):
+            self.__flow_handler.set_flow_parity(flow_key, parity_group(self.__loss(flow_key)))
+
+    # Worst loss downstream of the flow, the data plane workers thin (and measure) the branches of the flows they relay
+    def __loss(self, flow_key):
+        loss = self.__thinning.loss(flow_key)
+        if self.__data_plane:
+            loss = max(loss, self.__data_plane.loss(flow_key))
+        return loss
+
+    def __neighbour_interface(self, neighbour_id):
+        self.__connections_lock.acquire_read()
+        try:
+            connection = self.__connections.get(neighbour_id)
+            return connection.get_interface() if connection else None
+        finally:
+            self.__connections_lock.release_read()
+
+    # The skipped datagrams right before the packet are asked to the neighbour that relayed it
+    def __request_retransmission(self, packet, skipped):
+        address = self.__neighbour_interface(packet.hop)
+        if address:
+            first = (packet.sequence - skipped) & SEQUENCE_MASK
+            self.__flow_handler.request_retransmission(packet.flow_key, address, self.__node.node_id, first, skipped)
+
+    # NACK of a downstream neighbour (the packet's hop), answered from the datagrams recently sent to it
+    def __retransmit(self, packet):
+        address = self.__neighbour_interface(packet.hop)
+        if address:
+            first, _, count = packet.fragment
+            self.__flow_handler.retransmit(packet.flow_key, address, first, min(count, c.MAX_NACK_GAP))
+
+    # NACKs of flows originated by the node, handed over by the data plane workers
+    def __retransmit_sent(self, flow_key, address, first, count):
+        self.__flow_handler.retransmit(flow_key, address, first, count)
+
+    # Replays the recent frames of a flow to a downstream neighbour's interface or, if address is None, to the local
+    # player
+    def __replay(self, flow_key, address=None):
+        if address:
+            self.__flow_handler.replay(flow_key, address, self.__recent.datagrams(flow_key))
+        else:
+            self.__player_handler.preload(flow_key, self.__recent.chunks(flow_key))
+        if self.__data_plane:
+            self.__data_plane.replay(flow_key, address)
+
+    def __handle_flow_cancel(self, neighbour_id, flow_request):
+        gateway = self.__node.handle_flow_cancel(flow_request, neighbour_id)
+        self.__publish_forwarding_state()
         self.__flow_event.set()
         if gateway:
             self.__send_control(gateway, Tag.FLOW_CANCEL, flow_request)
 
+    # The connections' write lock is released before the update is processed, which takes the read lock
     def __disconnect_neighbour(self, neighbour_id):
         self.__connections_lock.acquire_write()
         try:
-            self.__connections[neighbour_id].terminate()
-            self.__connections.pop(neighbour_id).get_interface()
-            self.__process_update(self.__node.rm_neighbour(neighbour_id), neighbour_id)
+            connection = self.__connections.pop(neighbour_id)
+            connection.terminate()
+            self.__connections_epoch += 1
+        except KeyError:  # Already dealt with
+            return
         finally:
             self.__connections_lock.release_write()
+        self.__close_output(connection.get_interface())
+        self.__process_update(self.__node.rm_neighbour(neighbour_id), neighbour_id)
+        self.__routing_scheduler.forget(neighbour_id)
+        self.__routing_scheduler.flap(neighbour_id)
         logging.info(f"Neighbour {neighbour_id} has disconnected.")
 
     # Please keep this as the last method of the (private - workers) method list :)
@@ -277,49 +578,73 @@ class OTT:
         logging.debug(f"Received {tag} frame from {neighbour_id}")
         if tag == Tag.DISTANCE_VECTOR:
             self.__process_distance_vector(neighbour_id, data)
+        elif tag == Tag.DISTANCE_VECTOR_DELTA:
+            self.__process_distance_vector_delta(neighbour_id, data)
+        elif tag == Tag.DISTANCE_VECTOR_RESYNC:
+            self.__send_distance_vector(neighbour_id)
         elif tag == Tag.FLOW_COLLECTION:
             self.__handle_flow_collection(neighbour_id, data)
         elif tag == Tag.FLOW_ANNOUNCE:
             self.__handle_flow_announce(neighbour_id, data)
         elif tag == Tag.FLOW_REQUEST:
-            self.__handle_flow_request(data)
+            self.__handle_flow_request(neighbour_id, data)
         elif tag == Tag.FLOW_CANCEL:
-            self.__handle_flow_cancel(data)
+            self.__handle_flow_cancel(neighbour_id, data)
         elif tag == Tag.FLOW_WITHDRAW:
             self.withdraw_flow(data)
+        elif tag == Tag.FLOW_REPORT:
+            self.__handle_flow_report(neighbour_id, data)
         elif tag == Tag.AUTHENTICATION_REQUIRED:
-            self.__send_control(neighbour_id, Tag.AUTHENTICATION,
-                                (self.__node.node_id, self.__flow_handler.interface, self.__node.name))
+            self.__connections[neighbour_id].post(self.__authentication_frame())
         # Discarded [Authentication]
 
     # --- Workers -----------------------------------------------------------------------------------------------------
 
-    # Engages the dispatchers/forwarders responsible for managing incoming/outgoing flow frames
+    # Engages the dispatchers/processors responsible for managing incoming flow frames
+    # Outgoing frames are sent by the forwarder of each neighbour's output port
     # The worker count is cumulative, therefore the total amount of workers issued corresponds to the sum of all the
     # workers engaged util the current moment
     def __engage_global_workers(
             self,
-            forwarder_count=c.DEFAULT_FLOW_FORWARDER_COUNT,
             dispatcher_count=c.DEFAULT_FLOW_DISPATCHER_COUNT,
             processor_count=c.DEFAULT_FLOW_PROCESSOR_COUNT,
             doctor_count=c.DEFAULT_DOCTOR_COUNT
     ):
-        for x in range(forwarder_count):
-            self.__flow_handler_pool.submit(self.__flow_handler.dispatcher)
-        for x in range(dispatcher_count):
-            self.__flow_handler_pool.submit(self.__flow_handler.forwarder)
-        for x in range(processor_count):
-            self.__flow_handler_pool.submit(self.__flow_processor)
+        if self.__flow_handler.inline_processing:
+            # Single event loop engine, packets are processed as soon as they are received
+            self.__flow_handler.set_processor(self.__process_flow_packet)
+            self.__flow_handler_pool.submit(self.__flow_handler.run)
+        else:
+            for x in range(dispatcher_count):
+                self.__flow_handler_pool.submit(self.__flow_handler.dispatcher)
+            for x in range(processor_count):
+                self.__flow_handler_pool.submit(self.__flow_processor)
         for x in range(doctor_count):
             self.__flow_handler_pool.submit(self.__connection_doctor)
+        self.__flow_handler_pool.submit(self.__flow_reporter)
+        self.__flow_handler_pool.submit(self.__routing_scheduler.run)
+
+    # Duplicates (ex: retransmissions of datagrams that weren't lost after all) go no further, gaps are asked to the
+    # upstream neighbour that relayed the packet
+    def __process_flow_packet(self, packet):
+        try:
+            if packet.nack:
+                self.__retransmit(packet)
+                return
+            skipped = self.__statistics.record(packet)
+            if skipped is None:
+                return
+            if 0 < skipped <= c.MAX_NACK_GAP:
+                self.__request_retransmission(packet, skipped)
+            self.__relay_flow(packet)
+        finally:
+            self.__flow_handler.release(packet)
 
     def __flow_processor(self):
         try:
             logging.debug("Engaged Flow Processor")
             while not self.__stop_event.is_set():
-                flow_header, chunk = self.__flow_handler.receive()
-                flow_key, destinations = flow_header
-                self.__forward_flow(flow_key, destinations, chunk)
+                self.__process_flow_packet(self.__flow_handler.receive())
         except ConnectionError:
             logging.debug("Flow processor death")
         except Exception:
@@ -331,7 +656,7 @@ class OTT:
             while not self.__stop_event.is_set():
                 try:
                     self.__node.await_active(flow_key)
-                    self.__forward_flow(flow_key, self.__node.destinations(flow_key), streamer.next_chunk())
+                    self.__forward_flow(flow_key, streamer.next_chunk())
                 except InvalidFlow:
                     return
         except InvalidExtension:
@@ -339,6 +664,40 @@ class OTT:
         except Exception:
             logging.exception(f"Exception in {flow_key}'s streamer")
 
+    # Periodically reports, to every upstream neighbour, the frames received (in total) of each flow the current
+    # machine still takes part in, the ones rebuilt from parity, its queueing delay and achieved frame rate, as well as
+    # the worst loss of its own downstream branches. Upstream neighbours thin congested branches and origins adapt the
+    # parity of their flows to the loss downstream.
+    def __flow_reporter(self, period=c.DEFAULT_FLOW_REPORT_PERIOD):
+        logging.debug("Flow reporter Launched")
+        frames, last = {}, time.monotonic()
+        try:
+            while not self.__stop_event.wait(period):
+                now = time.monotonic()
+                reports, current = {}, {}
+                for flow_key, hops in self.__receive_statistics().items():
+                    neighbours, local = self.__node.downstream(flow_key)
+                    if not (neighbours or local):
+                        continue
+                    for hop, stats in hops.items():
+                        current[(flow_key, hop)] = stats['frames']
+                        frame_rate = (stats['frames'] - frames.get((flow_key, hop), stats['frames'])) / (now - last)
+                        reports.setdefault(hop, {})[flow_key] = {
+                            'frames': stats['frames'], 'recovered': stats['recovered'],
+                            'loss': self.__loss(flow_key), 'delay': stats['delay'], 'frame_rate': frame_rate}
+                frames, last = current, now
+                self.__connections_lock.acquire_read()
+                try:
+                    for hop, report in reports.items():
+                        if hop in self.__connections:
+                            self.__send_control(hop, Tag.FLOW_REPORT, report)
+                finally:
+                    self.__connections_lock.release_read()
+            logging.debug("Flow reporter Death")
+        except Exception:
+            if not self.__stop_event.is_set():
+                logging.exception("Exception in flow reporter")
+
     def __connection_doctor(self, period=None, max_tries=None, scale_method=None):
         if not self.__doctor_enabled():
             return
@@ -393,13 +752,12 @@ class OTT:
         except Exception:
             logging.exception(f"Exception in connection doctor")
 
-    def __welcome_connection(self, neighbour_id, _):
-        pre_vector = self.__node.gen_distance_vector(neighbour_id)
-        if pre_vector and len(pre_vector) > 0:
-            self.__send_control(neighbour_id, Tag.DISTANCE_VECTOR, pre_vector)
+    # The neighbour's deltas start from the vector it's welcomed with
+    def __welcome_connection(self, neighbour_id, connection):
+        connection.post(partial(self.__distance_vector_frame, neighbour_id), key=Tag.DISTANCE_VECTOR)
         pred_dict = self.__node.flow_collection()
         if pred_dict and len(pred_dict) > 0:
-            self.__send_control(neighbour_id, Tag.FLOW_COLLECTION, pred_dict)
+            connection.post(Control_Frame(Tag.FLOW_COLLECTION, pred_dict))
 
     def __connection_worker(self, neighbour_id, connection):
         logging.debug(f"Connection worker started for {neighbour_id}")
@@ -456,17 +814,21 @@ class OTT:
         self.__flow_event = None
         e.set()
         self.__stop_event.set()
+        self.__routing_scheduler.stop()
         self.__control_server.terminate()
         self.__connections_lock.acquire_write()
         try:
             for conn in self.__connections:
                 self.__connections[conn].terminate()
             self.__connections.clear()
+            self.__connections_epoch += 1
         finally:
             self.__connections_lock.release_write()
         self.__signal_all_icu()
         self.__node.clean()
         self.__flow_handler.terminate()
+        if self.__data_plane:
+            self.__data_plane.terminate()
         self.__streamer_pool.shutdown(False, cancel_futures=True)
         self.__flow_handler_pool.shutdown(False, cancel_futures=True)
         self.__control_connection_pool.shutdown(False, cancel_futures=True)
@@ -490,17 +852,23 @@ class OTT:
         Disconnects the OverTheTop from a given neighbour
 
         :raises InvalidNeighbour: if the OverTheTop isn't connected to the given neighbour
-        :type neighbour_id: the neighbour's identification
+        :type neighbour_id: the neighbour's identification (as given by get_neighbours)
         """
+        try:
+            neighbour_id = parse_node_id(neighbour_id)
+        except InvalidIdentifier:
+            raise InvalidNeighbour(f"{neighbour_id} is invalid")
         logging.debug(f"Attempting to disconnect from {neighbour_id}")
         self.__connections_lock.acquire_write()
         try:
             connection = self.__connections.pop(neighbour_id)
+            self.__connections_epoch += 1
         except KeyError:
             raise InvalidNeighbour(f"{neighbour_id} is invalid")
         finally:
             self.__connections_lock.release_write()
         connection.terminate()
+        self.__close_output(connection.get_interface())
         self.__process_update(self.__node.rm_neighbour(neighbour_id), neighbour_id)
 
     def get_neighbours(self):
@@ -508,13 +876,13 @@ class OTT:
         self.__icu_lock.acquire()
         try:
             for neighbour in self.__icu:
-                inactive[neighbour] = self.__icu[neighbour][0].name
+                inactive[node_label(neighbour)] = self.__icu[neighbour][0].name
         finally:
             self.__icu_lock.release()
         self.__connections_lock.acquire_read()
         try:
             for neighbour in self.__connections:
-                active[neighbour] = self.__connections[neighbour].name
+                active[node_label(neighbour)] = self.__connections[neighbour].name
         finally:
             self.__connections_lock.release_read()
         return active, inactive
@@ -522,15 +890,74 @@ class OTT:
     def get_available_flows(self):
         return self.__node.get_flow_ids_n_status()
 
+    # Input buffer and output port statistics, output ports are identified by neighbour
+    def get_queue_stats(self):
+        stats = self.__flow_handler.queue_stats()
+        self.__connections_lock.acquire_read()
+        try:
+            neighbours = {connection.get_interface(): node_label(n) for n, connection in self.__connections.items()}
+        finally:
+            self.__connections_lock.release_read()
+        stats['output'] = {neighbours.get(address, address): port for address, port in stats['output'].items()}
+        return stats
+
+    def set_flow_weight(self, flow_key, weight):
+        self.__flow_handler.set_flow_weight(flow_key, weight)
+
+    def set_flow_parity(self, flow_key, group=None):
+        """
+        Protects a flow yielded by the OverTheTop with a parity datagram every group datagrams, a single lost datagram
+        per group is rebuilt at the flow's destinations without any retransmission
+
+        :param flow_key: the flow's key
+        :param group: datagrams per parity datagram, 0 disables parity and None adapts it to the loss reported by the
+                      downstream neighbours
+        """
+        if group is None:
+            self.__adaptive_parity.add(flow_key)
+            group = parity_group(self.__loss(flow_key))
+        else:
+            self.__adaptive_parity.discard(flow_key)
+        self.__flow_handler.set_flow_parity(flow_key, group)
+
+    def get_flow_parity(self, flow_key):
+        return self.__flow_handler.flow_parity(flow_key)
+
+    # Receive statistics (packets, loss, reordering, duplicates and jitter) of every flow, per upstream neighbour
+    # {flow_key: {neighbour: stats}}
+    def get_flow_statistics(self):
+        return {flow_key: {node_label(hop): stats for hop, stats in hops.items()}
+                for flow_key, hops in self.__receive_statistics().items()}
+
+    # Thinning of congested flows per downstream neighbour (of flows originated or relayed by this process)
+    # {flow_key: {neighbour: {'factor', 'loss', 'delay', 'frame_rate'}}}
+    def get_thinning(self):
+        self.__connections_lock.acquire_read()
+        try:
+            neighbours = {connection.get_interface(): node_label(n) for n, connection in self.__connections.items()}
+        finally:
+            self.__connections_lock.release_read()
+        thinning = {}
+        for (flow_key, address), stats in self.__thinning.stats().items():
+            thinning.setdefault(flow_key, {})[neighbours.get(address, address)] = stats
+        return thinning
+
+    # Flap damping of the neighbours whose links went down lately, {neighbour: (penalty, held down)}
+    def get_routing_damping(self):
+        return {node_label(neighbour): damping for neighbour, damping in self.__routing_scheduler.damping().items()}
+
     def new_player(self, flow_id, player):
         flow_key = self.__request_flow(flow_id)
         self.__flow_event.set()
         logging.info(f"Registered player for flow {flow_key}")
-        return self.__player_handler.register_player(flow_key, player)
+        player_id = self.__player_handler.register_player(flow_key, player)
+        self.__replay(flow_key)
+        return player_id
 
     def remove_player(self, player_id):
         flow_key, player = self.__player_handler.remove_player(player_id)
         gateway, request = self.__node.flow_cancel(flow_key)
+        self.__publish_forwarding_state()
         if gateway:
             self.__send_control(gateway, Tag.FLOW_CANCEL, request)
         self.__flow_event.set()
@@ -546,12 +973,26 @@ class OTT:
 
     def withdraw_flow(self, flow_key):
         flow_id = self.__node.flow_withdraw(flow_key)
+        self.__publish_forwarding_state()
+        self.__flow_handler.forget_flow(flow_key)
+        self.__statistics.forget(flow_key)
+        self.__thinning.forget(flow_key)
+        self.__fec.forget(flow_key)
+        self.__recent.forget(flow_key)
+        self.__adaptive_parity.discard(flow_key)
+        if self.__data_plane:
+            self.__data_plane.forget(flow_key)
         if flow_id:
             self.__send_withdraw(flow_key)
-        self.__player_handler.remove_player(self.__player_handler.get_player_id(flow_id))
+        # Players are registered by flow key, the node may have none for the flow (ex: its origin)
+        try:
+            self.__player_handler.remove_player(flow_key)
+        except KeyError:
+            pass
         logging.info(f"Flow {flow_key} has been withdrawn")
 
     def forget_neighbour(self, neighbour_id):
+        neighbour_id = parse_node_id(neighbour_id)
         self.__overlay_event.set()
         self.__icu_lock.acquire()
         try:
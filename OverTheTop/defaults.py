@@ -2,8 +2,8 @@ INTEGER_SIZE = 8
 DEFAULT_PORT = 8000
 DEFAULT_BACKLOG = 50
 DEFAULT_PACKET_SIZE = 20000
-DEFAULT_FRAME_BUFFER_SIZE = 512
-DEFAULT_FLOW_FORWARDER_COUNT = 1
+DEFAULT_FRAME_BUFFER_SIZE = 512  # Packets of a flow handler's input buffer (and of every flow queue of its ports)
+DEFAULT_FRAME_BUFFER_BYTES = None  # Optional byte budget of a flow handler's input buffer
 DEFAULT_FLOW_DISPATCHER_COUNT = 1
 DEFAULT_FLOW_PROCESSOR_COUNT = 1
 DEFAULT_DOCTOR_COUNT = 1
@@ -12,3 +12,45 @@ DEFAULT_MAX_CONNECTIONS = 25
 DEFAULT_FRAME_RATE_SEC = 30.0
 MAX_AUTHENTICATION_TRIES = 3
 MAX_RECONNECTION_TRIES = 3
+DEFAULT_BUFFER_POOL_SIZE = 256
+DEFAULT_IO_BATCH_SIZE = 32
+DEFAULT_FLOW_ENGINE = 'threaded'
+DEFAULT_DATA_PLANE_WORKERS = 0  # Data plane worker processes, 0 relays flows in the control plane process
+DEFAULT_DATA_PLANE_START_TIMEOUT = 10
+DEFAULT_MTU = 1472  # Largest flow datagram (Ethernet MTU without the IP/UDP headers)
+MIN_FRAGMENT_SIZE = 512
+DEFAULT_REASSEMBLY_BUDGET = 8 * 1024 * 1024  # Bytes held by incomplete frames
+DEFAULT_REASSEMBLY_TIMEOUT = 0.5  # Seconds
+DEFAULT_FLOW_QUEUE_BYTES = 1024 * 1024  # Bytes queued per flow before its oldest chunks are dropped
+DEFAULT_FLOW_WEIGHT = 1
+DEFAULT_SCHEDULER_QUANTUM = 1472  # Bytes a flow of weight 1 may send per round
+DEFAULT_FORWARDING_CACHE_SIZE = 1024  # Cached forwarding decisions (flows) per node
+DEFAULT_STATS_WINDOW = 1024  # Sequence numbers tracked per flow and hop, must be a power of 2
+DEFAULT_BUNDLE_WINDOW = None  # Seconds small datagrams wait to be coalesced per next hop, None disables bundling
+DEFAULT_BUNDLE_THRESHOLD = 512  # Largest datagram that is coalesced with others
+DEFAULT_FLOW_REPORT_PERIOD = 1.0  # Seconds between the reports a receiver sends upstream
+MAX_THINNING_FACTOR = 4  # A congested branch gets at least one frame out of this many
+THINNING_LOSS_HIGH = 0.05  # Frame loss (per report) that thins a branch further
+THINNING_LOSS_LOW = 0.01  # Frame loss below which a branch is calm
+THINNING_DELAY_HIGH = 150  # Queueing delay (ms) that thins a branch further
+THINNING_DELAY_LOW = 50  # Queueing delay (ms) below which a branch is calm
+THINNING_RECOVERY_REPORTS = 3  # Calm reports in a row before a branch gets more frames
+DEFAULT_FEC_WINDOW = 256  # Datagrams kept per flow to rebuild lost ones from parity datagrams
+FEC_GROUPS = ((0.10, 4), (0.05, 8), (0.01, 16))  # (Loss rate, data datagrams per parity), adaptive parity
+DEFAULT_RETRANSMISSION_BUDGET = 0  # Bytes of recently sent datagrams kept per neighbour, 0 disables NACKs
+MAX_NACK_GAP = 32  # Larger gaps (ex: outages) aren't worth a retransmission, thinned ones are never NACKed
+DEFAULT_RECENT_FRAMES = 40  # Latest frames kept per flow and replayed to new subscribers, as many as players buffer
+DEFAULT_RECENT_FRAMES_BUDGET = 512 * 1024  # Bytes of recent frames kept per flow, within a flow queue's budget
+DEFAULT_CONTROL_BUFFER_SIZE = 64 * 1024  # Receive buffer of a control connection, grows for bigger frames
+MAX_CONTROL_FRAME_SIZE = 64 * 1024 * 1024  # Bigger control frames are considered corrupted
+DEFAULT_CONTROL_CODEC = 1  # Highest control codec offered to neighbours, 0 (pickle) or 1 (compact), see Control_Codec
+DEFAULT_DISTANCE_VECTOR_RESYNC_PERIOD = 60  # Seconds between whole distance vectors, deltas are sent in between
+DEFAULT_ROUTING_UPDATE_WINDOW = 0.05  # Seconds routing changes are coalesced before being sent to the neighbours
+DEFAULT_ROUTING_UPDATE_INTERVAL = 0.2  # Least seconds between the routing updates sent to a neighbour
+FLAP_PENALTY = 1000  # Penalty of a neighbour whose link went down
+FLAP_SUPPRESS = 2500  # Penalty above which the routing changes caused by a neighbour are held down
+FLAP_REUSE = 750  # Penalty below which a held down neighbour is stable again
+FLAP_HALF_LIFE = 15  # Seconds for a penalty to decay by half
+MAX_HOLD_DOWN = 60  # Longest seconds a neighbour is held down
+FLAP_FORGET = 1  # Penalty below which the damping state of a neighbour is dropped (see Routing_Scheduler.forget)
+DEFAULT_CONTROL_QUEUE_SIZE = 1024  # Control frames pending per neighbour before its connection is deemed stalled
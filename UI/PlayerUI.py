@@ -124,6 +124,19 @@ class ClientGUI:
         finally:
             self.__lock.release()
 
+    # Recent frames go ahead of the buffered ones, even if playback hasn't started yet, live chunks they already hold
+    # are dropped. Frame numbers start over whenever the video loops, therefore chunks are matched by frame number
+    # rather than compared to the last recent frame
+    def preload(self, chunks):
+        if not chunks:
+            return
+        held = {chunk[0] for chunk in chunks}
+        self.__lock.acquire()
+        try:
+            self.frame_buffer[:] = list(chunks) + [chunk for chunk in self.frame_buffer if chunk[0] not in held]
+        finally:
+            self.__lock.release()
+
     @staticmethod
     def wait_curve(buffer_length, min_framerate=30, switch_point=60):
         if buffer_length < switch_point:
@@ -225,3 +238,6 @@ class Player(PlayerInterface):
 
     def insert_chunk(self, chunk):
         self.app.insert_chunk(chunk)
+
+    def preload(self, chunks):
+        self.app.preload(chunks)
@@ -65,6 +65,8 @@ class UI:
             return 'blue'
         elif state == Flow_State.STREAMING:
             return 'green'
+        elif state == Flow_State.RELAYING:
+            return 'dark green'
         else:
             return 'black'
 
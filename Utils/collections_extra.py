@@ -0,0 +1,85 @@
+class Ring_Buffer:
+    # A bounded FIFO queue over a preallocated list, push and pop are O(1).
+    # The queue is bounded by entry count (capacity) and, optionally, by the total size of its entries (max_bytes).
+    # It is not thread safe, concurrency control is left to the owner.
+
+    def __init__(self, capacity, max_bytes=None):
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+        self.__entries = [None] * capacity
+        self.__sizes = [0] * capacity
+        self.__capacity = capacity
+        self.__max_bytes = max_bytes
+        self.__head = 0
+        self.__count = 0
+        self.__bytes = 0
+        self.__high_water = 0
+
+    def __str__(self):
+        return f"<Ring_Buffer({self.__count}/{self.__capacity}, {self.__bytes} bytes, hwm: {self.__high_water})>"
+
+    def __len__(self):
+        return self.__count
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def bytes(self):
+        return self.__bytes
+
+    @property
+    def high_water(self):
+        return self.__high_water
+
+    def empty(self):
+        return self.__count == 0
+
+    # Checks whether an entry of the given size would overflow the queue
+    # A single entry bigger than the byte budget is still accepted by an empty queue
+    def full(self, size=0):
+        if self.__count >= self.__capacity:
+            return True
+        return self.__max_bytes is not None and self.__count > 0 and self.__bytes + size > self.__max_bytes
+
+    def push(self, entry, size=0):
+        if self.full(size):
+            raise OverflowError("Ring buffer is full")
+        tail = (self.__head + self.__count) % self.__capacity
+        self.__entries[tail] = entry
+        self.__sizes[tail] = size
+        self.__count += 1
+        self.__bytes += size
+        if self.__count > self.__high_water:
+            self.__high_water = self.__count
+
+    def pop(self):
+        if self.__count == 0:
+            raise IndexError("pop from an empty ring buffer")
+        entry = self.__entries[self.__head]
+        self.__entries[self.__head] = None
+        self.__bytes -= self.__sizes[self.__head]
+        self.__head = (self.__head + 1) % self.__capacity
+        self.__count -= 1
+        return entry
+
+    def pop_many(self, n):
+        return [self.pop() for _ in range(min(n, self.__count))]
+
+    def peek(self):
+        if self.__count == 0:
+            raise IndexError("peek from an empty ring buffer")
+        return self.__entries[self.__head]
+
+    def peek_size(self):
+        if self.__count == 0:
+            raise IndexError("peek from an empty ring buffer")
+        return self.__sizes[self.__head]
+
+    def reset_high_water(self):
+        self.__high_water = self.__count
+
+    def stats(self):
+        return {'length': self.__count, 'capacity': self.__capacity, 'bytes': self.__bytes,
+                'high_water': self.__high_water}
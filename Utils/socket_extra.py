@@ -0,0 +1,46 @@
+import ctypes
+import socket
+import struct
+
+# Linux only socket option (asm-generic/socket.h), selects the socket of a SO_REUSEPORT group with a classic BPF program
+SO_ATTACH_REUSEPORT_CBPF = 51
+
+# Classic BPF opcodes
+BPF_LD_W_ABS = 0x20
+BPF_ALU_MOD_K = 0x94
+BPF_RET_A = 0x16
+
+
+class Sock_Filter(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_ushort), ('jt', ctypes.c_ubyte), ('jf', ctypes.c_ubyte), ('k', ctypes.c_uint)]
+
+
+class Sock_Fprog(ctypes.Structure):
+    _fields_ = [('len', ctypes.c_ushort), ('filter', ctypes.POINTER(Sock_Filter))]
+
+
+def reuse_port(sock):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
+# Program that selects socket (word % n_sockets), word being the big endian 32 bit integer at the given offset of
+# the datagram payload
+def word_modulo_program(offset, n_sockets):
+    return [(BPF_LD_W_ABS, 0, 0, offset),
+            (BPF_ALU_MOD_K, 0, 0, n_sockets),
+            (BPF_RET_A, 0, 0, 0)]
+
+
+# Attaches a classic BPF program to the SO_REUSEPORT group of the socket
+# Returns False if the platform doesn't support reuseport programs, in which case the kernel keeps on balancing
+# datagrams by their address tuple
+def attach_reuseport_program(sock, program) -> bool:
+    instructions = (Sock_Filter * len(program))(*(Sock_Filter(*i) for i in program))
+    fprog = Sock_Fprog(len(program), instructions)
+    try:
+        # setsockopt copies the program, the ctypes structures only need to live through the call
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF,
+                        struct.pack('HL', fprog.len, ctypes.addressof(instructions)))
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,103 @@
+import socket
+import threading
+import time
+import unittest
+
+from OverTheTop.Network.Async_Flow_Management import Async_Flow_Handler
+from OverTheTop.Network.Bundling import is_bundle, unbundle
+from OverTheTop.Network.Flow_Management import Flow_Handler
+from OverTheTop.Network.Flow_Packet import Flow_Packet
+
+FLOW_KEY = (1, 2)
+HOP = 3
+TIMEOUT = 2  # Seconds a datagram is waited for
+
+
+# Waits for condition() to hold, the loop updates its counters after sending
+def eventually(condition, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def start(handler):
+    thread = threading.Thread(target=handler.run, daemon=True)
+    thread.start()
+    return thread
+
+
+class Async_Flow_Handler_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = Async_Flow_Handler(address=('127.0.0.1', 0), bundle_window=0.05)
+        self.thread = start(self.handler)
+        self.peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.peer.bind(('127.0.0.1', 0))
+        self.peer.settimeout(TIMEOUT)
+        self.routes = {self.peer.getsockname(): Flow_Packet.template(FLOW_KEY, HOP)}
+
+    def tearDown(self):
+        self.handler.terminate()
+        self.thread.join(TIMEOUT)
+        self.peer.close()
+
+    def output(self):
+        return self.handler.queue_stats()['output'][self.peer.getsockname()]
+
+    def test_received_packets_are_queued(self):
+        self.peer.sendto(Flow_Packet.pack(FLOW_KEY, HOP, (7, b'payload')), self.handler.interface)
+        packet = self.handler.receive()
+        self.assertEqual((packet.flow_key, packet.frame_num, bytes(packet.payload)), (FLOW_KEY, 7, b'payload'))
+        self.assertEqual(self.handler.queue_stats()['input']['bytes'], 0)
+
+    def test_processor(self):
+        processed = []
+        done = threading.Event()
+        self.handler.set_processor(lambda packet: (processed.append(packet.frame_num), done.set()))
+        self.peer.sendto(Flow_Packet.pack(FLOW_KEY, HOP, (7, b'payload')), self.handler.interface)
+        self.assertTrue(done.wait(TIMEOUT))
+        self.assertEqual(processed, [7])
+
+    # Small datagrams sent from other threads are bundled by the loop
+    def test_sent_datagrams_are_bundled(self):
+        for frame_num in range(3):
+            self.handler.send(FLOW_KEY, (frame_num, b'x' * 10), self.routes)
+        datagram = self.peer.recv(65536)
+        self.assertTrue(is_bundle(memoryview(datagram)))
+        packets = [Flow_Packet.unpack(view) for view in unbundle(memoryview(datagram))]
+        self.assertEqual([packet.frame_num for packet in packets], [0, 1, 2])
+        self.assertTrue(eventually(lambda: self.output()['bundles'] == 1))
+        self.assertEqual(self.output()['bundled'], 3)
+
+    def test_closed_outputs_are_not_sent_to(self):
+        self.handler.close_output(self.peer.getsockname())
+        self.handler.send(FLOW_KEY, (0, b'x'), self.routes)
+        self.peer.settimeout(0.2)
+        with self.assertRaises(socket.timeout):
+            self.peer.recv(65536)
+
+    def test_send_after_terminate(self):
+        self.handler.terminate()
+        self.thread.join(TIMEOUT)
+        self.handler.send(FLOW_KEY, (0, b'x'), self.routes)
+
+    # The statistics have the threaded engine's layout
+    def test_queue_stats_layout(self):
+        threaded = Flow_Handler(address=('127.0.0.1', 0))
+        try:
+            threaded.send(FLOW_KEY, (0, b'x'), self.routes)
+            self.handler.send(FLOW_KEY, (0, b'x'), self.routes)
+            self.peer.recv(65536)
+            self.assertTrue(eventually(lambda: self.handler.queue_stats()['output']))
+            expected, stats = threaded.queue_stats(), self.handler.queue_stats()
+            self.assertEqual(set(stats['input']), set(expected['input']))
+            [output] = stats['output'].values()
+            [expected_output] = expected['output'].values()
+            self.assertEqual(set(output), set(expected_output))
+        finally:
+            threaded.terminate()
+
+
+if __name__ == '__main__':
+    unittest.main()
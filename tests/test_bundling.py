@@ -0,0 +1,130 @@
+import unittest
+
+from OverTheTop.Network.Bundling import BUNDLE_ENTRY, BUNDLE_HEADER, Bundle, is_bundle, unbundle
+from OverTheTop.Network.Flow_Packet import Flow_Packet, InvalidPacket
+
+FLOW_KEY = (1, 2)
+OTHER_FLOW_KEY = (3, 4)
+HOP = 5
+
+
+def datagram_parts(flow_key, frame_num, payload):
+    return Flow_Packet.pack_header(flow_key, HOP, frame_num), payload
+
+
+def size(parts):
+    return sum(len(part) for part in parts)
+
+
+class Owner:
+
+    def __init__(self):
+        self.released = 0
+
+    def release(self):
+        self.released += 1
+
+
+class Bundle_Test(unittest.TestCase):
+
+    def test_round_trip(self):
+        bundle = Bundle()
+        payloads = [b'a' * 10, b'b' * 20, b'c' * 30]
+        for frame_num, payload in enumerate(payloads):
+            parts = datagram_parts(FLOW_KEY, frame_num, payload)
+            self.assertTrue(bundle.fits(parts, size(parts)))
+            bundle.add(parts, size(parts), 1)
+        datagram = b''.join(bundle.parts())
+        self.assertTrue(is_bundle(memoryview(datagram)))
+        self.assertEqual(len(datagram), bundle.size)
+        packets = [Flow_Packet.unpack(view) for view in unbundle(memoryview(datagram))]
+        self.assertEqual([packet.frame_num for packet in packets], [0, 1, 2])
+        self.assertEqual([bytes(packet.payload) for packet in packets], payloads)
+        self.assertTrue(all(packet.flow_key == FLOW_KEY for packet in packets))
+
+    def test_single_datagram_is_sent_plain(self):
+        bundle = Bundle()
+        parts = datagram_parts(FLOW_KEY, 7, b'x' * 10)
+        bundle.add(parts, size(parts), 1)
+        datagram = b''.join(bundle.parts())
+        self.assertFalse(is_bundle(memoryview(datagram)))
+        self.assertEqual(Flow_Packet.unpack(datagram).frame_num, 7)
+
+    def test_flows_share_bundles(self):
+        bundle = Bundle()
+        parts = datagram_parts(FLOW_KEY, 0, b'x' * 10)
+        bundle.add(parts, size(parts), 1)
+        other = datagram_parts(OTHER_FLOW_KEY, 0, b'y' * 10)
+        self.assertTrue(bundle.fits(other, size(other)))
+        bundle.add(other, size(other), 1)
+        packets = [Flow_Packet.unpack(view) for view in unbundle(memoryview(b''.join(bundle.parts())))]
+        self.assertEqual([packet.flow_key for packet in packets], [FLOW_KEY, OTHER_FLOW_KEY])
+
+    # Bundles bound to a sharded node
+    def test_other_flow_hash_does_not_fit_single_flow(self):
+        bundle = Bundle()
+        parts = datagram_parts(FLOW_KEY, 0, b'x' * 10)
+        bundle.add(parts, size(parts), 1)
+        other = datagram_parts(OTHER_FLOW_KEY, 0, b'y' * 10)
+        self.assertFalse(bundle.fits(other, size(other), single_flow=True))
+        same = datagram_parts(FLOW_KEY, 1, b'z' * 10)
+        self.assertTrue(bundle.fits(same, size(same), single_flow=True))
+
+    def test_bundle_carries_flow_hash(self):
+        bundle = Bundle()
+        for frame_num in range(2):
+            parts = datagram_parts(FLOW_KEY, frame_num, b'x')
+            bundle.add(parts, size(parts), 1)
+        _, _, flow_hash = BUNDLE_HEADER.unpack_from(b''.join(bundle.parts()))
+        self.assertEqual(flow_hash, Flow_Packet.flow_hash(FLOW_KEY))
+
+    def test_limit(self):
+        parts = datagram_parts(FLOW_KEY, 0, b'x' * 100)
+        bundle = Bundle(limit=BUNDLE_HEADER.size + 2 * (BUNDLE_ENTRY.size + size(parts)))
+        for _ in range(2):
+            self.assertTrue(bundle.fits(parts, size(parts)))
+            bundle.add(parts, size(parts), 1)
+        self.assertFalse(bundle.fits(parts, size(parts)))
+
+    def test_expired(self):
+        bundle = Bundle()
+        self.assertFalse(bundle.expired())
+        parts = datagram_parts(FLOW_KEY, 0, b'x')
+        bundle.add(parts, size(parts), 0)
+        self.assertTrue(bundle.expired())
+
+    def test_discard_releases_owners(self):
+        bundle = Bundle()
+        owners = [Owner(), Owner()]
+        for frame_num, owner in enumerate(owners):
+            parts = datagram_parts(FLOW_KEY, frame_num, b'x')
+            bundle.add(parts, size(parts), 1, owner)
+        bundle.discard()
+        self.assertEqual([owner.released for owner in owners], [1, 1])
+        self.assertEqual(len(bundle), 0)
+
+
+class Unbundle_Test(unittest.TestCase):
+
+    def test_truncated(self):
+        bundle = Bundle()
+        for frame_num in range(2):
+            parts = datagram_parts(FLOW_KEY, frame_num, b'x' * 10)
+            bundle.add(parts, size(parts), 1)
+        datagram = b''.join(bundle.parts())
+        with self.assertRaises(InvalidPacket):
+            unbundle(memoryview(datagram[:-1]))
+        with self.assertRaises(InvalidPacket):
+            unbundle(memoryview(datagram[:BUNDLE_HEADER.size + 1]))
+
+    def test_bundles_are_not_unpacked(self):
+        bundle = Bundle()
+        for frame_num in range(2):
+            parts = datagram_parts(FLOW_KEY, frame_num, b'x')
+            bundle.add(parts, size(parts), 1)
+        with self.assertRaises(InvalidPacket):
+            Flow_Packet.unpack(b''.join(bundle.parts()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import pickle
+import unittest
+
+from OverTheTop.Network.Control_Codec import COMPACT_CODEC, COUNT, FRAME_HEADER, PICKLE_CODEC, PICKLE_PROTO, \
+    InvalidControlFrame
+from OverTheTop.Network.Control_Management import COMPACT_LAYOUTS, Control_Frame, Tag, decode_control_frame, \
+    encode_control_frame
+
+REPORT = {(1, 2): {'frames': 100, 'recovered': 3, 'loss': 0.25, 'delay': 12.5, 'frame_rate': 30.0},
+          (3, 4): {'frames': 7, 'recovered': 0, 'loss': 0.0, 'delay': 0.0, 'frame_rate': 24.0}}
+
+# Tag => data of a frame, decoded as is
+FRAMES = {
+    Tag.AUTHENTICATION: (1 << 60, ('10.0.0.1', 5000), 'node', COMPACT_CODEC, True),
+    Tag.AUTHENTICATION_REQUIRED: None,
+    Tag.DISTANCE_VECTOR: {1: 0, 2: 3, 1 << 63: 255},
+    Tag.DISTANCE_VECTOR_DELTA: (7, {5: 1000}, [6, 8]),
+    Tag.DISTANCE_VECTOR_RESYNC: None,
+    Tag.FLOW_COLLECTION: {(1, 2): 'video', (3, 4): None, (5, 6): 'áudio'},
+    Tag.FLOW_ANNOUNCE: ((1, 2), 'video'),
+    Tag.FLOW_REQUEST: ((1, 2), 3),
+    Tag.FLOW_CANCEL: ((1, 2), 3),
+    Tag.FLOW_WITHDRAW: (1, 2),
+    Tag.FLOW_REPORT: REPORT,
+    Tag.PING_REQUEST: 'ping',
+    Tag.PING_RESPONSE: None,
+}
+
+
+def round_trip(tag, data, codec=COMPACT_CODEC):
+    return decode_control_frame(memoryview(encode_control_frame(Control_Frame(tag, data), codec))).tag_n_data()
+
+
+class Control_Codec_Test(unittest.TestCase):
+
+    def test_every_compact_layout_is_covered(self):
+        self.assertEqual(set(FRAMES), set(COMPACT_LAYOUTS))
+
+    def test_round_trips(self):
+        for tag, data in FRAMES.items():
+            with self.subTest(tag=tag):
+                self.assertEqual(round_trip(tag, data), (tag, data))
+                self.assertEqual(round_trip(tag, data, PICKLE_CODEC), (tag, data))
+
+    def test_compact_frames(self):
+        for tag, data in FRAMES.items():
+            with self.subTest(tag=tag):
+                frame = encode_control_frame(Control_Frame(tag, data), COMPACT_CODEC)
+                self.assertEqual(FRAME_HEADER.unpack_from(frame), (COMPACT_CODEC, tag.value))
+
+    def test_unsupported_ping_payload(self):
+        with self.assertRaises(InvalidControlFrame):
+            encode_control_frame(Control_Frame(Tag.PING_REQUEST, 1), COMPACT_CODEC)
+
+    def test_authentication_without_version(self):
+        data = (1, None, None)
+        self.assertEqual(round_trip(Tag.AUTHENTICATION, data), (Tag.AUTHENTICATION, data + (PICKLE_CODEC, False)))
+        data = (1, None, None, COMPACT_CODEC)
+        self.assertEqual(round_trip(Tag.AUTHENTICATION, data), (Tag.AUTHENTICATION, data + (False,)))
+
+    def test_distance_vector_costs(self):
+        for vector in ({}, {1: 70000}, {1: -1}, {1: 1.5, 2: 3}):
+            with self.subTest(vector=vector):
+                self.assertEqual(round_trip(Tag.DISTANCE_VECTOR, vector), (Tag.DISTANCE_VECTOR, vector))
+        with self.assertRaises(InvalidControlFrame):
+            encode_control_frame(Control_Frame(Tag.DISTANCE_VECTOR, {1: 'far'}), COMPACT_CODEC)
+
+    def test_invalid_flow_names(self):
+        with self.assertRaises(InvalidControlFrame):
+            encode_control_frame(Control_Frame(Tag.FLOW_COLLECTION, {(1, 2): 'a\0b'}), COMPACT_CODEC)
+
+
+class Malformed_Frame_Test(unittest.TestCase):
+
+    def compact(self, tag, data):
+        return encode_control_frame(Control_Frame(tag, data), COMPACT_CODEC)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(InvalidControlFrame):
+            decode_control_frame(FRAME_HEADER.pack(COMPACT_CODEC + 1, Tag.FLOW_WITHDRAW.value))
+
+    def test_empty(self):
+        with self.assertRaises(InvalidControlFrame):
+            decode_control_frame(b'')
+
+    def test_malformed_pickles(self):
+        frame = pickle.dumps(Control_Frame(Tag.FLOW_WITHDRAW, (1, 2)))
+        for bad in (bytes((PICKLE_PROTO,)), frame[:-1], frame[:2] + b'\xff' + frame[3:], bytes((PICKLE_PROTO, 99))):
+            with self.subTest(frame=bad[:12]):
+                with self.assertRaises(InvalidControlFrame):
+                    decode_control_frame(bad)
+
+    def test_pickles_rejected_once_compact(self):
+        frame = encode_control_frame(Control_Frame(Tag.FLOW_WITHDRAW, (1, 2)), PICKLE_CODEC)
+        self.assertEqual(decode_control_frame(frame, PICKLE_CODEC).tag_n_data(), (Tag.FLOW_WITHDRAW, (1, 2)))
+        with self.assertRaises(InvalidControlFrame):
+            decode_control_frame(frame, COMPACT_CODEC)
+
+    def test_unknown_tag(self):
+        with self.assertRaises(InvalidControlFrame):
+            decode_control_frame(FRAME_HEADER.pack(COMPACT_CODEC, 0xFFFF))
+
+    def test_trailing_bytes(self):
+        with self.assertRaises(InvalidControlFrame):
+            decode_control_frame(self.compact(Tag.FLOW_WITHDRAW, (1, 2)) + b'\0')
+        with self.assertRaises(InvalidControlFrame):
+            decode_control_frame(self.compact(Tag.AUTHENTICATION, FRAMES[Tag.AUTHENTICATION]) + b'\0')
+
+    # The codec version of an authentication may be left out and flow names run until the end of their collection,
+    # therefore neither can be told apart from a truncated frame
+    def test_truncated(self):
+        for tag, data in FRAMES.items():
+            frame = self.compact(tag, data)
+            if len(frame) == FRAME_HEADER.size or tag in (Tag.AUTHENTICATION, Tag.FLOW_COLLECTION):
+                continue
+            with self.subTest(tag=tag):
+                with self.assertRaises(InvalidControlFrame):
+                    decode_control_frame(frame[:-1])
+
+    # Counts are checked against the frame's size before any layout is built for them
+    def test_announced_counts(self):
+        header = FRAME_HEADER.pack(COMPACT_CODEC, Tag.DISTANCE_VECTOR.value)
+        for frame in (header + COUNT.pack(0xFFFFFFFF) + b'B' + bytes(16),
+                      FRAME_HEADER.pack(COMPACT_CODEC, Tag.FLOW_REPORT.value) + COUNT.pack(1 << 30),
+                      FRAME_HEADER.pack(COMPACT_CODEC, Tag.FLOW_COLLECTION.value) + COUNT.pack(1 << 28),
+                      FRAME_HEADER.pack(COMPACT_CODEC, Tag.DISTANCE_VECTOR_DELTA.value) + COUNT.pack(0) +
+                      COUNT.pack(0) + b'B' + COUNT.pack(1 << 29)):
+            with self.subTest(frame=frame[:12]):
+                with self.assertRaises(InvalidControlFrame):
+                    decode_control_frame(frame)
+
+    def test_unknown_cost_format(self):
+        with self.assertRaises(InvalidControlFrame):
+            decode_control_frame(FRAME_HEADER.pack(COMPACT_CODEC, Tag.DISTANCE_VECTOR.value) + COUNT.pack(0) + b'z')
+
+
+if __name__ == '__main__':
+    unittest.main()
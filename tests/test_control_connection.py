@@ -0,0 +1,91 @@
+import socket
+import unittest
+
+from OverTheTop import defaults as c
+from OverTheTop.Network.Control_Codec import COMPACT_CODEC, PICKLE_CODEC
+from OverTheTop.Network.Control_Management import Control_Connection, Control_Frame, Tag
+
+
+class Control_Connection_Test(unittest.TestCase):
+
+    def setUp(self):
+        left, right = socket.socketpair()
+        self.raw = left
+        self.sender = Control_Connection(left, address='sender', name='sender')
+        self.receiver = Control_Connection(right, address='receiver', name='receiver', buffer_size=64)
+
+    def tearDown(self):
+        self.sender.terminate()
+        self.receiver.terminate()
+
+    def assertFrame(self, frame, tag, data):
+        self.assertIsInstance(frame, Control_Frame)
+        self.assertEqual(frame.tag_n_data(), (tag, data))
+
+    def test_pickled_frames(self):
+        self.sender.send(Control_Frame(Tag.FLOW_WITHDRAW, (1, 2)))
+        self.assertFrame(self.receiver.receive(), Tag.FLOW_WITHDRAW, (1, 2))
+
+    def test_compact_frames(self):
+        self.sender.set_codec(COMPACT_CODEC)
+        self.sender.send(Control_Frame(Tag.FLOW_WITHDRAW, (1, 2)))
+        self.sender.send(Control_Frame(Tag.PING_REQUEST, 'ping'))
+        self.assertFrame(self.receiver.receive(), Tag.FLOW_WITHDRAW, (1, 2))
+        self.assertFrame(self.receiver.receive(), Tag.PING_REQUEST, 'ping')
+
+    def test_send_many(self):
+        self.sender.send_many([Control_Frame(Tag.FLOW_ANNOUNCE, ((n, n), f"flow {n}")) for n in range(10)])
+        for n in range(10):
+            self.assertFrame(self.receiver.receive(), Tag.FLOW_ANNOUNCE, ((n, n), f"flow {n}"))
+
+    def test_frames_bigger_than_buffer(self):
+        vector = {destination: destination % 7 for destination in range(500)}
+        self.sender.set_codec(COMPACT_CODEC)
+        self.sender.send_many([Control_Frame(Tag.DISTANCE_VECTOR, vector), Control_Frame(Tag.FLOW_WITHDRAW, (3, 4))])
+        self.assertFrame(self.receiver.receive(), Tag.DISTANCE_VECTOR, vector)
+        self.assertFrame(self.receiver.receive(), Tag.FLOW_WITHDRAW, (3, 4))
+
+    def test_split_writes(self):
+        self.sender.set_codec(COMPACT_CODEC)
+        self.sender.send(Control_Frame(Tag.FLOW_WITHDRAW, (5, 6)))
+        self.raw.sendall((100).to_bytes(c.INTEGER_SIZE, 'little')[:3])
+        self.assertFrame(self.receiver.receive(), Tag.FLOW_WITHDRAW, (5, 6))
+
+    def test_malformed_frames_are_discarded(self):
+        bad = bytes((COMPACT_CODEC + 100, 0, 0))
+        self.raw.sendall(len(bad).to_bytes(c.INTEGER_SIZE, 'little') + bad)
+        self.sender.send(Control_Frame(Tag.FLOW_WITHDRAW, (7, 8)))
+        self.assertFrame(self.receiver.receive(), Tag.FLOW_WITHDRAW, (7, 8))
+
+    # Once the peer's first compact frame comes in, pickled frames are discarded
+    def test_pickled_frames_after_compact_ones(self):
+        self.receiver.set_codec(COMPACT_CODEC)
+        self.sender.send(Control_Frame(Tag.FLOW_WITHDRAW, (1, 2)))
+        self.sender.set_codec(COMPACT_CODEC)
+        self.sender.send(Control_Frame(Tag.FLOW_WITHDRAW, (3, 4)))
+        self.sender.set_codec(PICKLE_CODEC)
+        self.sender.send(Control_Frame(Tag.FLOW_WITHDRAW, (5, 6)))
+        self.sender.set_codec(COMPACT_CODEC)
+        self.sender.send(Control_Frame(Tag.FLOW_WITHDRAW, (7, 8)))
+        for flow_key in ((1, 2), (3, 4), (7, 8)):
+            self.assertFrame(self.receiver.receive(), Tag.FLOW_WITHDRAW, flow_key)
+
+    def test_oversized_frames_fail(self):
+        self.raw.sendall((c.MAX_CONTROL_FRAME_SIZE + 1).to_bytes(c.INTEGER_SIZE, 'little'))
+        with self.assertRaises(ConnectionError):
+            self.receiver.receive()
+
+    def test_closed_by_peer(self):
+        self.raw.shutdown(socket.SHUT_WR)
+        with self.assertRaises(EOFError):
+            self.receiver.receive()
+
+    def test_posted_frames(self):
+        self.sender.post(Control_Frame(Tag.FLOW_REQUEST, ((1, 2), 3)))
+        self.sender.post(lambda: Control_Frame(Tag.FLOW_CANCEL, ((1, 2), 3)))
+        self.assertFrame(self.receiver.receive(), Tag.FLOW_REQUEST, ((1, 2), 3))
+        self.assertFrame(self.receiver.receive(), Tag.FLOW_CANCEL, ((1, 2), 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import multiprocessing
+import queue
+import socket
+import time
+import unittest
+
+from OverTheTop.Network.Data_Plane import Data_Plane, Forwarding_Snapshot
+from OverTheTop.Network.Flow_Packet import Flow_Packet
+from Utils import socket_extra
+
+NODE = 1
+NEIGHBOUR = 2
+UPSTREAM = 3
+FLOW_KEY = (10, UPSTREAM)
+ADDRESS = ('10.0.0.2', 5000)
+TIMEOUT = 10  # Seconds the data plane is waited for
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Every socket of a SO_REUSEPORT group, in bind order
+def reuseport_group(count):
+    sockets = []
+    for _ in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        socket_extra.reuse_port(sock)
+        sock.bind(('127.0.0.1', sockets[0].getsockname()[1] if sockets else 0))
+        sock.setblocking(False)
+        sockets.append(sock)
+    return sockets
+
+
+def drain(sock):
+    datagrams = []
+    while True:
+        try:
+            datagrams.append(sock.recv(65536))
+        except BlockingIOError:
+            return datagrams
+
+
+class Reuseport_Sharding_Test(unittest.TestCase):
+
+    # The workers' sockets come first in the group, the node's own handler joins it last and gets no flow
+    def test_flows_are_sharded_by_hash(self):
+        shards = 2
+        *workers, local = sockets = reuseport_group(shards + 1)
+        try:
+            program = socket_extra.word_modulo_program(Flow_Packet.FLOW_HASH_OFFSET, shards)
+            if not socket_extra.attach_reuseport_program(workers[0], program):
+                self.skipTest("Reuseport programs are not supported")
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+                for flow_id in range(16):
+                    sender.sendto(Flow_Packet.pack((flow_id, UPSTREAM), UPSTREAM, (0, b'x')), workers[0].getsockname())
+            time.sleep(0.1)
+            for shard, sock in enumerate(workers):
+                flow_keys = [Flow_Packet.unpack(datagram).flow_key for datagram in drain(sock)]
+                self.assertTrue(flow_keys)
+                self.assertTrue(all(Flow_Packet.flow_hash(flow_key) % shards == shard for flow_key in flow_keys))
+            self.assertEqual(drain(local), [])
+        finally:
+            for sock in sockets:
+                sock.close()
+
+
+class Forwarding_Snapshot_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = Forwarding_Snapshot(NODE, {FLOW_KEY: {NODE, NEIGHBOUR}}, {NEIGHBOUR: ADDRESS}, {ADDRESS})
+
+    def test_routes(self):
+        routes, local = self.snapshot.routes(FLOW_KEY)
+        self.assertEqual(set(routes), {ADDRESS})
+        self.assertTrue(local)
+        self.assertEqual(self.snapshot.routes((11, UPSTREAM)), ({}, False))
+
+    # Snapshots reach the workers pickled through their pipes
+    def test_pipe(self):
+        parent, child = multiprocessing.get_context('spawn').Pipe()
+        try:
+            self.snapshot.routes(FLOW_KEY)
+            parent.send(self.snapshot)
+            received = child.recv()
+        finally:
+            parent.close()
+            child.close()
+        self.assertEqual((received.node_id, received.hop_field), (NODE, Flow_Packet.hop_field(NODE)))
+        self.assertEqual(received.interfaces(), {ADDRESS})
+        self.assertEqual(received.sharded(), {ADDRESS})
+        self.assertEqual(received.flows(), {FLOW_KEY})
+        self.assertEqual(set(received.routes(FLOW_KEY)[0]), {ADDRESS})
+
+
+class Data_Plane_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.address = ('127.0.0.1', free_port())
+        self.delivered = queue.Queue()
+        self.data_plane = Data_Plane(self.address, 1, lambda flow_key, chunk: self.delivered.put((flow_key, chunk)))
+        self.data_plane.start(TIMEOUT)
+
+    def tearDown(self):
+        self.data_plane.terminate()
+
+    def test_delivery_and_statistics(self):
+        self.data_plane.publish(Forwarding_Snapshot(NODE, {FLOW_KEY: {NODE}}, {}))
+        sent = 0
+        deadline = time.monotonic() + TIMEOUT
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            # Frames are sent until one is delivered, the worker may not have applied the snapshot yet
+            while time.monotonic() < deadline:
+                sender.sendto(Flow_Packet.pack_header(FLOW_KEY, UPSTREAM, sent, (sent, 0, 1)) + b'chunk', self.address)
+                sent += 1
+                try:
+                    flow_key, (frame_num, payload) = self.delivered.get(timeout=0.1)
+                    break
+                except queue.Empty:
+                    pass
+            else:
+                self.fail("No chunk delivered")
+        self.assertEqual((flow_key, bytes(payload)), (FLOW_KEY, b'chunk'))
+        statistics = self.data_plane.statistics()
+        self.assertEqual(statistics[FLOW_KEY][UPSTREAM]['packets'], sent)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+
+from OverTheTop.Network.FEC import Parity_Decoder, Parity_Encoder, parity_group, xor_bytes
+from OverTheTop.Network.Flow_Packet import Flow_Packet
+from OverTheTop.Network.Fragmentation import Fragmenter, Reassembler
+
+FLOW_KEY = (1, 2)
+HOP = 3
+ADDRESS = ('10.0.0.1', 5000)
+
+
+# Datagrams of the given chunks as received by a gateway, [[Flow_Packet]] per chunk
+def flow_packets(chunks, group=2, mtu=1400):
+    fragmenter = Fragmenter(mtu=mtu, min_fragment_size=1)
+    fragmenter.set_parity(FLOW_KEY, group)
+    routes = {ADDRESS: Flow_Packet.template(FLOW_KEY, HOP)}
+    return [[Flow_Packet.unpack(header + bytes(payload))
+             for header, payload in fragmenter.datagrams(FLOW_KEY, chunk, routes)[ADDRESS]]
+            for chunk in chunks]
+
+
+class Parity_Test(unittest.TestCase):
+
+    def test_xor_bytes(self):
+        self.assertEqual(xor_bytes([b'\x01\x02', b'\x03']), b'\x02\x02')
+        self.assertEqual(xor_bytes([b'\x01\x02', b'\x01\x02']), b'\x00\x00')
+        self.assertEqual(xor_bytes([]), b'')
+
+    def test_parity_group(self):
+        self.assertEqual(parity_group(0.0), 0)
+        self.assertLess(parity_group(0.5), parity_group(0.02))
+        self.assertGreater(parity_group(0.5), 0)
+
+    def test_encoder_groups(self):
+        encoder = Parity_Encoder(3)
+        self.assertIsNone(encoder.add(10, 1, (10, 0, 1), b'a'))
+        self.assertIsNone(encoder.add(11, 2, (11, 0, 1), b'bb'))
+        first, count, parity = encoder.add(12, 3, (12, 0, 1), b'c')
+        self.assertEqual((first, count), (10, 3))
+        self.assertIsNone(encoder.add(13, 4, (13, 0, 1), b'd'))
+
+
+class Parity_Decoder_Test(unittest.TestCase):
+
+    def test_untracked_flows_go_through(self):
+        decoder = Parity_Decoder()
+        [[packet]] = flow_packets([(1, b'frame')], group=4)
+        self.assertEqual([(fragment, bytes(payload)) for fragment, (_, payload) in decoder.receive(packet)],
+                         [(packet.fragment, b'frame')])
+
+    def test_recovers_single_loss(self):
+        decoder = Parity_Decoder()
+        frames = [(1, b'a' * 10), (2, b'b' * 30), (3, b'c' * 20), (4, b'd' * 5)]
+        (first,), (second, parity), (lost,), (fourth, next_parity) = flow_packets(frames)
+        for packet in (first, second, parity, fourth):
+            decoder.receive(packet)
+        self.assertTrue(next_parity.parity)
+        [(fragment, (frame_num, payload))] = decoder.receive(next_parity)
+        self.assertEqual(fragment, lost.fragment)
+        self.assertEqual((frame_num, bytes(payload)), (3, b'c' * 20))
+        self.assertEqual(decoder.stats(), {FLOW_KEY: 1})
+        # The rebuilt datagram arriving late is a duplicate
+        self.assertEqual(decoder.receive(lost), [])
+
+    def test_recovers_fragment(self):
+        decoder = Parity_Decoder()
+        reassembler = Reassembler()
+        payload = bytes(range(200))
+        (first,), (second, parity), fragments, (fourth, next_parity) = \
+            flow_packets([(1, b'x'), (2, b'y'), (3, payload), (4, b'z')], mtu=150)
+        self.assertEqual([packet.fragment[1:] for packet in fragments if not packet.parity], [(0, 3), (1, 3), (2, 3)])
+        # The last fragment is lost, the parity of the first two follows it
+        lost = fragments.pop(2)
+        for packet in (first, second, parity, *fragments, fourth):
+            decoder.receive(packet)
+            if not packet.parity and packet.fragmented:
+                self.assertIsNone(reassembler.add(FLOW_KEY, packet.fragment, packet.chunk))
+        [(fragment, chunk)] = decoder.receive(next_parity)
+        self.assertEqual(fragment, lost.fragment)
+        self.assertEqual(reassembler.add(FLOW_KEY, fragment, chunk), (3, payload))
+
+    def test_two_losses_are_not_recovered(self):
+        decoder = Parity_Decoder()
+        (first,), (second, parity), (_,), (_, next_parity) = flow_packets([(n, b'z' * n) for n in range(1, 5)])
+        for packet in (first, second, parity):
+            decoder.receive(packet)
+        self.assertEqual(decoder.receive(next_parity), [])
+        self.assertEqual(decoder.stats(), {})
+
+    def test_forget(self):
+        decoder = Parity_Decoder()
+        (first,), (second, parity), (_,), (fourth, next_parity) = flow_packets([(n, b'z' * n) for n in range(1, 5)])
+        for packet in (first, second, parity, fourth):
+            decoder.receive(packet)
+        decoder.forget(FLOW_KEY)
+        self.assertEqual(decoder.receive(next_parity), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
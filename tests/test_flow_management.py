@@ -0,0 +1,151 @@
+import socket
+import threading
+import time
+import unittest
+
+from OverTheTop.Network.Bundling import is_bundle, unbundle
+from OverTheTop.Network.Flow_Management import Flow_Handler, Output_Port
+from OverTheTop.Network.Flow_Packet import Flow_Packet
+
+FLOW_KEY = (1, 2)
+OTHER_FLOW_KEY = (3, 2)
+HOP = 3
+TIMEOUT = 2  # Seconds a datagram is waited for
+
+
+# Waits for condition() to hold, forwarders update their counters and release owners after sending
+def eventually(condition, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def datagram(flow_key, frame_num):
+    return Flow_Packet.pack_header(flow_key, HOP, frame_num), b'x' * 10
+
+
+def flow_keys(data):
+    view = memoryview(data)
+    views = unbundle(view) if is_bundle(view) else [view]
+    return [Flow_Packet.unpack(view).flow_key for view in views]
+
+
+# Counts the releases of the entries it owns (see Packet_Buffer)
+class Owner:
+
+    def __init__(self):
+        self.references = 0
+        self.lock = threading.Lock()
+
+    def retain(self):
+        with self.lock:
+            self.references += 1
+        return self
+
+    def release(self):
+        with self.lock:
+            self.references -= 1
+
+
+class Peer_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.peer.bind(('127.0.0.1', 0))
+        self.peer.settimeout(TIMEOUT)
+        self.address = self.peer.getsockname()
+
+    def tearDown(self):
+        self.peer.close()
+
+    def assertNothingReceived(self):
+        self.peer.settimeout(0.2)
+        with self.assertRaises(socket.timeout):
+            self.peer.recv(65536)
+
+
+class Output_Port_Test(Peer_Test):
+
+    def port(self, **kwargs):
+        port = Output_Port(self.address, **kwargs)
+        self.addCleanup(port.close)
+        return port
+
+    def test_datagrams_are_sent_in_order(self):
+        port = self.port()
+        port.push(FLOW_KEY, (datagram(FLOW_KEY, 0), datagram(FLOW_KEY, 1)))
+        port.start()
+        self.assertEqual([Flow_Packet.unpack(self.peer.recv(65536)).frame_num for _ in range(2)], [0, 1])
+
+    # Entries queued before the forwarder starts are popped in a single batch
+    def test_flows_share_bundles(self):
+        port = self.port(bundle_window=0.05)
+        for flow_key in (FLOW_KEY, OTHER_FLOW_KEY):
+            port.push(flow_key, (datagram(flow_key, 0),), single=True)
+        port.start()
+        self.assertEqual(sorted(flow_keys(self.peer.recv(65536))), [FLOW_KEY, OTHER_FLOW_KEY])
+        self.assertTrue(eventually(lambda: port.stats()['bundled'] == 2))
+
+    def test_single_flow_bundles(self):
+        port = self.port(bundle_window=0.05, single_flow=True)
+        for flow_key in (FLOW_KEY, OTHER_FLOW_KEY):
+            port.push(flow_key, (datagram(flow_key, 0),), single=True)
+        port.start()
+        self.assertEqual(sorted(flow_keys(self.peer.recv(65536)) + flow_keys(self.peer.recv(65536))),
+                         [FLOW_KEY, OTHER_FLOW_KEY])
+        self.assertEqual(port.stats()['bundles'], 0)
+
+    def test_owners_are_released(self):
+        owner = Owner()
+        port = self.port()
+        port.push(FLOW_KEY, (datagram(FLOW_KEY, 0),), owner.retain())
+        port.push(OTHER_FLOW_KEY, (datagram(OTHER_FLOW_KEY, 0),), owner.retain())
+        port.forget(FLOW_KEY)
+        self.assertEqual(owner.references, 1)
+        port.close()
+        self.assertEqual(owner.references, 0)
+        self.assertFalse(port.alive)
+        # Entries pushed to a closed port are dropped
+        port.push(FLOW_KEY, (datagram(FLOW_KEY, 0),), owner.retain())
+        self.assertEqual(owner.references, 0)
+
+
+class Flow_Handler_Test(Peer_Test):
+
+    def setUp(self):
+        super().setUp()
+        self.handler = Flow_Handler(address=('127.0.0.1', 0))
+        self.routes = {self.address: Flow_Packet.template(FLOW_KEY, HOP)}
+
+    def tearDown(self):
+        self.handler.terminate()
+        super().tearDown()
+
+    def test_ports_are_opened_on_demand(self):
+        self.assertEqual(self.handler.queue_stats()['output'], {})
+        self.handler.send(FLOW_KEY, (7, b'payload'), self.routes)
+        packet = Flow_Packet.unpack(self.peer.recv(65536))
+        self.assertEqual((packet.flow_key, packet.frame_num, bytes(packet.payload)), (FLOW_KEY, 7, b'payload'))
+        self.assertEqual(set(self.handler.queue_stats()['output']), {self.address})
+
+    def test_closed_outputs_are_reopened(self):
+        self.handler.close_output(self.address)
+        self.handler.send(FLOW_KEY, (0, b'x'), self.routes)
+        self.assertNothingReceived()
+        self.assertEqual(self.handler.queue_stats()['output'], {})
+        self.handler.open_output(self.address)
+        self.handler.send(FLOW_KEY, (1, b'x'), self.routes)
+        self.assertEqual(Flow_Packet.unpack(self.peer.recv(65536)).frame_num, 1)
+
+    # The payload's owner is retained by the port until it's sent
+    def test_owner_is_released_once_sent(self):
+        owner = Owner().retain()
+        self.handler.send(FLOW_KEY, (0, b'x'), self.routes, owner)
+        self.peer.recv(65536)
+        owner.release()
+        self.assertTrue(eventually(lambda: owner.references == 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
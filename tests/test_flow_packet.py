@@ -0,0 +1,97 @@
+import unittest
+
+from OverTheTop.Network.Flow_Packet import FLAG_BUNDLE, FLAG_NACK, FLAG_PARITY, FLAG_THINNED, FLOW_PACKET_VERSION, \
+    SEQUENCE_MASK, Flow_Packet, InvalidPacket
+
+FLOW_KEY = (1, 1 << 63)
+HOP = 3
+PAYLOAD = b'payload'
+
+
+class Flow_Packet_Test(unittest.TestCase):
+
+    def test_round_trip(self):
+        packet = Flow_Packet.unpack(Flow_Packet.pack(FLOW_KEY, HOP, (7, PAYLOAD)))
+        self.assertEqual(packet.flow_key, FLOW_KEY)
+        self.assertEqual(packet.hop, HOP)
+        self.assertEqual(packet.chunk[0], 7)
+        self.assertEqual(bytes(packet.payload), PAYLOAD)
+        self.assertEqual(packet.payload_size, len(PAYLOAD))
+        self.assertEqual(packet.fragment, (0, 0, 1))
+        self.assertFalse(packet.fragmented)
+        self.assertTrue(packet.starts_frame)
+        self.assertEqual(packet.flags, 0)
+
+    def test_flow_hash_offset(self):
+        datagram = Flow_Packet.pack(FLOW_KEY, HOP, (7, PAYLOAD))
+        offset = Flow_Packet.FLOW_HASH_OFFSET
+        self.assertEqual(int.from_bytes(datagram[offset:offset + 4], 'big'), Flow_Packet.flow_hash(FLOW_KEY))
+        self.assertNotEqual(Flow_Packet.flow_hash(FLOW_KEY), Flow_Packet.flow_hash((2, 1 << 63)))
+
+    def test_fragments(self):
+        packet = Flow_Packet.unpack(Flow_Packet.pack_header(FLOW_KEY, HOP, 7, (10, 2, 4), stamp=99) + PAYLOAD)
+        self.assertEqual(packet.fragment, (10, 2, 4))
+        self.assertEqual(packet.sequence, 12)
+        self.assertEqual(packet.stamp, 99)
+        self.assertTrue(packet.fragmented)
+        self.assertFalse(packet.starts_frame)
+
+    def test_sequence_wraps_around(self):
+        packet = Flow_Packet.unpack(Flow_Packet.pack_header(FLOW_KEY, HOP, 7, (SEQUENCE_MASK, 1, 2)))
+        self.assertEqual(packet.sequence, 0)
+        self.assertEqual(packet.fragment, (SEQUENCE_MASK, 1, 2))
+
+    def test_flags(self):
+        for flag, attribute in ((FLAG_PARITY, 'parity'), (FLAG_NACK, 'nack'), (FLAG_THINNED, 'thinned')):
+            with self.subTest(attribute=attribute):
+                packet = Flow_Packet.unpack(Flow_Packet.pack_header(FLOW_KEY, HOP, 7, flags=flag))
+                self.assertTrue(getattr(packet, attribute))
+        self.assertFalse(Flow_Packet.unpack(Flow_Packet.pack_header(FLOW_KEY, HOP, 7, flags=FLAG_PARITY)).starts_frame)
+
+    # Template flags are only set on the first datagram of a frame
+    def test_flagged_template(self):
+        template = Flow_Packet.template(FLOW_KEY, HOP).flagged(FLAG_THINNED)
+        self.assertTrue(Flow_Packet.unpack(template.pack(7, (10, 0, 2))).thinned)
+        self.assertFalse(Flow_Packet.unpack(template.pack(7, (10, 1, 2))).thinned)
+
+    def test_payload_is_not_copied(self):
+        datagram = bytearray(Flow_Packet.pack(FLOW_KEY, HOP, (7, PAYLOAD)))
+        packet = Flow_Packet.unpack(datagram)
+        datagram[-1] = ord('!')
+        self.assertEqual(bytes(packet.payload), b'payloa!')
+
+    # Relayed datagrams get the new hop, the rest of the datagram is sent from the received buffer
+    def test_relay_parts(self):
+        datagram = bytearray(Flow_Packet.pack(FLOW_KEY, HOP, (7, PAYLOAD)))
+        packet = Flow_Packet.unpack(datagram)
+        parts = packet.relay_parts(Flow_Packet.hop_field(5))
+        relayed = Flow_Packet.unpack(b''.join(parts))
+        self.assertEqual((relayed.flow_key, relayed.hop, relayed.frame_num), (FLOW_KEY, 5, 7))
+        self.assertEqual(relayed.stamp, packet.stamp)
+        self.assertEqual(bytes(relayed.payload), PAYLOAD)
+        datagram[-1] = ord('!')
+        self.assertEqual(bytes(parts[-1])[-1:], b'!')
+
+    # Flags get a copy of the head, the received datagram is left untouched
+    def test_flagged_relay_parts(self):
+        datagram = Flow_Packet.pack(FLOW_KEY, HOP, (7, PAYLOAD))
+        packet = Flow_Packet.unpack(datagram)
+        parts = packet.relay_parts(Flow_Packet.hop_field(5), FLAG_THINNED)
+        self.assertTrue(Flow_Packet.unpack(b''.join(parts)).thinned)
+        self.assertFalse(packet.thinned)
+        self.assertEqual(Flow_Packet.unpack(datagram).flags, 0)
+
+    def test_invalid(self):
+        datagram = Flow_Packet.pack(FLOW_KEY, HOP, (7, PAYLOAD))
+        header = Flow_Packet.pack_header(FLOW_KEY, HOP, 7)
+        for bad in (header[:-1],
+                    bytes((FLOW_PACKET_VERSION + 1,)) + datagram[1:],
+                    Flow_Packet.pack_header(FLOW_KEY, HOP, 7, flags=FLAG_BUNDLE),
+                    Flow_Packet.pack_header(FLOW_KEY, HOP, 7, (10, 2, 2))):
+            with self.subTest(datagram=bad[:8]):
+                with self.assertRaises(InvalidPacket):
+                    Flow_Packet.unpack(bad)
+
+
+if __name__ == '__main__':
+    unittest.main()
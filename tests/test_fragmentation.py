@@ -0,0 +1,107 @@
+import time
+import unittest
+
+from OverTheTop.Network.Flow_Packet import Flow_Packet
+from OverTheTop.Network.Fragmentation import Fragmenter, Reassembler
+
+FLOW_KEY = (1, 2)
+HOP = 3
+ADDRESS = ('10.0.0.1', 5000)
+OTHER_ADDRESS = ('10.0.0.2', 5000)
+MTU = 200
+CHUNK = (7, bytes(range(256)) * 3)
+
+
+ROUTES = {ADDRESS: Flow_Packet.template(FLOW_KEY, HOP), OTHER_ADDRESS: Flow_Packet.template(FLOW_KEY, HOP)}
+
+
+# Flow_Packets of a chunk as received by the gateway at ADDRESS
+def fragments(fragmenter, chunk=CHUNK):
+    return [Flow_Packet.unpack(header + bytes(payload))
+            for header, payload in fragmenter.datagrams(FLOW_KEY, chunk, ROUTES)[ADDRESS]]
+
+
+def add(reassembler, packet):
+    return reassembler.add(packet.flow_key, packet.fragment, packet.chunk)
+
+
+class Fragmenter_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.fragmenter = Fragmenter(MTU, min_fragment_size=1)
+
+    def test_fragments_fit_the_mtu(self):
+        packets = fragments(self.fragmenter)
+        self.assertGreater(len(packets), 1)
+        self.assertTrue(all(packet.payload_size + len(Flow_Packet.pack_header(FLOW_KEY, HOP, 0)) <= MTU
+                            for packet in packets))
+        self.assertEqual(b''.join(bytes(packet.payload) for packet in packets), CHUNK[1])
+        self.assertEqual([packet.fragment for packet in packets],
+                         [(0, index, len(packets)) for index in range(len(packets))])
+
+    def test_sequences_follow_each_other(self):
+        first = fragments(self.fragmenter)
+        second = fragments(self.fragmenter, (8, b'small'))
+        self.assertEqual([packet.sequence for packet in first + second], list(range(len(first) + 1)))
+        self.assertEqual(second[0].fragment, (len(first), 0, 1))
+
+    def test_gateways_share_the_numbering(self):
+        datagrams = self.fragmenter.datagrams(FLOW_KEY, CHUNK, ROUTES)
+        self.assertEqual([header for header, _ in datagrams[ADDRESS]],
+                         [header for header, _ in datagrams[OTHER_ADDRESS]])
+
+    def test_forget_restarts_the_sequence(self):
+        fragments(self.fragmenter)
+        self.fragmenter.forget(FLOW_KEY)
+        self.assertEqual(fragments(self.fragmenter)[0].sequence, 0)
+
+
+class Reassembler_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.packets = fragments(Fragmenter(MTU, min_fragment_size=1))
+
+    def test_out_of_order(self):
+        reassembler = Reassembler()
+        *others, last = reversed(self.packets)
+        for packet in others:
+            self.assertIsNone(add(reassembler, packet))
+        self.assertEqual(add(reassembler, last), CHUNK)
+
+    def test_duplicates_are_ignored(self):
+        reassembler = Reassembler()
+        first, *others = self.packets
+        self.assertIsNone(add(reassembler, first))
+        self.assertIsNone(add(reassembler, first))
+        results = [add(reassembler, packet) for packet in others]
+        self.assertEqual(results[-1], CHUNK)
+        # A fragment of a rebuilt frame starts it over
+        self.assertIsNone(add(reassembler, first))
+
+    def test_single_fragment(self):
+        [packet] = fragments(Fragmenter(MTU), (8, b'small'))
+        self.assertEqual(add(Reassembler(), packet), (8, b'small'))
+
+    def test_timed_out_frames_are_discarded(self):
+        reassembler = Reassembler(timeout=0.01)
+        *others, last = self.packets
+        for packet in others:
+            add(reassembler, packet)
+        time.sleep(0.02)
+        self.assertIsNone(add(reassembler, last))
+        self.assertEqual(reassembler.discarded, 1)
+
+    def test_budget_discards_oldest(self):
+        reassembler = Reassembler(budget=len(CHUNK[1]))
+        later = fragments(Fragmenter(MTU, min_fragment_size=1), (8, CHUNK[1]))
+        later = [Flow_Packet.unpack(Flow_Packet.pack_header(FLOW_KEY, HOP, 8, (100, *packet.fragment[1:])) +
+                                    bytes(packet.payload)) for packet in later]
+        for packet in self.packets[:-1] + later[:-1]:
+            add(reassembler, packet)
+        self.assertEqual(reassembler.discarded, 1)
+        self.assertIsNone(add(reassembler, self.packets[-1]))
+        self.assertEqual(add(reassembler, later[-1]), (8, CHUNK[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
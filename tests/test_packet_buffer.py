@@ -0,0 +1,53 @@
+import unittest
+
+from OverTheTop.Network.Packet_Buffer import Buffer_Pool
+
+SIZE = 64
+
+
+class Buffer_Pool_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = Buffer_Pool(SIZE, capacity=2)
+
+    def free(self):
+        return len(self.pool._Buffer_Pool__free)
+
+    def test_released_buffers_are_reused(self):
+        buffer = self.pool.acquire()
+        self.assertEqual(len(buffer.data), SIZE)
+        self.assertEqual(self.free(), 1)
+        buffer.release()
+        self.assertEqual(self.free(), 2)
+        self.assertIs(self.pool.acquire(), buffer)
+
+    # The buffer only goes back to the pool once its last holder releases it
+    def test_retained_buffers_are_kept(self):
+        buffer = self.pool.acquire()
+        self.assertIs(buffer.retain(), buffer)
+        buffer.release()
+        self.assertEqual(self.free(), 1)
+        self.assertIsNot(self.pool.acquire(), buffer)
+        buffer.release()
+        self.assertIs(self.pool.acquire(), buffer)
+
+    def test_exhausted_pool_allocates(self):
+        buffers = [self.pool.acquire() for _ in range(3)]
+        self.assertEqual(len({id(buffer) for buffer in buffers}), 3)
+        for buffer in buffers:
+            buffer.release()
+        # The extra buffer is discarded rather than pooled
+        self.assertEqual(self.free(), 2)
+
+    def test_view_covers_the_filled_bytes(self):
+        buffer = self.pool.acquire()
+        buffer.data[:3] = b'abc'
+        buffer.fill(3)
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(bytes(buffer.view), b'abc')
+        buffer.release()
+        self.assertEqual(len(self.pool.acquire()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
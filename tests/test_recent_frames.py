@@ -0,0 +1,87 @@
+import unittest
+
+from OverTheTop.Network.Flow_Packet import FLAG_PARITY, Flow_Packet
+from OverTheTop.Network.Recent_Frames import Recent_Frames
+
+FLOW_KEY = (1, 2)
+HOP = 3
+
+
+# Parts of the datagrams of a frame split in count fragments, the first one at sequence frame_id
+def frame_parts(frame_num, frame_id, payload, count=1):
+    size = -(-len(payload) // count)
+    return [(Flow_Packet.pack_header(FLOW_KEY, HOP, frame_num, (frame_id, index, count)),
+             payload[index * size:(index + 1) * size]) for index in range(count)]
+
+
+class Recent_Frames_Test(unittest.TestCase):
+
+    def test_chunks(self):
+        recent = Recent_Frames(frames=4, budget=1 << 16)
+        for frame_num in range(3):
+            for parts in frame_parts(frame_num, frame_num, bytes([frame_num]) * 10):
+                recent.add(FLOW_KEY, parts)
+        self.assertEqual(recent.chunks(FLOW_KEY), [(n, bytes([n]) * 10) for n in range(3)])
+        self.assertEqual(len(recent.datagrams(FLOW_KEY)), 3)
+        self.assertEqual(recent.flows(), [FLOW_KEY])
+
+    def test_fragmented_frames(self):
+        recent = Recent_Frames(frames=4, budget=1 << 16)
+        payload = bytes(range(100))
+        for parts in frame_parts(7, 0, payload, 3):
+            recent.add(FLOW_KEY, parts)
+        self.assertEqual(len(recent.datagrams(FLOW_KEY)), 3)
+        self.assertEqual(recent.chunks(FLOW_KEY), [(7, payload)])
+
+    def test_frame_count_bound(self):
+        recent = Recent_Frames(frames=2, budget=1 << 16)
+        for frame_num in range(5):
+            for parts in frame_parts(frame_num, frame_num, b'x'):
+                recent.add(FLOW_KEY, parts)
+        self.assertEqual([frame_num for frame_num, _ in recent.chunks(FLOW_KEY)], [3, 4])
+
+    def test_budget_keeps_latest_frame(self):
+        recent = Recent_Frames(frames=10, budget=1)
+        for frame_num in range(3):
+            for parts in frame_parts(frame_num, frame_num, b'x' * 10):
+                recent.add(FLOW_KEY, parts)
+        self.assertEqual([frame_num for frame_num, _ in recent.chunks(FLOW_KEY)], [2])
+
+    def test_starts_at_first_fragment(self):
+        recent = Recent_Frames(frames=4, budget=1 << 16)
+        first, second = frame_parts(1, 0, b'ab' * 10, 2)
+        recent.add(FLOW_KEY, second)
+        self.assertEqual(recent.flows(), [])
+        recent.add(FLOW_KEY, first)
+        recent.add(FLOW_KEY, second)
+        self.assertEqual(recent.chunks(FLOW_KEY), [(1, b'ab' * 10)])
+
+    def test_incomplete_frames_are_skipped(self):
+        recent = Recent_Frames(frames=4, budget=1 << 16)
+        recent.add(FLOW_KEY, frame_parts(1, 0, b'x' * 10)[0])
+        recent.add(FLOW_KEY, frame_parts(2, 1, b'y' * 10, 2)[0])
+        self.assertEqual(recent.chunks(FLOW_KEY), [(1, b'x' * 10)])
+
+    def test_parity_is_not_kept(self):
+        recent = Recent_Frames(frames=4, budget=1 << 16)
+        recent.add(FLOW_KEY, (Flow_Packet.pack_header(FLOW_KEY, HOP, 0, (0, 0, 2), FLAG_PARITY), b'p'))
+        self.assertEqual(recent.datagrams(FLOW_KEY), [])
+
+    def test_copies_recycled_buffers(self):
+        recent = Recent_Frames(frames=4, budget=1 << 16)
+        header, _ = frame_parts(1, 0, b'')[0]
+        payload = bytearray(b'a' * 10)
+        recent.add(FLOW_KEY, (header, payload))
+        payload[:] = b'b' * 10
+        self.assertEqual(recent.chunks(FLOW_KEY), [(1, b'a' * 10)])
+
+    def test_forget(self):
+        recent = Recent_Frames(frames=4, budget=1 << 16)
+        recent.add(FLOW_KEY, frame_parts(1, 0, b'x')[0])
+        recent.forget(FLOW_KEY)
+        self.assertEqual(recent.flows(), [])
+        self.assertEqual(recent.chunks(FLOW_KEY), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
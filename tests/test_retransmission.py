@@ -0,0 +1,127 @@
+import socket
+import unittest
+
+from OverTheTop.Network.Flow_Management import Flow_Handler
+from OverTheTop.Network.Flow_Packet import FLAG_PARITY, SEQUENCE_MASK, Flow_Packet
+from OverTheTop.Network.Retransmission import Retransmission_Cache, nack_datagram
+
+FLOW_KEY = (1, 2)
+HOP = 3
+ADDRESS = ('10.0.0.1', 5000)
+OTHER_ADDRESS = ('10.0.0.2', 5000)
+TIMEOUT = 2  # Seconds a datagram is waited for
+
+
+def datagram_parts(sequence, payload=b'x' * 10, flags=0):
+    return Flow_Packet.pack_header(FLOW_KEY, HOP, sequence, (sequence, 0, 1), flags), payload
+
+
+class Nack_Datagram_Test(unittest.TestCase):
+
+    def test_fields(self):
+        packet = Flow_Packet.unpack(nack_datagram(FLOW_KEY, HOP, 10, 4))
+        self.assertTrue(packet.nack)
+        self.assertFalse(packet.parity)
+        self.assertEqual(packet.flow_key, FLOW_KEY)
+        self.assertEqual(packet.hop, HOP)
+        self.assertEqual(packet.fragment, (10, 0, 4))
+
+
+class Retransmission_Cache_Test(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        cache = Retransmission_Cache()
+        self.assertFalse(cache.enabled)
+        cache.add(FLOW_KEY, datagram_parts(0), [ADDRESS])
+        self.assertEqual(cache.get(FLOW_KEY, ADDRESS, 0, 1), [])
+
+    def test_get(self):
+        cache = Retransmission_Cache(budget=1 << 16)
+        for sequence in range(5):
+            cache.add(FLOW_KEY, datagram_parts(sequence), [ADDRESS, OTHER_ADDRESS])
+        datagrams = cache.get(FLOW_KEY, ADDRESS, 1, 3)
+        self.assertEqual([Flow_Packet.unpack(b''.join(parts)).sequence for parts in datagrams], [1, 2, 3])
+        self.assertEqual(len(cache.get(FLOW_KEY, OTHER_ADDRESS, 3, 10)), 2)
+        self.assertEqual(cache.get((9, 9), ADDRESS, 0, 5), [])
+        self.assertEqual(cache.get(FLOW_KEY, ('10.0.0.3', 5000), 0, 5), [])
+
+    def test_wraps_around(self):
+        cache = Retransmission_Cache(budget=1 << 16)
+        for sequence in (SEQUENCE_MASK, 0):
+            cache.add(FLOW_KEY, datagram_parts(sequence), [ADDRESS])
+        self.assertEqual(len(cache.get(FLOW_KEY, ADDRESS, SEQUENCE_MASK, 2)), 2)
+
+    def test_budget_evicts_oldest(self):
+        parts = datagram_parts(0)
+        length = sum(len(part) for part in parts)
+        cache = Retransmission_Cache(budget=3 * length)
+        for sequence in range(5):
+            cache.add(FLOW_KEY, datagram_parts(sequence), [ADDRESS])
+        datagrams = cache.get(FLOW_KEY, ADDRESS, 0, 5)
+        self.assertEqual([Flow_Packet.unpack(b''.join(parts)).sequence for parts in datagrams], [2, 3, 4])
+
+    def test_copies_recycled_buffers(self):
+        cache = Retransmission_Cache(budget=1 << 16)
+        header, _ = datagram_parts(0)
+        payload = bytearray(b'a' * 10)
+        cache.add(FLOW_KEY, (header, payload), [ADDRESS])
+        payload[:] = b'b' * 10
+        [parts] = cache.get(FLOW_KEY, ADDRESS, 0, 1)
+        self.assertEqual(bytes(Flow_Packet.unpack(b''.join(parts)).payload), b'a' * 10)
+
+    def test_parity_is_not_kept(self):
+        cache = Retransmission_Cache(budget=1 << 16)
+        cache.add(FLOW_KEY, datagram_parts(0, flags=FLAG_PARITY), [ADDRESS])
+        self.assertEqual(cache.get(FLOW_KEY, ADDRESS, 0, 1), [])
+
+    def test_forget(self):
+        cache = Retransmission_Cache(budget=1 << 16)
+        cache.add(FLOW_KEY, datagram_parts(0), [ADDRESS, OTHER_ADDRESS])
+        cache.forget(ADDRESS)
+        self.assertEqual(cache.get(FLOW_KEY, ADDRESS, 0, 1), [])
+        self.assertEqual(len(cache.get(FLOW_KEY, OTHER_ADDRESS, 0, 1)), 1)
+
+
+class Flow_Handler_Retransmission_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.peer.bind(('127.0.0.1', 0))
+        self.peer.settimeout(TIMEOUT)
+        self.routes = {self.peer.getsockname(): Flow_Packet.template(FLOW_KEY, HOP)}
+
+    def tearDown(self):
+        self.peer.close()
+
+    def handler(self, budget):
+        handler = Flow_Handler(address=('127.0.0.1', 0), retransmission_budget=budget)
+        self.addCleanup(handler.terminate)
+        for frame_num in range(3):
+            handler.send(FLOW_KEY, (frame_num, b'x' * 10), self.routes)
+            self.peer.recv(65536)
+        return handler
+
+    def test_retransmit(self):
+        handler = self.handler(1 << 16)
+        self.assertEqual(handler.retransmit(FLOW_KEY, self.peer.getsockname(), 1, 5), 2)
+        self.assertEqual([Flow_Packet.unpack(self.peer.recv(65536)).sequence for _ in range(2)], [1, 2])
+        handler.request_retransmission(FLOW_KEY, self.peer.getsockname(), HOP, 4, 2)
+        self.assertTrue(Flow_Packet.unpack(self.peer.recv(65536)).nack)
+
+    # The datagrams sent beyond the budget evict the oldest ones
+    def test_budget(self):
+        length = len(Flow_Packet.pack_header(FLOW_KEY, HOP, 0)) + 10
+        handler = self.handler(2 * length)
+        self.assertEqual(handler.retransmit(FLOW_KEY, self.peer.getsockname(), 0, 3), 2)
+
+    def test_disabled(self):
+        handler = self.handler(0)
+        self.assertEqual(handler.retransmit(FLOW_KEY, self.peer.getsockname(), 0, 3), 0)
+        handler.request_retransmission(FLOW_KEY, self.peer.getsockname(), HOP, 0, 3)
+        self.peer.settimeout(0.2)
+        with self.assertRaises(socket.timeout):
+            self.peer.recv(65536)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from Utils.collections_extra import Ring_Buffer
+
+
+class Ring_Buffer_Test(unittest.TestCase):
+
+    def test_fifo_wraps_around(self):
+        buffer = Ring_Buffer(3)
+        for entry in range(10):
+            buffer.push(entry)
+            self.assertEqual(buffer.peek(), entry)
+            self.assertEqual(buffer.pop(), entry)
+        buffer.push('a')
+        buffer.push('b')
+        self.assertEqual(buffer.pop_many(5), ['a', 'b'])
+        self.assertTrue(buffer.empty())
+
+    def test_capacity(self):
+        buffer = Ring_Buffer(2)
+        buffer.push(1)
+        buffer.push(2)
+        self.assertTrue(buffer.full())
+        with self.assertRaises(OverflowError):
+            buffer.push(3)
+        self.assertEqual(buffer.pop(), 1)
+        buffer.push(3)
+        self.assertEqual(buffer.pop_many(2), [2, 3])
+        with self.assertRaises(ValueError):
+            Ring_Buffer(0)
+
+    def test_byte_budget(self):
+        buffer = Ring_Buffer(10, max_bytes=100)
+        buffer.push('a', 60)
+        self.assertTrue(buffer.full(41))
+        self.assertFalse(buffer.full(40))
+        with self.assertRaises(OverflowError):
+            buffer.push('b', 41)
+        self.assertEqual(buffer.peek_size(), 60)
+        buffer.pop()
+        self.assertEqual(buffer.bytes, 0)
+        # A single entry over the budget still fits an empty buffer
+        buffer.push('c', 1000)
+        self.assertEqual(buffer.bytes, 1000)
+
+    def test_empty(self):
+        buffer = Ring_Buffer(1)
+        for method in (buffer.pop, buffer.peek, buffer.peek_size):
+            with self.assertRaises(IndexError):
+                method()
+
+    def test_stats(self):
+        buffer = Ring_Buffer(4)
+        for entry in range(3):
+            buffer.push(entry, 10)
+        buffer.pop()
+        self.assertEqual(buffer.stats(), {'length': 2, 'capacity': 4, 'bytes': 20, 'high_water': 3})
+        buffer.reset_high_water()
+        self.assertEqual(buffer.high_water, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
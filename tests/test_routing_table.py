@@ -0,0 +1,113 @@
+import unittest
+
+from OverTheTop.Network.Node.Routing_Data import DELTA_SEQUENCE_MASK, NoRoute, OutOfSequence, Routing_Table
+
+NEIGHBOUR = 1
+OTHER_NEIGHBOUR = 2
+PEER = 3  # Neighbour the table's vectors are advertised to
+NODE = 4  # The table's node, as seen by its peer
+
+
+class Routing_Table_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.table = Routing_Table()
+
+    def test_update(self):
+        new, _, _, _ = self.table.update(NEIGHBOUR, 1, {10: 2, 11: 5})
+        self.assertEqual(new, {NEIGHBOUR, 10, 11})
+        self.assertEqual(self.table.next_node(11), NEIGHBOUR)
+        self.assertEqual(self.table.next_node_cost(11), 6)
+        self.table.update(OTHER_NEIGHBOUR, 1, {11: 1})
+        self.assertEqual(self.table.next_node(11), OTHER_NEIGHBOUR)
+        with self.assertRaises(NoRoute):
+            self.table.next_node(12)
+
+
+class Distance_Vector_Delta_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.table = Routing_Table()
+        self.table.update(NEIGHBOUR, 1, {10: 2})
+
+    def test_applied_in_sequence(self):
+        new, _, _, _ = self.table.update_delta(NEIGHBOUR, 1, 1, {11: 3}, [])
+        self.assertEqual(new, {11})
+        self.assertEqual(self.table.next_node_cost(11), 4)
+        _, light, heavy, lost = self.table.update_delta(NEIGHBOUR, 1, 2, {11: 1}, [10])
+        self.assertEqual((light, heavy, lost), ({11}, set(), {10}))
+        self.assertEqual(self.table.get_all_nodes(), {NEIGHBOUR, 11})
+
+    def test_route_to_neighbour_stays(self):
+        self.table.update_delta(NEIGHBOUR, 1, 1, {}, [NEIGHBOUR])
+        self.assertEqual(self.table.next_node(NEIGHBOUR), NEIGHBOUR)
+
+    def test_out_of_sequence(self):
+        with self.assertRaises(OutOfSequence):
+            self.table.update_delta(NEIGHBOUR, 1, 2, {11: 3}, [])
+        # The following deltas are ignored until the whole vector is received again
+        self.assertEqual(self.table.update_delta(NEIGHBOUR, 1, 3, {12: 3}, []), (set(), set(), set(), set()))
+        self.assertEqual(self.table.get_all_nodes(), {NEIGHBOUR, 10})
+        self.table.update(NEIGHBOUR, 1, {10: 2, 11: 3, 12: 3})
+        new, _, _, _ = self.table.update_delta(NEIGHBOUR, 1, 1, {13: 1}, [])
+        self.assertEqual(new, {13})
+
+    def test_unregistered_neighbour(self):
+        self.assertEqual(self.table.update_delta(OTHER_NEIGHBOUR, 1, 1, {11: 3}, []), (set(), set(), set(), set()))
+        self.table.remove_node(NEIGHBOUR)
+        self.assertEqual(self.table.update_delta(NEIGHBOUR, 1, 1, {11: 3}, []), (set(), set(), set(), set()))
+
+    # Reaching the last sequence number through deltas would take 2^32 of them
+    def test_sequence_wraps_around(self):
+        self.table._Routing_Table__received[NEIGHBOUR] = DELTA_SEQUENCE_MASK
+        new, _, _, _ = self.table.update_delta(NEIGHBOUR, 1, 0, {11: 1}, [])
+        self.assertEqual(new, {11})
+
+
+class Distance_Vector_Advertisement_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.table = Routing_Table()
+        self.table.update(NEIGHBOUR, 1, {10: 2})
+        self.table.update(PEER, 1, {})
+
+    def test_no_delta_before_full_vector(self):
+        self.table.update(NEIGHBOUR, 1, {10: 2, 11: 2})
+        self.assertEqual(self.table.gen_distance_vector_deltas([PEER]), {})
+
+    def test_deltas(self):
+        self.assertEqual(self.table.gen_full_distance_vector(PEER), {NEIGHBOUR: 1, 10: 3})
+        self.assertEqual(self.table.gen_distance_vector_deltas([PEER]), {})
+        self.table.update(NEIGHBOUR, 1, {10: 2, 11: 4})
+        self.assertEqual(self.table.gen_distance_vector_deltas([PEER]), {PEER: (1, {11: 5}, [])})
+        self.table.update(NEIGHBOUR, 1, {11: 1})
+        self.assertEqual(self.table.gen_distance_vector_deltas([PEER]), {PEER: (2, {11: 2}, [10])})
+
+    def test_routes_through_peer_are_withdrawn(self):
+        self.table.gen_full_distance_vector(PEER)
+        self.table.update(PEER, 1, {10: 0})
+        self.assertEqual(self.table.gen_distance_vector_deltas([PEER]), {PEER: (1, {}, [10])})
+
+    # New routes through held down gateways are sent once they're no longer held down, lost ones right away
+    def test_held_routes_stay_pending(self):
+        self.table.gen_full_distance_vector(PEER)
+        self.table.update(OTHER_NEIGHBOUR, 1, {})
+        self.table.update(NEIGHBOUR, 1, {11: 4})
+        self.assertEqual(self.table.gen_distance_vector_deltas([PEER], {OTHER_NEIGHBOUR}), {PEER: (1, {11: 5}, [10])})
+        self.assertEqual(self.table.gen_distance_vector_deltas([PEER]), {PEER: (2, {OTHER_NEIGHBOUR: 1}, [])})
+
+    # A peer applying the deltas it's sent ends up with the table's vector
+    def test_deltas_rebuild_vector(self):
+        peer = Routing_Table()
+        peer.update(NODE, 0, self.table.gen_full_distance_vector(PEER))
+        for vector in ({10: 2, 11: 4}, {11: 1, 12: 7}, {12: 1}):
+            self.table.update(NEIGHBOUR, 1, vector)
+            for sequence, changed, withdrawn in self.table.gen_distance_vector_deltas([PEER]).values():
+                peer.update_delta(NODE, 0, sequence, changed, withdrawn)
+        vector = peer.gen_full_distance_vector(None)
+        del vector[NODE]
+        self.assertEqual(vector, self.table.gen_full_distance_vector(PEER))
+
+
+if __name__ == '__main__':
+    unittest.main()
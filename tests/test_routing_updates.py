@@ -0,0 +1,147 @@
+import threading
+import time
+import unittest
+
+from OverTheTop.Network.Routing_Updates import Routing_Scheduler
+
+WINDOW = 0.02
+MIN_INTERVAL = 0.5
+TIMEOUT = 2  # Seconds a flush is waited for
+
+
+# Runs a scheduler whose flushes are recorded, damped as given by DAMPING
+class Scheduler_Test(unittest.TestCase):
+    DAMPING = dict(half_life=10, max_hold_down=60)
+
+    def setUp(self):
+        self.flushes = []  # (time, neighbours, held)
+        self.flushed = threading.Condition()
+        self.scheduler = Routing_Scheduler(self.flush, window=WINDOW, min_interval=MIN_INTERVAL, penalty=1000,
+                                           suppress=1500, reuse=750, **self.DAMPING)
+        self.worker = threading.Thread(target=self.scheduler.run, daemon=True)
+        self.worker.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.worker.join(TIMEOUT)
+
+    def flush(self, neighbours, held):
+        with self.flushed:
+            self.flushes.append((time.monotonic(), set(neighbours), held))
+            self.flushed.notify_all()
+
+    # Returns the flushes once there are count of them (or the timeout expires)
+    def wait(self, count, timeout=TIMEOUT):
+        with self.flushed:
+            self.flushed.wait_for(lambda: len(self.flushes) >= count, timeout)
+            return list(self.flushes)
+
+
+class Routing_Scheduler_Test(Scheduler_Test):
+
+    def test_changes_are_coalesced(self):
+        start = time.monotonic()
+        self.scheduler.changed(['a'])
+        self.scheduler.changed(['a', 'b'])
+        [(flushed, neighbours, held)] = self.wait(1)
+        self.assertEqual((neighbours, held), ({'a', 'b'}, set()))
+        self.assertGreaterEqual(flushed - start, WINDOW)
+        self.assertEqual(len(self.wait(2, WINDOW * 5)), 1)
+
+    def test_rate_limited(self):
+        self.scheduler.changed(['a'])
+        self.wait(1)
+        self.scheduler.changed(['a'])
+        (first, _, _), (second, neighbours, _) = self.wait(2)
+        self.assertEqual(neighbours, {'a'})
+        self.assertGreaterEqual(second - first, MIN_INTERVAL * 0.9)
+
+    def test_worse_changes_are_not_rate_limited(self):
+        self.scheduler.changed(['a'])
+        self.wait(1)
+        self.scheduler.changed(['a'], worse=True)
+        (first, _, _), (second, _, _) = self.wait(2)
+        self.assertLess(second - first, MIN_INTERVAL)
+
+    def test_single_flap_is_not_held_down(self):
+        self.scheduler.flap('n')
+        penalty, held_down = self.scheduler.damping()['n']
+        self.assertAlmostEqual(penalty, 1000, delta=1)
+        self.assertFalse(held_down)
+        self.scheduler.changed(['a'], 'n')
+        self.assertEqual(len(self.wait(1)), 1)
+
+    def test_flapping_neighbour_is_held_down(self):
+        self.scheduler.flap('n')
+        self.scheduler.flap('n')
+        _, held_down = self.scheduler.damping()['n']
+        self.assertTrue(held_down)
+        self.scheduler.changed(['a'], 'n')
+        self.assertEqual(self.wait(1, MIN_INTERVAL), [])
+        # Changes of other neighbours go through, as do lost routes, the routes of n are left out
+        self.scheduler.changed(['a', 'b'], 'm')
+        [(_, neighbours, held)] = self.wait(1)
+        self.assertEqual((neighbours, held), ({'a', 'b'}, {'n'}))
+        self.scheduler.changed(['a'], 'n', worse=True)
+        _, (_, neighbours, held) = self.wait(2)
+        self.assertEqual((neighbours, held), ({'a'}, {'n'}))
+
+    def test_forget(self):
+        self.scheduler.changed(['a'])
+        self.scheduler.forget('a')
+        self.assertEqual(self.wait(1, WINDOW * 5), [])
+        self.scheduler.flap('n')
+        self.scheduler.forget('n')
+        self.assertIn('n', self.scheduler.damping())
+
+    def test_penalty_is_capped(self):
+        for _ in range(100):
+            self.scheduler.flap('n')
+        penalty, _ = self.scheduler.damping()['n']
+        self.assertLessEqual(penalty, 750 * 2 ** (60 / 10))
+
+    def test_stop(self):
+        self.scheduler.stop()
+        self.worker.join(TIMEOUT)
+        self.assertFalse(self.worker.is_alive())
+        self.scheduler.changed(['a'])
+        self.assertEqual(self.wait(1, WINDOW * 5), [])
+
+
+class Routing_Scheduler_Hold_Down_Test(Scheduler_Test):
+    DAMPING = dict(half_life=0.1, max_hold_down=1, forget=900)
+
+    # Held down changes come due on their own once the hold down is over
+    def test_held_down_changes_come_due(self):
+        start = time.monotonic()
+        self.scheduler.flap('n')
+        self.scheduler.flap('n')
+        self.scheduler.changed(['a'], 'n')
+        [(flushed, neighbours, held)] = self.wait(1)
+        self.assertEqual((neighbours, held), ({'a'}, set()))
+        self.assertGreaterEqual(flushed - start, 0.1)
+
+    # Damping that decayed away is dropped once a neighbour is forgotten
+    def test_forget_decayed_damping(self):
+        self.scheduler.flap('n')
+        time.sleep(0.05)
+        self.scheduler.forget('m')
+        self.assertEqual(self.scheduler.damping(), {})
+
+
+class Routing_Scheduler_Resync_Test(unittest.TestCase):
+
+    def test_resync(self):
+        resynced = threading.Event()
+        scheduler = Routing_Scheduler(lambda neighbours, held: None, resynced.set, resync_period=0.05)
+        worker = threading.Thread(target=scheduler.run, daemon=True)
+        worker.start()
+        try:
+            self.assertTrue(resynced.wait(TIMEOUT))
+        finally:
+            scheduler.stop()
+            worker.join(TIMEOUT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from OverTheTop.Network.Scheduling import Flow_Scheduler
+
+QUANTUM = 100
+FLOW_KEY = (1, 2)
+OTHER_FLOW_KEY = (3, 4)
+
+
+class Flow_Scheduler_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Flow_Scheduler(capacity=8, max_bytes=100000, quantum=QUANTUM)
+
+    # Pushes (flow_key, index) entries of the given size
+    def push(self, flow_key, count, size):
+        for index in range(count):
+            self.scheduler.push(flow_key, (flow_key, index), size)
+
+    def flows(self, count):
+        return [flow_key for flow_key, _ in self.scheduler.pop_many(count)]
+
+    def test_single_flow_is_fifo(self):
+        self.push(FLOW_KEY, 3, 500)
+        self.assertEqual(self.scheduler.pop_many(3), [(FLOW_KEY, 0), (FLOW_KEY, 1), (FLOW_KEY, 2)])
+        with self.assertRaises(IndexError):
+            self.scheduler.pop()
+
+    def test_quantum_is_shared(self):
+        self.push(FLOW_KEY, 4, QUANTUM)
+        self.push(OTHER_FLOW_KEY, 4, QUANTUM)
+        self.assertEqual(self.flows(8), [FLOW_KEY, OTHER_FLOW_KEY] * 4)
+
+    def test_weights(self):
+        self.scheduler.set_weight(FLOW_KEY, 2)
+        self.push(FLOW_KEY, 6, QUANTUM)
+        self.push(OTHER_FLOW_KEY, 3, QUANTUM)
+        self.assertEqual(self.flows(9), [FLOW_KEY, FLOW_KEY, OTHER_FLOW_KEY] * 3)
+        with self.assertRaises(ValueError):
+            self.scheduler.set_weight(FLOW_KEY, 0)
+
+    # Entries bigger than a quantum wait for their flow's deficit to cover them
+    def test_deficit_is_carried(self):
+        self.push(FLOW_KEY, 2, QUANTUM * 5 // 2)
+        self.push(OTHER_FLOW_KEY, 8, QUANTUM // 2)
+        self.assertEqual(self.flows(10), [OTHER_FLOW_KEY] * 4 + [FLOW_KEY] + [OTHER_FLOW_KEY] * 4 + [FLOW_KEY])
+
+    # Rounds in which nothing fits are skipped at once, without upsetting the order they'd have sent entries in
+    def test_rounds_are_skipped(self):
+        self.push(FLOW_KEY, 1, QUANTUM * 1000)
+        self.push(OTHER_FLOW_KEY, 1, QUANTUM * 500)
+        self.assertEqual(self.flows(2), [OTHER_FLOW_KEY, FLOW_KEY])
+
+    def test_overflow_drops_oldest(self):
+        self.push(FLOW_KEY, 8, 10)
+        self.assertEqual(self.scheduler.push(FLOW_KEY, 'last', 10), [(FLOW_KEY, 0)])
+        self.assertEqual(self.scheduler.push(OTHER_FLOW_KEY, 'other', 10), [])
+        stats = self.scheduler.stats()
+        self.assertEqual((stats['length'], stats['dropped']), (9, 1))
+        self.assertEqual(stats['flows'][FLOW_KEY]['dropped'], 1)
+
+    def test_forget(self):
+        self.scheduler.set_weight(FLOW_KEY, 3)
+        self.push(FLOW_KEY, 3, 10)
+        self.push(OTHER_FLOW_KEY, 2, 10)
+        self.assertEqual(self.scheduler.forget(FLOW_KEY), [(FLOW_KEY, 0), (FLOW_KEY, 1), (FLOW_KEY, 2)])
+        self.assertEqual(len(self.scheduler), 2)
+        self.assertEqual(self.scheduler.pop_many(3), [(OTHER_FLOW_KEY, 0), (OTHER_FLOW_KEY, 1)])
+        self.assertEqual(self.scheduler.forget(FLOW_KEY), [])
+        # Its weight is forgotten too
+        self.push(FLOW_KEY, 1, 10)
+        self.assertEqual(self.scheduler.stats()['flows'][FLOW_KEY]['weight'], 1)
+
+    def test_idle_flows_are_dropped(self):
+        self.scheduler.set_weight(FLOW_KEY, 2)
+        self.push(FLOW_KEY, 2, 10)
+        self.push(OTHER_FLOW_KEY, 1, 10)
+        self.scheduler.pop_many(3)
+        self.assertTrue(self.scheduler.empty())
+        self.assertEqual(self.scheduler.stats()['flows'], {})
+        # The weight of a flow outlives its queue
+        self.push(FLOW_KEY, 1, 10)
+        self.assertEqual(self.scheduler.stats()['flows'][FLOW_KEY]['weight'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+from OverTheTop.Network.Flow_Packet import SEQUENCE_MASK
+from OverTheTop.Network.Statistics import Receive_Stats, wrapping_delta
+
+
+class Wrapping_Delta_Test(unittest.TestCase):
+
+    def test_signed_across_wrap(self):
+        self.assertEqual(wrapping_delta(0, SEQUENCE_MASK), 1)
+        self.assertEqual(wrapping_delta(SEQUENCE_MASK, 0), -1)
+        self.assertEqual(wrapping_delta(10, 3), 7)
+
+
+class Receive_Stats_Test(unittest.TestCase):
+
+    def record(self, stats, sequence, **kwargs):
+        return stats.record(sequence, 100, 0, 0, **kwargs)
+
+    def test_in_order(self):
+        stats = Receive_Stats(window=64)
+        for sequence in range(10):
+            self.assertEqual(self.record(stats, sequence), 0)
+        figures = stats.stats()
+        self.assertEqual(figures['expected'], 10)
+        self.assertEqual(figures['lost'], 0)
+        self.assertEqual(figures['frames'], 10)
+        self.assertEqual(figures['bytes'], 1000)
+
+    def test_gap_is_lost(self):
+        stats = Receive_Stats(window=64)
+        self.record(stats, 0)
+        self.assertEqual(self.record(stats, 3), 2)
+        figures = stats.stats()
+        self.assertEqual(figures['expected'], 4)
+        self.assertEqual(figures['lost'], 2)
+        self.assertAlmostEqual(figures['loss_rate'], 0.5)
+
+    def test_reordered_fills_gap(self):
+        stats = Receive_Stats(window=64)
+        self.record(stats, 0)
+        self.record(stats, 2)
+        self.assertEqual(self.record(stats, 1), 0)
+        figures = stats.stats()
+        self.assertEqual(figures['reordered'], 1)
+        self.assertEqual(figures['lost'], 0)
+
+    def test_duplicate_and_late(self):
+        stats = Receive_Stats(window=8)
+        self.record(stats, 0)
+        self.assertIsNone(self.record(stats, 0))
+        self.record(stats, 20)
+        self.assertIsNone(self.record(stats, 1))
+        figures = stats.stats()
+        self.assertEqual(figures['duplicates'], 1)
+        self.assertEqual(figures['late'], 1)
+
+    def test_thinned_gap_is_not_lost(self):
+        stats = Receive_Stats(window=64)
+        self.record(stats, 0)
+        self.assertEqual(self.record(stats, 4, thinned=True), 0)
+        figures = stats.stats()
+        self.assertEqual(figures['thinned'], 3)
+        self.assertEqual(figures['expected'], 2)
+        self.assertEqual(figures['lost'], 0)
+
+    def test_wraps_around(self):
+        stats = Receive_Stats(window=64)
+        self.record(stats, SEQUENCE_MASK - 1)
+        self.record(stats, SEQUENCE_MASK)
+        self.assertEqual(self.record(stats, 0), 0)
+        self.assertEqual(stats.stats()['expected'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
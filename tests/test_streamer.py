@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+from OverTheTop.Content.Streamer import InvalidExtension, MPEG_Streamer, Streamer
+
+FRAMES = (b'first', b'second frame')
+FRAME_RATE = 1000  # Frames per second, keeps the streamer's pacing short
+
+
+class MPEG_Streamer_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def video(self, frames=FRAMES, name='video.Mjpeg'):
+        filename = os.path.join(self.directory.name, name)
+        with open(filename, 'wb') as file:
+            for frame in frames:
+                file.write(b'%05d' % len(frame) + frame)
+        return filename
+
+    def test_frames_are_views_of_the_mapping(self):
+        streamer = MPEG_Streamer(self.video(), FRAME_RATE)
+        for frame_num, frame in enumerate(FRAMES, 1):
+            chunk_num, payload = streamer.next_chunk()
+            self.assertIsInstance(payload, memoryview)
+            self.assertEqual((chunk_num, bytes(payload)), (frame_num, frame))
+        self.assertEqual(streamer.frame_nbr(), len(FRAMES))
+
+    # The video loops, frame numbers start over
+    def test_loops(self):
+        streamer = MPEG_Streamer(self.video(), FRAME_RATE)
+        for _ in FRAMES:
+            streamer.next_chunk()
+        frame_num, payload = streamer.next_chunk()
+        self.assertEqual((frame_num, bytes(payload)), (1, FRAMES[0]))
+
+    def test_unmappable_files(self):
+        for filename in (self.video(()), os.path.join(self.directory.name, 'missing.Mjpeg')):
+            with self.subTest(filename=filename):
+                with self.assertRaises(IOError) as context:
+                    MPEG_Streamer(filename, FRAME_RATE)
+                self.assertIn(filename, str(context.exception))
+                self.assertIsNotNone(context.exception.__cause__)
+
+    def test_get_streamer(self):
+        self.assertIsInstance(Streamer.get_streamer(self.video(), FRAME_RATE), MPEG_Streamer)
+        for source in ('video', 'video.avi'):
+            with self.subTest(source=source):
+                with self.assertRaises(InvalidExtension):
+                    Streamer.get_streamer(source)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+from OverTheTop.Network.Thinning import Branch_Thinning
+
+FLOW_KEY = (1, 2)
+THINNED = ('10.0.0.1', 5000)
+CLEAR = ('10.0.0.2', 5000)
+
+
+def figures(frames, recovered=0, loss=0.0, delay=0.0):
+    return {'frames': frames, 'recovered': recovered, 'loss': loss, 'delay': delay, 'frame_rate': 30.0}
+
+
+class Branch_Thinning_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.thinning = Branch_Thinning(max_factor=4, loss_marks=(0.01, 0.05), delay_marks=(50, 150), recovery=2)
+
+    # Forwards frames to every address and has THINNED report that it got received of them
+    def congest(self, frames=10, received=5, recovered=0):
+        self.thinning.report(THINNED, {FLOW_KEY: figures(0)})
+        self.thinning.report(CLEAR, {FLOW_KEY: figures(0)})
+        for frame_num in range(frames):
+            self.thinning.select(FLOW_KEY, frame_num, [THINNED, CLEAR])
+        self.thinning.report(THINNED, {FLOW_KEY: figures(received, recovered)})
+        self.thinning.report(CLEAR, {FLOW_KEY: figures(frames)})
+
+    def test_no_reports(self):
+        addresses = [THINNED, CLEAR]
+        self.assertEqual(self.thinning.select(FLOW_KEY, 1, addresses), (addresses, ()))
+        self.assertEqual(self.thinning.thinned(FLOW_KEY, addresses), [])
+        self.assertEqual(self.thinning.loss(FLOW_KEY), 0.0)
+        self.assertIsNone(self.thinning.loss(FLOW_KEY, None))
+
+    def test_loss_thins_branch(self):
+        self.congest()
+        self.assertEqual(self.thinning.thinned(FLOW_KEY, [THINNED, CLEAR]), [THINNED])
+        self.assertAlmostEqual(self.thinning.loss(FLOW_KEY), 0.5)
+        self.assertEqual(self.thinning.select(FLOW_KEY, 1, [THINNED, CLEAR]), ([CLEAR], []))
+
+    def test_recovered_frames_are_not_congestion(self):
+        self.congest(received=5, recovered=5)
+        self.assertEqual(self.thinning.thinned(FLOW_KEY, [THINNED, CLEAR]), [])
+        self.assertAlmostEqual(self.thinning.loss(FLOW_KEY), 0.5)
+
+    def test_first_frame_after_thinned_ones_is_flagged(self):
+        self.congest()
+        self.thinning.select(FLOW_KEY, 11, [THINNED, CLEAR])
+        self.assertEqual(self.thinning.select(FLOW_KEY, 12, [THINNED, CLEAR]), ([THINNED, CLEAR], [THINNED]))
+        self.assertEqual(self.thinning.select(FLOW_KEY, 12, [THINNED, CLEAR], first=False), ([THINNED, CLEAR], []))
+        self.assertEqual(self.thinning.select(FLOW_KEY, 14, [THINNED, CLEAR]), ([THINNED, CLEAR], []))
+
+    def test_thinned_branch_gets_no_parity(self):
+        self.congest()
+        self.assertEqual(self.thinning.select(FLOW_KEY, 0, [THINNED, CLEAR], False, True), ([CLEAR], []))
+
+    def test_calm_reports_restore_branch(self):
+        self.congest()
+        frames = 5
+        for frame_num in range(12, 20):
+            selected, _ = self.thinning.select(FLOW_KEY, frame_num, [THINNED])
+            if selected:
+                frames += 1
+                self.thinning.report(THINNED, {FLOW_KEY: figures(frames)})
+        self.assertEqual(self.thinning.thinned(FLOW_KEY, [THINNED]), [])
+
+    def test_factor_is_bounded(self):
+        self.thinning.report(THINNED, {FLOW_KEY: figures(0)})
+        for frame_num in range(0, 400, 4):
+            self.thinning.select(FLOW_KEY, frame_num, [THINNED])
+            self.thinning.report(THINNED, {FLOW_KEY: figures(0)})
+        self.assertEqual(self.thinning.select(FLOW_KEY, 4, [THINNED]), ([THINNED], []))
+        self.assertEqual(self.thinning.select(FLOW_KEY, 2, [THINNED]), ([], []))
+
+    def test_forget(self):
+        self.congest()
+        self.thinning.forget(FLOW_KEY)
+        self.assertEqual(self.thinning.thinned(FLOW_KEY, [THINNED]), [])
+        self.congest()
+        self.thinning.forget_address(THINNED)
+        self.assertEqual(self.thinning.thinned(FLOW_KEY, [THINNED]), [])
+        self.assertEqual(self.thinning.loss(FLOW_KEY), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()